@@ -0,0 +1,267 @@
+import asyncio
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class AsyncModelDevice(object):
+    '''AsyncModelDevice
+
+    An asyncio facade of a ModelDevice instance. Netconf operations of ncclient
+    are blocking, so each call runs in a worker thread of an executor, while
+    the coroutine waits without holding the event loop. When a semaphore is
+    given, it bounds the number of calls in flight, which is how AsyncFleet
+    shares one limit among many devices.
+
+    Attributes
+    ----------
+    device : `ModelDevice`
+        The ModelDevice instance.
+
+    executor : `Executor`
+        An executor running blocking calls, or None for the default executor
+        of the event loop.
+
+    semaphore : `asyncio.Semaphore`
+        A semaphore bounding concurrent calls, a callable returning one when a
+        call starts, or None.
+    '''
+
+    def __init__(self, device, executor=None, semaphore=None):
+        '''
+        __init__ instantiates an AsyncModelDevice instance.
+        '''
+
+        self.device = device
+        self.executor = executor
+        self.semaphore = semaphore
+
+    def __repr__(self):
+        return '<{}.{} {} at {}>'.format(self.__class__.__module__,
+                                         self.__class__.__name__,
+                                         self.device,
+                                         hex(id(self)))
+
+    async def run(self, func, *args, **kwargs):
+        '''run
+
+        High-level api: Run a blocking callable in the executor.
+
+        Parameters
+        ----------
+
+        func : `callable`
+            A blocking callable, e.g., a method of the ModelDevice instance.
+
+        args : `tuple`
+            Positional arguments of func.
+
+        kwargs : `dict`
+            Keyword arguments of func.
+
+        Returns
+        -------
+
+        object
+            The return of func.
+        '''
+
+        loop = asyncio.get_running_loop()
+        call = partial(func, *args, **kwargs)
+        semaphore = self.semaphore
+        if callable(semaphore):
+            semaphore = semaphore()
+        if semaphore is None:
+            return await loop.run_in_executor(self.executor, call)
+        async with semaphore:
+            return await loop.run_in_executor(self.executor, call)
+
+    async def execute(self, operation, *args, **kwargs):
+        '''execute
+
+        High-level api: Coroutine of ModelDevice.execute().
+
+        Returns
+        -------
+
+        RPCReply
+            An instance of RPCReply in ncclient package.
+        '''
+
+        return await self.run(self.device.execute, operation, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await self.execute('get', *args, **kwargs)
+
+    async def get_config(self, *args, **kwargs):
+        return await self.execute('get_config', *args, **kwargs)
+
+    async def get_schema(self, *args, **kwargs):
+        return await self.execute('get_schema', *args, **kwargs)
+
+    async def models_loadable(self):
+        return await self.run(getattr, self.device, 'models_loadable')
+
+    async def scan_models(self, *args, **kwargs):
+        return await self.run(self.device.scan_models, *args, **kwargs)
+
+    async def load_model(self, model):
+        return await self.run(self.device.load_model, model)
+
+    def _get_and_extract(self, operation, remove_deprecated, *args, **kwargs):
+        reply = self.device.execute(operation, *args, **kwargs)
+        return self.device.extract_config(
+            reply, remove_deprecated=remove_deprecated)
+
+    async def fetch_config(self, operation='get_config', *args,
+                           remove_deprecated=False, **kwargs):
+        '''fetch_config
+
+        High-level api: Send a get-config or get message and extract config
+        from the reply. Extracting runs in the same worker thread as the
+        request, so the event loop is never blocked by parsing.
+
+        Parameters
+        ----------
+
+        operation : `str`
+            Either 'get_config' or 'get'.
+
+        remove_deprecated : `bool`
+            Passed to ModelDevice.extract_config().
+
+        args : `tuple`
+            Positional arguments of the operation.
+
+        kwargs : `dict`
+            Keyword arguments of the operation, e.g., models.
+
+        Returns
+        -------
+
+        Config
+            An instance of Config.
+        '''
+
+        if operation not in ['get_config', 'get']:
+            raise ValueError("argument 'operation' must be 'get_config' or "
+                             "'get', but not '{}'".format(operation))
+        return await self.run(self._get_and_extract, operation,
+                              remove_deprecated, *args, **kwargs)
+
+
+class AsyncFleet(object):
+    '''AsyncFleet
+
+    Run Netconf operations on many ModelDevice instances concurrently with
+    bounded parallelism. One thread pool of size limit serves all devices, so
+    the number of worker threads depends on the limit, not on the number of
+    devices. It can be used as an async context manager, which shuts down the
+    thread pool on exit.
+
+    Attributes
+    ----------
+    devices : `list`
+        A list of AsyncModelDevice instances.
+
+    limit : `int`
+        Maximum number of operations in flight.
+    '''
+
+    def __init__(self, devices, limit=32):
+        '''
+        __init__ instantiates an AsyncFleet instance.
+        '''
+
+        if not isinstance(limit, int) or limit < 1:
+            raise ValueError("argument 'limit' must be a positive integer, "
+                             "but not '{}'".format(limit))
+        self.limit = limit
+        self.executor = ThreadPoolExecutor(max_workers=limit,
+                                           thread_name_prefix='ncdiff_fleet')
+        self._semaphore = None
+        self._loop = None
+        self.devices = [AsyncModelDevice(d,
+                                         executor=self.executor,
+                                         semaphore=self._get_semaphore)
+                        for d in devices]
+
+    def __repr__(self):
+        return '<{}.{} {} devices at {}>'.format(self.__class__.__module__,
+                                                 self.__class__.__name__,
+                                                 len(self.devices),
+                                                 hex(id(self)))
+
+    def __len__(self):
+        return len(self.devices)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def _get_semaphore(self):
+        # the semaphore is created by the first coroutine that needs it, so
+        # it belongs to the running event loop, and a new one is created if
+        # the fleet is used by another event loop later
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    async def map(self, method, *args, return_exceptions=True, **kwargs):
+        '''map
+
+        High-level api: Call a coroutine method of AsyncModelDevice on all
+        devices concurrently.
+
+        Parameters
+        ----------
+
+        method : `str`
+            Method name of AsyncModelDevice, e.g., 'get_config', 'get',
+            'get_schema' or 'fetch_config'.
+
+        return_exceptions : `bool`
+            If True, an exception raised by one device is returned in place
+            of its result, so one failing device does not cancel others.
+
+        args : `tuple`
+            Positional arguments of the method.
+
+        kwargs : `dict`
+            Keyword arguments of the method.
+
+        Returns
+        -------
+
+        list
+            A list of results in the order of devices.
+        '''
+
+        return await asyncio.gather(
+            *[getattr(d, method)(*args, **kwargs) for d in self.devices],
+            return_exceptions=return_exceptions)
+
+    async def execute(self, operation, *args, **kwargs):
+        return await self.map('execute', operation, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await self.map('get', *args, **kwargs)
+
+    async def get_config(self, *args, **kwargs):
+        return await self.map('get_config', *args, **kwargs)
+
+    async def get_schema(self, *args, **kwargs):
+        return await self.map('get_schema', *args, **kwargs)
+
+    async def fetch_config(self, *args, **kwargs):
+        return await self.map('fetch_config', *args, **kwargs)
@@ -0,0 +1,573 @@
+import logging
+from lxml import etree
+from threading import Lock
+from collections import OrderedDict
+
+from .ref import compile_instanceid
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class XPathCache(object):
+    '''XPathCache
+
+    A thread-safe LRU cache of compiled etree.XPath objects keyed by
+    expression and namespace map. Evaluating a cached expression skips the
+    compile step of lxml, which dominates when the same XPaths are evaluated
+    against many configs or replies.
+
+    Attributes
+    ----------
+    maxsize : `int`
+        Maximum number of compiled expressions kept.
+
+    hits : `int`
+        Number of lookups served from the cache.
+
+    misses : `int`
+        Number of lookups that compiled a new expression.
+    '''
+
+    def __init__(self, maxsize=1024):
+        '''
+        __init__ instantiates a XPathCache instance.
+        '''
+
+        if not isinstance(maxsize, int) or maxsize < 1:
+            raise ValueError("argument 'maxsize' must be a positive integer, "
+                             "but not '{}'".format(maxsize))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._xpaths = OrderedDict()
+
+    def __repr__(self):
+        return '<{}.{} {}/{} hits={} misses={} at {}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            len(self),
+            self.maxsize,
+            self.hits,
+            self.misses,
+            hex(id(self)),
+            )
+
+    def __len__(self):
+        return len(self._xpaths)
+
+    def compile(self, path, namespaces=None):
+        '''compile
+
+        High-level api: Return a compiled etree.XPath object of an expression,
+        compiling it only when it is not in the cache.
+
+        Parameters
+        ----------
+
+        path : `str`
+            An XPath expression.
+
+        namespaces : `dict`
+            A dictionary whose keys are prefixes and values are URLs.
+
+        Returns
+        -------
+
+        XPath
+            An etree.XPath object.
+        '''
+
+        key = (path, frozenset(namespaces.items()) if namespaces else None)
+        with self._lock:
+            xpath = self._xpaths.get(key)
+            if xpath is not None:
+                self._xpaths.move_to_end(key)
+                self.hits += 1
+                return xpath
+        xpath = etree.XPath(path, namespaces=namespaces)
+        with self._lock:
+            self.misses += 1
+            self._xpaths[key] = xpath
+            if len(self._xpaths) > self.maxsize:
+                self._xpaths.popitem(last=False)
+        return xpath
+
+    def evaluate(self, node, path, namespaces=None, **variables):
+        '''evaluate
+
+        High-level api: Evaluate an XPath expression on a node.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            The context node.
+
+        path : `str`
+            An XPath expression.
+
+        namespaces : `dict`
+            A dictionary whose keys are prefixes and values are URLs.
+
+        variables : `dict`
+            XPath variables, e.g., evaluate(node, '//name[text()=$n]', n='x').
+
+        Returns
+        -------
+
+        boolean or float or str or list
+            Refer to http://lxml.de/xpathxslt.html#xpath-return-values
+        '''
+
+        return self.compile(path, namespaces)(node, **variables)
+
+    def clear(self):
+        '''clear
+
+        High-level api: Remove all compiled expressions and reset counters.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        with self._lock:
+            self._xpaths = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+
+
+def cached_xpath(cache, node, args, kwargs):
+    '''cached_xpath
+
+    Evaluate node.xpath(*args, **kwargs) through an XPathCache when the call
+    only has an expression and optional namespaces and variables, otherwise
+    fall back to node.xpath().
+    '''
+
+    if (
+        cache is not None and len(args) == 1 and isinstance(args[0], str) and
+        'extensions' not in kwargs and 'regexp' not in kwargs and
+        'smart_strings' not in kwargs
+    ):
+        variables = dict(kwargs)
+        namespaces = variables.pop('namespaces', None)
+        return cache.evaluate(node, args[0], namespaces, **variables)
+    return node.xpath(*args, **kwargs)
+
+
+class InstanceIdentifierCache(object):
+    '''InstanceIdentifierCache
+
+    A thread-safe LRU cache of compiled instance-identifier values keyed by
+    text and nsmap of the node. Nodes of type instance-identifier often
+    repeat the same values, so each value is tokenized and resolved once,
+    and its canonical and converted forms are computed once.
+
+    Attributes
+    ----------
+    maxsize : `int`
+        Maximum number of compiled values kept.
+
+    hits : `int`
+        Number of lookups served from the cache.
+
+    misses : `int`
+        Number of lookups that compiled a new value.
+    '''
+
+    def __init__(self, maxsize=4096):
+        '''
+        __init__ instantiates an InstanceIdentifierCache instance.
+        '''
+
+        if not isinstance(maxsize, int) or maxsize < 1:
+            raise ValueError("argument 'maxsize' must be a positive integer, "
+                             "but not '{}'".format(maxsize))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._values = OrderedDict()
+
+    def __repr__(self):
+        return '<{}.{} {}/{} hits={} misses={} at {}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            len(self),
+            self.maxsize,
+            self.hits,
+            self.misses,
+            hex(id(self)),
+            )
+
+    def __len__(self):
+        return len(self._values)
+
+    def compile(self, device, text, nsmap, tag=None):
+        '''compile
+
+        High-level api: Return a compiled instance-identifier value,
+        compiling it only when it is not in the cache.
+
+        Parameters
+        ----------
+
+        device : `object`
+            An instance of yang.ncdiff.ModelDevice, which represents a
+            modeled device.
+
+        text : `str`
+            Text value of an instance-identifier node.
+
+        nsmap : `dict`
+            nsmap of the instance-identifier node.
+
+        tag : `str`
+            Tag of the instance-identifier node, used in error messages.
+
+        Returns
+        -------
+
+        CompiledInstanceIdentifier
+            An instance of CompiledInstanceIdentifier.
+        '''
+
+        key = (text, frozenset(nsmap.items()))
+        with self._lock:
+            compiled = self._values.get(key)
+            if compiled is not None:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return compiled
+        compiled = compile_instanceid(device, text, nsmap, tag=tag)
+        with self._lock:
+            self.misses += 1
+            self._values[key] = compiled
+            if len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        '''clear
+
+        High-level api: Remove all compiled values and reset counters.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        with self._lock:
+            self._values = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+
+
+class SchemaNodePartition(object):
+    '''SchemaNodePartition
+
+    Entries of a SchemaNodeCache whose paths start with the same root. An
+    entry belongs to the cache only while its partition is valid.
+
+    Attributes
+    ----------
+    root : `str`
+        Tag of the root in `{url}tagname` notation.
+
+    size : `int`
+        Number of entries in the partition.
+
+    valid : `bool`
+        False after the partition is invalidated.
+    '''
+
+    __slots__ = ('root', 'size', 'valid')
+
+    def __init__(self, root):
+        '''
+        __init__ instantiates a SchemaNodePartition instance.
+        '''
+
+        self.root = root
+        self.size = 0
+        self.valid = True
+
+    def __repr__(self):
+        return '<{}.{} {} {} entries at {}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.root,
+            self.size,
+            hex(id(self)),
+            )
+
+
+class SchemaNodeCache(object):
+    '''SchemaNodeCache
+
+    A thread-safe cache of schema node lookups of ModelDevice. Keys are
+    paths of config nodes, i.e., tags from a root down to the node joined by
+    spaces, and values are schema nodes. Entries are partitioned by roots, so
+    all entries of a model are invalidated in one step when the model is
+    reloaded, however many entries are cached. Invalidated entries are not
+    visible any more. They are dropped when a lookup or an update finds
+    them, and the cache is compacted once they make up more than half of its
+    entries.
+
+    Lookups are on the hot path of every calculation, so get() takes no
+    lock. A hit only marks the entry, and the entry gets a second chance
+    when it is due for eviction, which approximates LRU. Counters hits and
+    misses are not locked either, so they may be slightly low when several
+    threads look up at the same time.
+
+    Attributes
+    ----------
+    maxsize : `int`
+        Maximum number of entries kept, including invalidated entries not
+        dropped yet.
+
+    stale : `int`
+        Number of invalidated entries not dropped yet.
+
+    hits : `int`
+        Number of lookups served from the cache.
+
+    misses : `int`
+        Number of lookups that did not find a valid entry.
+
+    evictions : `int`
+        Number of valid entries dropped to keep the cache within maxsize.
+
+    invalidations : `int`
+        Number of entries invalidated by invalidate().
+    '''
+
+    def __init__(self, maxsize=262144):
+        '''
+        __init__ instantiates a SchemaNodeCache instance.
+        '''
+
+        if not isinstance(maxsize, int) or maxsize < 1:
+            raise ValueError("argument 'maxsize' must be a positive integer, "
+                             "but not '{}'".format(maxsize))
+        self.maxsize = maxsize
+        self._lock = Lock()
+        self._partitions = {}
+        self.clear()
+
+    def __repr__(self):
+        return '<{}.{} {}/{} hits={} misses={} evictions={} ' \
+               'invalidations={} at {}>'.format(
+                   self.__class__.__module__,
+                   self.__class__.__name__,
+                   len(self),
+                   self.maxsize,
+                   self.hits,
+                   self.misses,
+                   self.evictions,
+                   self.invalidations,
+                   hex(id(self)),
+                   )
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, path):
+        entry = self._nodes.get(path)
+        return entry is not None and entry[0].valid
+
+    def __iter__(self):
+        with self._lock:
+            return iter([k for k, v in self._nodes.items() if v[0].valid])
+
+    @property
+    def partitions(self):
+        return {k: v.size for k, v in self._partitions.items()}
+
+    def partition(self, root):
+        '''partition
+
+        High-level api: Return the current partition of a root. A lookup
+        takes the partition before resolving a schema node, and passes it to
+        set(), so a node resolved while its model is being reloaded is not
+        cached.
+
+        Parameters
+        ----------
+
+        root : `str`
+            Tag of a root in `{url}tagname` notation.
+
+        Returns
+        -------
+
+        SchemaNodePartition
+            A SchemaNodePartition instance.
+        '''
+
+        partition = self._partitions.get(root)
+        if partition is None:
+            with self._lock:
+                partition = self._partitions.get(root)
+                if partition is None:
+                    partition = SchemaNodePartition(root)
+                    self._partitions[root] = partition
+        return partition
+
+    def get(self, path):
+        '''get
+
+        High-level api: Return the cached schema node of a path.
+
+        Parameters
+        ----------
+
+        path : `str`
+            Tags from a root down to a config node joined by spaces.
+
+        Returns
+        -------
+
+        Element
+            A schema node, or None if it is not cached.
+        '''
+
+        entry = self._nodes.get(path)
+        if entry is not None:
+            if entry[0].valid:
+                entry[2] = True
+                self.hits += 1
+                return entry[1]
+            with self._lock:
+                if self._nodes.get(path) is entry:
+                    del self._nodes[path]
+                    self.stale -= 1
+        self.misses += 1
+        return None
+
+    def set(self, path, node, partition):
+        '''set
+
+        High-level api: Cache the schema node of a path.
+
+        Parameters
+        ----------
+
+        path : `str`
+            Tags from a root down to a config node joined by spaces.
+
+        node : `Element`
+            The schema node.
+
+        partition : `SchemaNodePartition`
+            The partition returned by partition() before the schema node was
+            resolved. Nothing is cached if it has been invalidated since.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        with self._lock:
+            if not partition.valid:
+                return
+            old = self._nodes.pop(path, None)
+            if old is not None:
+                if old[0].valid:
+                    old[0].size -= 1
+                    self._size -= 1
+                else:
+                    self.stale -= 1
+            # an entry is [partition, schema node, used since last checked]
+            self._nodes[path] = [partition, node, False]
+            partition.size += 1
+            self._size += 1
+            while len(self._nodes) > self.maxsize:
+                key, entry = self._nodes.popitem(last=False)
+                if not entry[0].valid:
+                    self.stale -= 1
+                    continue
+                if entry[2]:
+                    entry[2] = False
+                    self._nodes[key] = entry
+                    continue
+                entry[0].size -= 1
+                self._size -= 1
+                self.evictions += 1
+
+    def invalidate(self, roots):
+        '''invalidate
+
+        High-level api: Invalidate all entries whose paths start with given
+        roots, e.g., roots of a model being reloaded. The cost depends on the
+        number of roots, not on the number of entries.
+
+        Parameters
+        ----------
+
+        roots : `list`
+            Tags of roots in `{url}tagname` notation.
+
+        Returns
+        -------
+
+        int
+            Number of entries invalidated.
+        '''
+
+        number = 0
+        with self._lock:
+            for root in roots:
+                partition = self._partitions.pop(root, None)
+                if partition is not None:
+                    partition.valid = False
+                    number += partition.size
+            self._size -= number
+            self.stale += number
+            self.invalidations += number
+            if self.stale * 2 > len(self._nodes):
+                self._compact()
+        if number:
+            logger.debug('{} cached schema nodes are invalidated'
+                         .format(number))
+        return number
+
+    def clear(self):
+        '''clear
+
+        High-level api: Remove all entries and reset counters.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        with self._lock:
+            for partition in self._partitions.values():
+                partition.valid = False
+            self._partitions = {}
+            self._nodes = OrderedDict()
+            self._size = 0
+            self.stale = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+    def _compact(self):
+        # called with the lock held; lookups without the lock keep reading
+        # the old dictionary until the new one replaces it
+        self._nodes = OrderedDict(
+            (k, v) for k, v in self._nodes.items() if v[0].valid)
+        self.stale = 0
@@ -1,6 +1,7 @@
 import logging
 from functools import lru_cache
 
+from lxml import etree
 from ncclient import xml_
 
 from .ref import IdentityRef, InstanceIdentifier
@@ -18,6 +19,18 @@ value_tag = '{' + yang_url + '}value'
 key_tag = '{' + yang_url + '}key'
 
 
+@lru_cache(maxsize=1024)
+def _key_paths(tag, key):
+    # compiled XPaths of key values of all list instances, and of whether an
+    # instance does not have exactly one key node with one text node. The
+    # cache is shared by all threads: lru_cache is thread-safe, and lxml
+    # serializes evaluations of one XPath object by its own lock
+    return (etree.ETXPath('{}/{}/text()'.format(tag, key),
+                          smart_strings=False),
+            etree.ETXPath('boolean({0}[count({1}) != 1 or '
+                          'count({1}/text()) != 1])'.format(tag, key)))
+
+
 class BaseCalculator(object):
     '''BaseCalculator
 
@@ -36,6 +49,10 @@ class BaseCalculator(object):
 
     etree2 : `Element`
         A lxml Element which contains the other config.
+
+    stats : `Stats`
+        An instance of Stats if statistics collection is enabled on the
+        device, otherwise None.
     '''
 
     def __init__(self, device, etree1, etree2):
@@ -46,6 +63,7 @@ class BaseCalculator(object):
         self.device = device
         self.etree1 = etree1
         self.etree2 = etree2
+        self.stats = device.stats
         self.__attach_per_instance_cache()
 
     @staticmethod
@@ -131,93 +149,203 @@ class BaseCalculator(object):
             List of matching pairs, one of both items in the pair can be None
 
         """
+        if self.stats is not None:
+            self.stats.count('_pair_children')
+
         # Hash based approach, build two hashtables and match
         # keys are (tag, self-key)
         # self-key is
         #    text for leaf-list
         #    key tuple for list
         #    none for others
+        # Key tuples of all instances of a list are extracted column by
+        # column, see _key_columns()
+        kinds = {}
+        ones = self._index_children(node_one, kinds)
+        twos = self._index_children(node_two, kinds)
+
+        # make pairs, in order
+        pairs = [(one, twos.get(uid)) for uid, one in ones.items()]
+        pairs.extend((None, two) for uid, two in twos.items()
+                     if uid not in ones)
+        return pairs
+
+    def _child_kind(self, child):
+        '''_child_kind
+
+        Low-level api: Return what _index_children() needs to know about
+        children with the same tag as child.
+
+        Parameters
+        ----------
+
+        child : `Element`
+            An Element node in a Config instance.
+
+        Returns
+        -------
+
+        tuple
+            A tuple of the schema node, the node type, a tuple of key tags if
+            it is a list, and whether text values can be compared as they are
+            if it is a leaf-list.
+        '''
+
+        s_node = self.device.get_schema_node(child)
+        record = self.device.schema_nodes.get(s_node)
+        if record is not None:
+            node_type, datatype = record.type, record.datatype
+        else:
+            node_type, datatype = s_node.get('type'), s_node.get('datatype')
+        keys = ()
+        if node_type == 'list':
+            keys = tuple(self._get_list_keys(s_node))
+        plain = datatype is None or (datatype[:11] != 'identityref' and
+                                     datatype != 'instance-identifier')
+        return (s_node, node_type, keys, plain)
+
+    def _index_children(self, node, kinds):
+        '''_index_children
+
+        Low-level api: Build a dictionary of children of a node, in document
+        order, whose keys are (tag, self-key). ConfigError is raised if two
+        children have the same key.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            An Element node in a Config instance.
+
+        kinds : `dict`
+            Results of _child_kind() by tag, shared by both sides of
+            _pair_children().
+
+        Returns
+        -------
+
+        dict
+            A dictionary whose keys are (tag, self-key) and values are
+            children.
+        '''
+
+        children = node.getchildren()
+        positions_by_tag = {}
+        for position, child in enumerate(children):
+            positions_by_tag.setdefault(child.tag, []).append(position)
+        uids = [None] * len(children)
+        for tag, positions in positions_by_tag.items():
+            kind = kinds.get(tag)
+            if kind is None:
+                kind = kinds[tag] = self._child_kind(children[positions[0]])
+            s_node, node_type, keys, plain = kind
+            if node_type == 'list':
+                rows = self._key_columns(node, tag, keys, len(positions))
+                for position, row in zip(positions, rows):
+                    uids[position] = (tag, row)
+            elif node_type == 'leaf-list':
+                for position in positions:
+                    if plain:
+                        uids[position] = (tag, children[position].text)
+                    else:
+                        uids[position] = \
+                            (tag, self._parse_text(children[position],
+                                                   s_node))
+            else:
+                for position in positions:
+                    uids[position] = (tag, None)
+
+        index = dict(zip(uids, children))
+        if len(index) < len(children):
+            index = {}
+            for uid, child in zip(uids, children):
+                if uid in index:
+                    raise ConfigError('not unique peer of node {} {}' \
+                                      .format(child, index[uid]))
+                index[uid] = child
+        return index
+
+    def _key_columns(self, node, tag, keys, count):
+        '''_key_columns
+
+        Low-level api: Return key tuples of all instances of a list under a
+        node. Each key column is pulled out of all instances by one compiled
+        XPath, instead of looking up key nodes instance by instance.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            The parent of list instances.
+
+        tag : `str`
+            Tag of the list in `{url}tagname` notation.
+
+        keys : `tuple`
+            Tags of keys in `{url}tagname` notation.
+
+        count : `int`
+            Number of instances.
+
+        Returns
+        -------
+
+        list
+            A list of key tuples, in document order of instances.
+        '''
+
+        columns = []
+        for key in keys:
+            texts, irregular = _key_paths(tag, key)
+            column = texts(node)
+            if len(column) != count or irregular(node):
+                column = self._key_column(node, tag, key)
+            columns.append(column)
+        return list(zip(*columns))
+
+    def _key_column(self, node, tag, key):
+        '''_key_column
+
+        Low-level api: Return text values of one key of all instances of a
+        list under a node, instance by instance. ConfigError is raised if an
+        instance does not have exactly one key node.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            The parent of list instances.
+
+        tag : `str`
+            Tag of the list in `{url}tagname` notation.
+
+        key : `str`
+            Tag of the key in `{url}tagname` notation.
 
-        def find_one_child(node, tag):
-            """ Find exactly one child with the given tag"""
-            s = list(node.iterchildren(tag=tag))
+        Returns
+        -------
+
+        list
+            A list of text values, in document order of instances.
+        '''
+
+        column = []
+        for instance in node.iterchildren(tag=tag):
+            s = list(instance.iterchildren(tag=key))
             if len(s) < 1:
+                if node.getparent() is None:
+                    # list instances are roots of a config
+                    path = '/'
+                else:
+                    path = self.device.get_xpath(node)
                 raise ConfigError("cannot find key '{}' in node {} under {}" \
-                                  .format(tag,
-                                          node.tag,
-                                          self.device \
-                                              .get_xpath(node.getparent())))
+                                  .format(key, instance.tag, path))
             if len(s) > 1:
                 raise ConfigError("not unique key '{}' in node {}" \
-                                  .format(tag,
-                                          self.device.get_xpath(node)))
-            return s[0]
-
-        def build_index_tuple(node, keys, s_node):
-            """
-            build a tuple containing the text of all fields listed in keys, taken from node
-
-            s_node is passed to prevent it being looked up twice.
-            """
-            out = [self._parse_text(find_one_child(node, k), s_node) for k in keys]
-            return tuple(out)
-
-        type_for_tag = {}
-        def get_type_for_tag(tag, child):
-            """
-            Given a child node with a given tag, find the type
-
-            caches based on tag
-
-            :return: a tuple, containing the s_node and node type
-            """
-            node_type = type_for_tag.get(tag, None)
-            if node_type is not None:
-                return node_type
-            s_node = self.device.get_schema_node(child)
-            node_type = s_node.get('type')
-
-            result = (s_node, node_type)
-            type_for_tag[tag] = result
-            return result
-
-        def build_unique_id(child):
-            """
-            Build the hash key for a node
-            """
-            tag = child.tag
-            key = None
-            s_node, node_type = get_type_for_tag(tag, child)
-            if node_type == 'leaf-list':
-                key = self._parse_text(child, s_node)
-            elif node_type == 'list':
-                keys = self._get_list_keys(s_node)
-                key = build_index_tuple(child, keys, s_node)
-            return (tag, key)
-
-        # build the hashmap for node_one
-        ones = {}
-        for child in node_one.getchildren():
-            key = build_unique_id(child)
-            if key in ones:
-                raise ConfigError('not unique peer of node {} {}' \
-                    .format(child, ones[key]))
-            ones[key] = child
-
-        # build the hashmap for node_two
-        twos = {}
-        for child in node_two.getchildren():
-            key = build_unique_id(child)
-            if key in twos:
-                raise ConfigError('not unique peer of node {} {}' \
-                                  .format(child, twos[key]))
-            twos[key] = child
-
-        # make pairs, in order
-        one_lookup = set(ones.keys())
-        keys_in_order = list(ones.keys())
-        keys_in_order.extend([two for two in twos.keys() if two not in one_lookup])
-        return [(ones.get(uid, None), twos.get(uid, None)) for uid in keys_in_order]
+                                  .format(key,
+                                          self.device.get_xpath(instance)))
+            column.append(s[0].text)
+        return column
 
     def _group_kids(self, node_one, node_two):
         '''_group_kids
@@ -281,6 +409,9 @@ class BaseCalculator(object):
             A list of tags of keys in `{url}tagname` notation.
         '''
 
+        record = self.device.schema_nodes.get(schema_node)
+        if record is not None:
+            return list(record.keys)
         composer = Composer(self.device, schema_node)
         return composer.keys
 
@@ -372,9 +503,29 @@ class BaseCalculator(object):
         We want to use the @lru_cache annotation, but release the cache when this calculator is garbage collected
         For this, we use the following construction:
         https://stackoverflow.com/questions/14946264/python-lru-cache-decorator-per-instance
+
+        A calculator is created for each calculation, so the cache is never
+        shared between threads, even when the device and its schema are
+        shared.
         """
 
         self._parse_text = lru_cache(maxsize=128)(self._parse_text)
+        self._parse_text_recorded = (0, 0)
+
+    def _record_parse_text(self):
+        '''_record_parse_text
+
+        Low-level api: Add hits and misses of the _parse_text cache, since
+        the last time they were recorded, to self.stats.
+        '''
+
+        if self.stats is None:
+            return
+        info = self._parse_text.cache_info()
+        hits, misses = self._parse_text_recorded
+        self.stats.count('parse_text_hit', info.hits - hits)
+        self.stats.count('parse_text_miss', info.misses - misses)
+        self._parse_text_recorded = (info.hits, info.misses)
 
     # cache because this is an expensive call, often called multiple times on the same node in rapid succession
     def _parse_text(self, node, schema_node=None):
@@ -402,16 +553,20 @@ class BaseCalculator(object):
 
         if schema_node is None:
             schema_node = self.device.get_schema_node(node)
-        if schema_node.get('datatype') is not None and \
-          (schema_node.get('datatype')[:11] == 'identityref'):
+        record = self.device.schema_nodes.get(schema_node)
+        if record is not None:
+            datatype, node_type = record.datatype, record.type
+        else:
+            datatype, node_type = \
+                schema_node.get('datatype'), schema_node.get('type')
+        if datatype is not None and datatype[:11] == 'identityref':
             idref = IdentityRef(self.device, node)
             return idref.default
-        elif schema_node.get('datatype') is not None and \
-             schema_node.get('datatype') == 'instance-identifier':
+        elif datatype is not None and datatype == 'instance-identifier':
             instanceid = InstanceIdentifier(self.device, node)
             return instanceid.default
         else:
-            if schema_node.get("type") == "container":
+            if node_type == "container":
                 # prevent whitespace in container to cause problems
                 return None
             return node.text
@@ -531,6 +686,8 @@ class BaseCalculator(object):
             False.
         '''
 
+        if self.stats is not None:
+            self.stats.count('_node_le')
         for x in ['tag', 'tail']:
             if node_self.__getattribute__(x) != node_other.__getattribute__(x):
                 return False
@@ -0,0 +1,1355 @@
+import os
+import re
+import queue
+import logging
+
+from lxml import etree
+from ncclient import operations
+from threading import Lock, Thread, current_thread
+import pyang
+from pyang import error, yang_parser, statements
+try:
+    from pyang.repository import FileRepository
+except ImportError:
+    from pyang import FileRepository
+try:
+    from pyang.context import Context
+except ImportError:
+    from pyang import Context
+
+from .model import Model, read_xml, write_xml
+from .store import ModuleStore
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class Position(object):
+    __slots__ = (
+        'ref',
+        'line',
+        'top',
+        'uses_pos',
+        'first_line',
+        'last_line',
+    )
+
+    def __init__(self, ref):
+        self.ref = ref
+        self.line = 0
+        self.top = None
+        self.uses_pos = None
+        self.first_line = None
+        self.last_line = None
+
+    def __str__(self):
+        return self.label()
+
+    def label(self, basename=False):
+        ref = self.ref
+        if basename:
+            ref = os.path.basename(ref)
+        s = ref + ':' + str(self.line)
+        if self.uses_pos is None:
+            return s
+        else:
+            return str(self.uses_pos) + ' (at ' + s + ')'
+
+
+error.Position = Position
+
+
+def _parse_statement(self, parent):
+    first_line = (self.pos.line, self.tokenizer.offset)
+
+    # modification: when the --keep-comments flag is provided,
+    # we would like to see if a statement is a comment, and if so
+    # treat it differently than we treat keywords further down
+    if self.ctx.keep_comments:
+        cmt, is_line_end, is_multi_line = self.tokenizer.get_comment(
+            self.last_line)
+        if cmt is not None:
+            stmt = statements.new_statement(self.top,
+                                            parent,
+                                            self.pos,
+                                            '_comment',
+                                            cmt)
+            stmt.is_line_end = is_line_end
+            stmt.is_multi_line = is_multi_line
+            # just ignore Comments outside the module
+            if parent is not None:
+
+                stmt.pos.first_line = first_line
+                stmt.pos.last_line = (self.last_line, self.tokenizer.offset)
+
+                return stmt
+
+    keywd = self.tokenizer.get_keyword()
+    # check for argument
+    tok = self.tokenizer.peek()
+    if tok == '{' or tok == ';':
+        arg = None
+        argstrs = None
+    else:
+        argstrs = self.tokenizer.get_strings()
+        arg = ''.join([a[0] for a in argstrs])
+    # check for YANG 1.1
+    if keywd == 'yang-version' and arg == '1.1':
+        self.tokenizer.is_1_1 = True
+        self.tokenizer.strict_quoting = True
+
+    stmt = statements.new_statement(self.top, parent, self.pos, keywd, arg)
+
+    if self.ctx.keep_arg_substrings and argstrs is not None:
+        stmt.arg_substrings = argstrs
+    if self.top is None:
+        self.pos.top = stmt
+        self.top = stmt
+
+    # check for substatements
+    tok = self.tokenizer.peek()
+    if tok == '{':
+        self.tokenizer.skip_tok()  # skip the '{'
+        self.last_line = self.pos.line
+        while self.tokenizer.peek() != '}':
+            substmt = self._parse_statement(stmt)
+            stmt.substmts.append(substmt)
+        self.tokenizer.skip_tok()  # skip the '}'
+    elif tok == ';':
+        self.tokenizer.skip_tok()  # skip the ';'
+    else:
+        error.err_add(self.ctx.errors, self.pos, 'INCOMPLETE_STATEMENT',
+                      (keywd, tok))
+        raise error.Abort
+    self.last_line = self.pos.line
+
+    stmt.pos.first_line = first_line
+    stmt.pos.last_line = (self.last_line, self.tokenizer.offset)
+
+    return stmt
+
+
+yang_parser.YangParser._parse_statement = _parse_statement
+
+
+class DownloadWorker(Thread):
+
+    def __init__(self, downloader):
+        Thread.__init__(self)
+        self.downloader = downloader
+
+    def run(self):
+        # modules may be queued while other workers are downloading, so a
+        # worker only exits when it gets None
+        while True:
+            module = self.downloader.download_queue.get()
+            if module is None:
+                self.downloader.download_queue.task_done()
+                break
+            try:
+                self.downloader.download(module)
+            except Exception:
+                logger.exception('Got error while downloading')
+                with self.downloader.lock:
+                    self.downloader.failed.add(module)
+            self.downloader.download_queue.task_done()
+        logger.debug('Thread {} exits'.format(current_thread().name))
+
+
+class ContextWorker(Thread):
+
+    def __init__(self, context):
+        Thread.__init__(self)
+        self.context = context
+
+    def run(self):
+        varnames = Context.add_module.__code__.co_varnames
+        while not self.context.modulefile_queue.empty():
+            try:
+                modulefile = self.context.modulefile_queue.get(timeout=0.01)
+            except queue.Empty:
+                pass
+            else:
+                with open(modulefile, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                kwargs = {
+                    'ref': modulefile,
+                    'text': text,
+                }
+                if 'primary_module' in varnames:
+                    kwargs['primary_module'] = True
+                if 'format' in varnames:
+                    kwargs['format'] = 'yang'
+                if 'in_format' in varnames:
+                    kwargs['in_format'] = 'yang'
+                module_statement = self.context.add_module(**kwargs)
+                if module_statement is not None:
+                    self.context.update_dependencies(module_statement)
+                self.context.modulefile_queue.task_done()
+        logger.debug('Thread {} exits'.format(current_thread().name))
+
+
+class CompilerContext(Context):
+
+    def __init__(self, repository):
+        Context.__init__(self, repository)
+        self.dependencies = None
+        self.modulefile_queue = None
+        if 'prune' in dir(statements.Statement):
+            self.num_threads = 2
+        else:
+            self.num_threads = 1
+
+    def _get_latest_revision(self, modulename):
+        latest = None
+        for module_name, module_revision in self.modules:
+            if module_name == modulename and (
+                latest is None or module_revision > latest
+            ):
+                latest = module_revision
+        return latest
+
+    def get_statement(self, modulename, xpath=None):
+        revision = self._get_latest_revision(modulename)
+        if revision is None:
+            return None
+        if xpath is None:
+            return self.modules[(modulename, revision)]
+
+        # in order to follow the Xpath, the module is required to be validated
+        node_statement = self.modules[(modulename, revision)]
+        if node_statement.i_is_validated is not True:
+            return None
+
+        # xpath is given, so find the node statement
+        xpath_list = xpath.split('/')
+
+        # only absolute Xpaths are supported
+        if len(xpath_list) < 2:
+            return None
+        if (
+            xpath_list[0] == '' and xpath_list[1] == '' or
+            xpath_list[0] != ''
+        ):
+            return None
+
+        # find the node statement
+        root_prefix = node_statement.i_prefix
+        for n in xpath_list[1:]:
+            node_statement = self.get_child(root_prefix, node_statement, n)
+            if node_statement is None:
+                return None
+        return node_statement
+
+    def get_child(self, root_prefix, parent, child_id):
+        child_id_list = child_id.split(':')
+        if len(child_id_list) > 1:
+            children = [
+                c for c in parent.i_children
+                if c.arg == child_id_list[1] and
+                c.i_module.i_prefix == child_id_list[0]
+            ]
+        elif len(child_id_list) == 1:
+            children = [
+                c for c in parent.i_children
+                if c.arg == child_id_list[0] and
+                c.i_module.i_prefix == root_prefix
+            ]
+        return children[0] if children else None
+
+    def update_dependencies(self, module_statement):
+        if self.dependencies is None:
+            self.dependencies = etree.Element('modules')
+        for m in [
+            m for m in self.dependencies
+            if m.attrib.get('id') == module_statement.arg
+        ]:
+            self.dependencies.remove(m)
+        module_node = etree.SubElement(self.dependencies, 'module')
+        module_node.set('id', module_statement.arg)
+        module_node.set('type', module_statement.keyword)
+        if module_statement.keyword == 'module':
+            statement = module_statement.search_one('prefix')
+            if statement is not None:
+                module_node.set('prefix', statement.arg)
+            statement = module_statement.search_one("namespace")
+            if statement is not None:
+                namespace = etree.SubElement(module_node, 'namespace')
+                namespace.text = statement.arg
+        if module_statement.keyword == 'submodule':
+            statement = module_statement.search_one("belongs-to")
+            if statement is not None:
+                belongs_to = etree.SubElement(module_node, 'belongs-to')
+                belongs_to.set('module', statement.arg)
+
+        dependencies = set()
+        for parent_node_name, child_node_name, attr_name in [
+            ('includes', 'include', 'module'),
+            ('imports', 'import', 'module'),
+            ('revisions', 'revision', 'date'),
+            ('augments', 'augment', 'xpath'),
+            ('deviations', 'deviation', 'xpath'),
+        ]:
+            statements = module_statement.search(child_node_name)
+            if statements:
+                parent = etree.SubElement(module_node, parent_node_name)
+                for statement in statements:
+                    child = etree.SubElement(parent, child_node_name)
+                    child.set(attr_name, statement.arg)
+                    if child_node_name in ['include', 'import']:
+                        dependencies.add(statement.arg)
+                        if child_node_name == 'import':
+                            child.set('prefix',
+                                      statement.search_one('prefix').arg)
+
+        for node_name in [
+            'container',
+            'leaf',
+            'leaf-list',
+            'list',
+            'choice',
+            'uses',
+        ]:
+            exposed_statements = []
+            for stmt in module_statement.search(node_name):
+                for substmt in stmt.substmts:
+                    if (
+                        'tailf' in substmt.keyword[0] and
+                        len(substmt.keyword) == 2 and
+                        substmt.keyword[1] == 'hidden'
+                    ):
+                        break
+                else:
+                    exposed_statements.append(stmt)
+            if exposed_statements:
+                parent = etree.SubElement(module_node, 'roots')
+                break
+
+        return dependencies
+
+    def get_imports(self):
+        '''get_imports
+
+        High-level api: Get imports and includes of all modules from
+        dependency infomation.
+
+        Returns
+        -------
+
+        dict
+            A dictionary whose keys are module names and values are sets of
+            modules imported or included.
+        '''
+
+        imports = {}
+        for m in self.dependencies.findall('./module'):
+            imports.setdefault(m.get('id'), set()).update(
+                i.get('module') for i in
+                m.findall('./imports/import') + m.findall('./includes/include'))
+        return imports
+
+    def required_modules(self, modules):
+        '''required_modules
+
+        High-level api: Find modules that are required by given modules
+        directly or indirectly, including the given modules themselves.
+
+        Parameters
+        ----------
+
+        modules : `set`
+            A set of module names.
+
+        Returns
+        -------
+
+        set
+            A set of module names.
+        '''
+
+        imports = self.get_imports()
+        required = set()
+        todo = list(modules)
+        while todo:
+            module = todo.pop()
+            if module not in required:
+                required.add(module)
+                todo.extend(imports.get(module, ()))
+        return required
+
+    def write_dependencies(self):
+        dependencies_file = os.path.join(
+            self.repository.dirs[0],
+            'dependencies.xml',
+        )
+        write_xml(dependencies_file, self.dependencies)
+
+    def read_dependencies(self):
+        dependencies_file = os.path.join(
+            self.repository.dirs[0],
+            'dependencies.xml',
+        )
+        self.dependencies = read_xml(dependencies_file)
+
+    def load_context(self):
+        self.modulefile_queue = queue.Queue()
+        for filename in os.listdir(self.repository.dirs[0]):
+            if filename.lower().endswith('.yang'):
+                filepath = os.path.join(self.repository.dirs[0], filename)
+                self.modulefile_queue.put(filepath)
+        for x in range(self.num_threads):
+            worker = ContextWorker(self)
+            worker.daemon = True
+            worker.name = 'context_worker_{}'.format(x)
+            worker.start()
+        self.modulefile_queue.join()
+        self.write_dependencies()
+
+    def validate_context(self):
+        revisions = {}
+        for mudule_name, module_revision in self.modules:
+            if mudule_name not in revisions or (
+                mudule_name in revisions and
+                revisions[mudule_name] < module_revision
+            ):
+                revisions[mudule_name] = module_revision
+        self.sort_modules()
+        self.validate()
+        if 'prune' in dir(statements.Statement):
+            for mudule_name, module_revision in revisions.items():
+                self.modules[(mudule_name, module_revision)].prune()
+
+    def sort_modules(self):
+        submodules = {k: m for k, m in self.modules.items()
+                      if m.keyword == "submodule"}
+        for k in submodules:
+            del self.modules[k]
+        self.modules.update(submodules)
+
+    def internal_reset(self):
+        self.modules = {}
+        self.revs = {}
+        self.errors = []
+        for mod, rev, handle in self.repository.get_modules_and_revisions(
+                self):
+            if mod not in self.revs:
+                self.revs[mod] = []
+            revs = self.revs[mod]
+            revs.append((rev, handle))
+
+
+class ModelDownloader(object):
+    '''ModelDownloader
+
+    Abstraction of a Netconf schema downloader. Downloading is incremental:
+    module revisions of YANG files in the folder are recorded in
+    revisions.txt, so only new or changed modules are downloaded, and an
+    interrupted download resumes from where it stopped.
+
+    Attributes
+    ----------
+    device : `ModelDevice`
+        Model name.
+
+    dir_yang : `str`
+        Path to yang files.
+
+    yang_capabilities : `str`
+        Path to capabilities.txt file in the folder of yang files.
+
+    yang_revisions : `str`
+        Path to revisions.txt file in the folder of yang files.
+
+    num_threads : `int`
+        Number of concurrent <get-schema> requests.
+
+    store : `ModuleStore`
+        A ModuleStore instance shared by devices, or None. When it is given,
+        YANG files found in the store by module name and revision are not
+        downloaded, and YANG files in the folder are linked to the store.
+
+    yang_manifest : `str`
+        Path to manifest.txt file in the folder of yang files, which records
+        the SHA-256 of each YANG file in the store.
+
+    need_download : `bool`
+        True if the content of capabilities.txt file disagrees with device
+        capabilities exchange. False otherwise.
+
+    revisions : `dict`
+        Revisions of YANG files in the folder. Dictionary keys are module
+        names, and values are revisions, or an empty string if the revision is
+        unknown.
+
+    downloaded : `set`
+        Modules downloaded by the last call of download_all().
+
+    failed : `set`
+        Modules that could not be downloaded by the last call of
+        download_all().
+
+    removed : `set`
+        Modules removed from the folder by the last call of download_all(),
+        as they are not required by the device any more.
+
+    invalidated : `set`
+        Modules whose compiled cache was removed by the last call of
+        download_all(). They are the modules downloaded or removed, and their
+        dependents.
+    '''
+
+    def __init__(self, nc_device, folder, num_threads=2, store=None):
+        '''
+        __init__ instantiates a ModelDownloader instance.
+        '''
+
+        if not isinstance(num_threads, int) or num_threads < 1:
+            raise ValueError("argument 'num_threads' must be a positive "
+                             "integer, but not '{}'".format(num_threads))
+        self.device = nc_device
+        self.dir_yang = os.path.abspath(folder)
+        if not os.path.isdir(self.dir_yang):
+            os.makedirs(self.dir_yang)
+        self.yang_capabilities = os.path.join(
+            self.dir_yang,
+            'capabilities.txt',
+        )
+        self.yang_revisions = os.path.join(
+            self.dir_yang,
+            'revisions.txt',
+        )
+        self.yang_manifest = os.path.join(
+            self.dir_yang,
+            'manifest.txt',
+        )
+        self.store = store
+        repo = FileRepository(path=self.dir_yang)
+        self.context = CompilerContext(repository=repo)
+        self.download_queue = queue.Queue()
+        self.num_threads = num_threads
+        self.lock = Lock()
+        self.revisions = self.read_revisions()
+        self.digests = self.read_manifest()
+        self.to_be_downloaded = set()
+        self.downloaded = set()
+        self.failed = set()
+        self.removed = set()
+        self.invalidated = set()
+
+    @property
+    def need_download(self):
+        if os.path.isfile(self.yang_capabilities):
+            with open(self.yang_capabilities, 'r') as f:
+                c = f.read()
+            if c == '\n'.join(sorted(list(self.device.server_capabilities))):
+                return False
+        return True
+
+    def read_revisions(self):
+        revisions = {}
+        if os.path.isfile(self.yang_revisions):
+            with open(self.yang_revisions, 'r', encoding='utf-8') as f:
+                for line in f.read().splitlines():
+                    if line:
+                        module, _, revision = line.partition('@')
+                        revisions[module] = revision
+            return revisions
+
+        # a folder populated before revisions.txt was introduced
+        if os.path.isfile(self.yang_capabilities):
+            with open(self.yang_capabilities, 'r', encoding='utf-8') as f:
+                capabilities = f.read().splitlines()
+            for capability in capabilities:
+                match = re.search(r'module=([a-zA-Z0-9-]+)\&{0,1}',
+                                  capability)
+                if match and os.path.isfile(self._yang_file(match.group(1))):
+                    match_revision = re.search(r'revision=([0-9-]+)',
+                                               capability)
+                    revisions[match.group(1)] = \
+                        match_revision.group(1) if match_revision else ''
+        return revisions
+
+    def write_revisions(self):
+        text = ''.join('{}@{}\n'.format(module, revision)
+                       for module, revision in sorted(self.revisions.items()))
+        temp_file = self.yang_revisions + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        os.replace(temp_file, self.yang_revisions)
+
+    def append_revision(self, module, revision):
+        # an interrupted download_all() resumes from appended lines, and
+        # later lines win in read_revisions()
+        with open(self.yang_revisions, 'ab') as f:
+            f.write('{}@{}\n'.format(module, revision).encode('utf-8'))
+
+    def read_manifest(self):
+        digests = {}
+        if os.path.isfile(self.yang_manifest):
+            with open(self.yang_manifest, 'r', encoding='utf-8') as f:
+                for line in f.read().splitlines():
+                    if line:
+                        module, _, digest = line.partition(' ')
+                        digests[module] = digest
+        return digests
+
+    def write_manifest(self):
+        text = '\n'.join('{} {}'.format(module, digest)
+                         for module, digest in sorted(self.digests.items()))
+        temp_file = self.yang_manifest + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        os.replace(temp_file, self.yang_manifest)
+
+    def _yang_file(self, module):
+        return os.path.join(self.dir_yang, module + '.yang')
+
+    def is_current(self, module):
+        '''is_current
+
+        High-level api: Check whether the YANG file of a module in the folder
+        matches the revision supported by the device. Modules that are not
+        advertised by the device, e.g., submodules, are never current.
+
+        Parameters
+        ----------
+
+        module : `str`
+            Module name.
+
+        Returns
+        -------
+
+        bool
+            True if the module does not need to be downloaded.
+        '''
+
+        revisions = self.device.models_revisions
+        return module in revisions and module in self.revisions and \
+            self.revisions[module] == revisions[module] and \
+            os.path.isfile(self._yang_file(module))
+
+    def affected_modules(self, modules):
+        '''affected_modules
+
+        High-level api: Find modules whose compiled cache is affected when
+        given modules change. They are the given modules, modules importing or
+        including them directly or indirectly, and modules imported or
+        included by all of these, as the compiler reads augments and
+        deviations from importing modules.
+
+        Parameters
+        ----------
+
+        modules : `set`
+            A set of module names that are changed.
+
+        Returns
+        -------
+
+        set
+            A set of module names.
+        '''
+
+        imports = self.context.get_imports()
+        dependents = {}
+        for module, required in imports.items():
+            for m in required:
+                dependents.setdefault(m, set()).add(module)
+        affected = set()
+        todo = list(modules)
+        while todo:
+            module = todo.pop()
+            if module not in affected:
+                affected.add(module)
+                todo.extend(dependents.get(module, ()))
+        for module in list(affected):
+            affected.update(imports.get(module, ()))
+        return affected
+
+    def download_all(self, check_before_download=True):
+        '''download_all
+
+        High-level api: Download YANG files of modules the device supports.
+        When check_before_download is True, only new or changed modules are
+        downloaded, modules not required any more are removed, and compiled
+        cache of affected modules is removed. Otherwise the folder is cleaned
+        up and all modules are downloaded.
+
+        Parameters
+        ----------
+
+        check_before_download : `bool`
+            True if checking capabilities.txt file is required.
+
+        Returns
+        -------
+
+        None
+            Nothing returns.
+        '''
+
+        # check the content of self.yang_capabilities
+        if check_before_download and not self.need_download:
+            logger.info('Skip downloading as the content of {} '
+                        'matches device hello message'
+                        .format(self.yang_capabilities))
+            return
+
+        if check_before_download:
+            self.context.read_dependencies()
+        else:
+            # clean up folder self.dir_yang
+            for root, dirs, files in os.walk(self.dir_yang):
+                for f in files:
+                    os.remove(os.path.join(root, f))
+            self.revisions = {}
+            self.digests = {}
+            self.context.dependencies = None
+        if self.context.dependencies is None:
+            self.context.dependencies = etree.Element('modules')
+        self.write_revisions()
+
+        # download new or changed modules
+        modules = set(self.device.models_loadable)
+        self.to_be_downloaded = set(m for m in modules
+                                    if not self.is_current(m))
+        self.downloaded = set()
+        self.failed = set()
+        logger.info('{} of {} modules need to be downloaded'
+                    .format(len(self.to_be_downloaded), len(modules)))
+        for module in sorted(list(self.to_be_downloaded)):
+            self.download_queue.put(module)
+        workers = []
+        for x in range(min(self.num_threads, len(self.to_be_downloaded))):
+            worker = DownloadWorker(self)
+            worker.daemon = True
+            worker.name = 'download_worker_{}'.format(x)
+            worker.start()
+            workers.append(worker)
+        self.download_queue.join()
+        for worker in workers:
+            self.download_queue.put(None)
+        for worker in workers:
+            worker.join()
+
+        # remove modules that are not required any more
+        self.removed = set(self.revisions) - \
+            self.context.required_modules(modules)
+        self.invalidated = self.affected_modules(
+            self.downloaded | self.removed)
+        for module in self.removed:
+            logger.info('Module {} is not required any more'.format(module))
+            if os.path.isfile(self._yang_file(module)):
+                os.remove(self._yang_file(module))
+            del self.revisions[module]
+            self.digests.pop(module, None)
+            for m in self.context.dependencies.findall('./module'):
+                if m.get('id') == module:
+                    self.context.dependencies.remove(m)
+        for module in self.invalidated:
+            cached_name = os.path.join(self.dir_yang, module + '.xml')
+            if os.path.isfile(cached_name):
+                logger.debug('Remove compiled cache of {}'.format(module))
+                os.remove(cached_name)
+        self.write_revisions()
+        if self.store is not None:
+            self.write_manifest()
+
+        # write dependencies
+        self.context.write_dependencies()
+
+        # write self.yang_capabilities when all modules are downloaded, so the
+        # next call can resume
+        if self.failed:
+            logger.warning('{} modules cannot be downloaded: {}'.format(
+                len(self.failed), ', '.join(sorted(self.failed))))
+            return
+        capabilities = '\n'.join(sorted(list(self.device.server_capabilities)))
+        with open(self.yang_capabilities, 'wb') as f:
+            f.write(capabilities.encode('utf-8'))
+
+    def get_schema(self, module):
+        '''get_schema
+
+        High-level api: Retrieve a module schema from the device by
+        <get-schema>.
+
+        Parameters
+        ----------
+
+        module : `str`
+            Module name that will be retrieved.
+
+        Returns
+        -------
+
+        str
+            Content of the YANG file, or None if the schema cannot be
+            retrieved.
+        '''
+
+        revision = self.device.models_revisions.get(module) or None
+        try:
+            from .manager import ModelDevice
+            reply = super(ModelDevice, self.device).execute(
+                operations.retrieve.GetSchema,
+                module,
+                version=revision,
+            )
+        except operations.rpc.RPCError:
+            logger.warning("Module or submodule '{}' cannot be downloaded"
+                           .format(module))
+            return None
+        if reply.ok:
+            return reply.data
+        else:
+            logger.warning("module or submodule '{}' cannot be downloaded:\n{}"
+                           .format(module, reply._raw))
+            return None
+
+    def download(self, module):
+        '''download
+
+        High-level api: Download a module schema.
+
+        Parameters
+        ----------
+
+        module : `str`
+            Module name that will be downloaded.
+
+        Returns
+        -------
+
+        None
+            Nothing returns.
+        '''
+
+        revision = self.device.models_revisions.get(module, '')
+        fname = self._yang_file(module)
+        digest = None
+        if self.store is not None:
+            digest = self.store.lookup(module, revision)
+        if digest is not None:
+            logger.debug('Found {}@{} in module store'
+                         .format(module, revision))
+            text = self.store.checkout(digest, fname)
+        else:
+            logger.debug('Downloading {}.yang...'.format(module))
+            text = self.get_schema(module)
+            if text is None:
+                with self.lock:
+                    self.failed.add(module)
+                return
+            if self.store is not None:
+                digest = self.store.put(text, module, revision)
+                self.store.checkout(digest, fname)
+            else:
+                # the file may be linked to a module store
+                if os.path.lexists(fname):
+                    os.remove(fname)
+                with open(fname, 'wb') as f:
+                    f.write(text.encode('utf-8'))
+
+        varnames = Context.add_module.__code__.co_varnames
+        kwargs = {
+            'ref': fname,
+            'text': text,
+        }
+        if 'primary_module' in varnames:
+            kwargs['primary_module'] = True
+        if 'format' in varnames:
+            kwargs['format'] = 'yang'
+        if 'in_format' in varnames:
+            kwargs['in_format'] = 'yang'
+        with self.lock:
+            module_statement = self.context.add_module(**kwargs)
+            if module_statement is None:
+                dependencies = set()
+            else:
+                dependencies = \
+                    self.context.update_dependencies(module_statement)
+            self.downloaded.add(module)
+            self.revisions[module] = revision
+            self.append_revision(module, revision)
+            if digest is not None:
+                self.digests[module] = digest
+            s = set(m for m in dependencies - self.to_be_downloaded
+                    if not self.is_current(m))
+            if s:
+                logger.info('{} requires submodules: {}'
+                            .format(module, ', '.join(s)))
+                self.to_be_downloaded.update(s)
+                for m in s:
+                    self.download_queue.put(m)
+
+
+class ModelCompiler(object):
+    '''ModelCompiler
+
+    Abstraction of a YANG file compiler.
+
+    Attributes
+    ----------
+    dir_yang : `str`
+        Path to yang files.
+
+    dependencies : `Element`
+        Dependency infomation stored in an Element object.
+
+    context : `CompilerContext`
+        A CompilerContext object that holds the context of all modules.
+
+    module_prefixes : `dict`
+        A dictionary that stores module prefixes. It is keyed by module names.
+
+    module_namespaces : `dict`
+        A dictionary that stores module namespaces. It is keyed by module
+        names.
+
+    identity_deps : `dict`
+        A dictionary that stores module identities. It is keyed by bases.
+
+    pyang_errors : `list`
+        A list of tuples. Each tuple contains a pyang error.Position object,
+        an error tag and a tuple of some error arguments. It is possible to
+        call pyang.error.err_to_str() to print out detailed error messages.
+
+    store : `ModuleStore`
+        A ModuleStore instance shared by devices, or None. When it is given,
+        compiled models are shared by all folders having the same dependency
+        closure.
+    '''
+
+    def __init__(self, folder, store=None):
+        '''
+        __init__ instantiates a ModelCompiler instance.
+        '''
+
+        self.dir_yang = os.path.abspath(folder)
+        self.store = store
+        self.context = None
+        self.module_prefixes = {}
+        self.module_namespaces = {}
+        self.identity_deps = {}
+        self.build_dependencies()
+
+    @property
+    def pyang_errors(self):
+        if self.context is None:
+            return []
+        else:
+            return self.context.errors
+
+    def _read_from_cache(self, name):
+        cached_name = os.path.join(self.dir_yang, name + ".xml")
+        cached_tree = read_xml(cached_name)
+        if cached_tree is None and self.store is not None:
+            if self.store.get_compiled(self.cache_key(name), cached_name):
+                cached_tree = read_xml(cached_name)
+        return cached_tree
+
+    def _write_to_cache(self, name, element):
+        cached_name = os.path.join(self.dir_yang, name + ".xml")
+        # the file may be linked to a module store
+        if os.path.lexists(cached_name):
+            os.remove(cached_name)
+        write_xml(cached_name, element)
+        if self.store is not None:
+            self.store.put_compiled(self.cache_key(name), cached_name)
+
+    def cache_key(self, module):
+        '''cache_key
+
+        High-level api: Compute a key of the compiled model of a module. The
+        key is SHA-256 of the content of all YANG files the compilation reads,
+        i.e., the module, its imports and depends, and their imports and
+        includes recursively.
+
+        Parameters
+        ----------
+
+        module : `str`
+            Module name.
+
+        Returns
+        -------
+
+        str
+            A hex digest of SHA-256.
+        '''
+
+        imports, depends = self.get_dependencies(module)
+        modules = self.context.required_modules(imports | depends | {module})
+        lines = [module, pyang.__version__]
+        for m in sorted(modules):
+            modulefile = os.path.join(self.dir_yang, m + '.yang')
+            if os.path.isfile(modulefile):
+                with open(modulefile, 'rb') as f:
+                    lines.append('{} {}'.format(m, ModuleStore.digest(f.read())))
+        return ModuleStore.digest('\n'.join(lines))
+
+    def build_dependencies(self):
+        '''build_dependencies
+
+        High-level api: Briefly compile all yang files and find out dependency
+        infomation of all modules.
+
+        Returns
+        -------
+
+        None
+            Nothing returns.
+        '''
+
+        if self.context is None:
+            repo = FileRepository(path=self.dir_yang)
+            self.context = CompilerContext(repository=repo)
+        if self.context.dependencies is None:
+            self.context.read_dependencies()
+            if self.context.dependencies is None:
+                self.context.load_context()
+
+    def get_dependencies(self, module):
+        '''get_dependencies
+
+        High-level api: Get dependency infomationa of a module.
+
+        Parameters
+        ----------
+
+        module : `str`
+            Module name that is inquired about.
+
+        Returns
+        -------
+
+        tuple
+            A tuple with two elements: a set of imports and a set of depends.
+        '''
+
+        if self.context is None or self.context.dependencies is None:
+            self.build_dependencies()
+        dependencies = self.context.dependencies
+
+        imports = set()
+        for m in list(filter(lambda i: i.get('id') == module,
+                             dependencies.findall('./module'))):
+            imports.update(set(i.get('module')
+                               for i in m.findall('./imports/import')))
+        depends = set()
+        for m in dependencies:
+            if list(filter(lambda i: i.get('module') == module,
+                           m.findall('./imports/import'))):
+                depends.add(m.get('id'))
+            if list(filter(lambda i: i.get('module') == module,
+                           m.findall('./includes/include'))):
+                depends.add(m.get('id'))
+        return (imports, depends)
+
+    def compile(self, module):
+        '''compile
+
+        High-level api: Compile a module. The module cannot be a submodule.
+
+        Parameters
+        ----------
+
+        module : `str`
+            Module name that is inquired about.
+
+        Returns
+        -------
+
+        Model
+            A Model object.
+        '''
+        cached_tree = self._read_from_cache(module)
+
+        if cached_tree is not None:
+            return Model(cached_tree)
+
+        varnames = Context.add_module.__code__.co_varnames
+        imports, depends = self.get_dependencies(module)
+        required_module_set = imports | depends
+        required_module_set.add(module)
+        self.context.internal_reset()
+        for m in required_module_set:
+            modulefile = os.path.join(self.context.repository.dirs[0],
+                                      m + '.yang')
+            if os.path.isfile(modulefile):
+                with open(modulefile, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                kwargs = {
+                    'ref': modulefile,
+                    'text': text,
+                }
+                if 'primary_module' in varnames:
+                    kwargs['primary_module'] = True
+                if 'format' in varnames:
+                    kwargs['format'] = 'yang'
+                if 'in_format' in varnames:
+                    kwargs['in_format'] = 'yang'
+                self.context.add_module(**kwargs)
+        self.context.validate_context()
+        vm = self.context.get_module(module)
+        st = etree.Element(vm.arg)
+        st.set('type', vm.keyword)
+        statement = vm.search_one('prefix')
+        if statement is None:
+            raise ValueError("Module '{}' is a {} which belongs to '{}'. "
+                             "Please compile '{}' instead."
+                             .format(module, vm.keyword,
+                                     vm.i_including_modulename,
+                                     vm.i_including_modulename))
+        else:
+            st.set('prefix', statement.arg)
+
+        for m_statement in self.context.modules.values():
+            if m_statement.keyword == 'module':
+                namespace = etree.SubElement(st, 'namespace')
+                namespace.set('prefix', m_statement.i_prefix)
+                statement = m_statement.search_one('namespace')
+                if statement is not None:
+                    namespace.text = statement.arg
+                    self.module_namespaces[m_statement.i_modulename] = \
+                        statement.arg
+                    etree.register_namespace(
+                        m_statement.i_prefix, statement.arg)
+
+                # prepare self.module_prefixes
+                self.module_prefixes[m_statement.i_modulename] = \
+                    m_statement.i_prefix
+
+                # prepare self.identity_deps
+                for idn in m_statement.i_identities.values():
+                    curr_idn = m_statement.arg + ':' + idn.arg
+                    base_idn = idn.search_one("base")
+                    if base_idn is None:
+                        # identity does not have a base
+                        self.identity_deps.setdefault(curr_idn, [])
+                    else:
+                        # identity has a base
+                        base_idns = base_idn.arg.split(':')
+                        if len(base_idns) > 1:
+                            # base is located in another module
+                            mn = m_statement.i_prefixes.get(base_idns[0])
+                            b_idn = base_idns[1] if mn is None \
+                                else mn[0] + ':' + base_idns[1]
+                        else:
+                            b_idn = module + ':' + base_idn.arg
+                        if self.identity_deps.get(b_idn) is None:
+                            self.identity_deps.setdefault(b_idn, [])
+                        else:
+                            self.identity_deps[b_idn].append(curr_idn)
+
+        for child in vm.i_children:
+            if child.keyword in statements.data_definition_keywords:
+                self.depict_a_schema_node(vm, st, child)
+        for child in vm.i_children:
+            if child.keyword == 'rpc':
+                self.depict_a_schema_node(vm, st, child, mode='rpc')
+        for child in vm.i_children:
+            if child.keyword == 'notification':
+                self.depict_a_schema_node(vm, st, child, mode='notification')
+
+        self._write_to_cache(module, st)
+
+        return Model(st)
+
+    def depict_a_schema_node(self, module, parent, child, mode=None):
+        n = etree.SubElement(
+            parent, '{' +
+            self.module_namespaces[child.i_module.i_modulename] +
+            '}' + child.arg)
+        self.set_access(child, n, mode)
+        n.set('type', child.keyword)
+        sm = child.search_one('status')
+        if sm is not None and sm.arg in ['deprecated', 'obsolete']:
+            n.set('status', sm.arg)
+        sm = child.search('default')
+        if sm is not None and len(sm) > 0:
+            n.set('default', ",".join(map(lambda x: x.arg, sm)))
+        if child.keyword == 'list':
+            sm = child.search_one('key')
+            if sm is not None:
+                n.set('key', sm.arg)
+            sm = child.search_one('ordered-by')
+            if sm is not None and sm.arg == 'user':
+                n.set('ordered-by', 'user')
+        elif child.keyword == 'container':
+            sm = child.search_one('presence')
+            if sm is not None:
+                n.set('presence', 'true')
+        elif child.keyword == 'choice':
+            sm = child.search_one('mandatory')
+            if sm is not None and sm.arg == 'true':
+                n.set('mandatory', 'true')
+            cases = [c.arg for c in child.search('case')]
+            if cases:
+                n.set('values', '|'.join(cases))
+        elif child.keyword in ['leaf', 'leaf-list']:
+            self.set_leaf_datatype_value(child, n)
+            sm = child.search_one('mandatory')
+            if (
+                sm is not None and sm.arg == 'true' or
+                hasattr(child, 'i_is_key')
+            ):
+                n.set('mandatory', 'true')
+
+            if hasattr(child, 'i_is_key'):
+                n.set('is_key', 'true')
+
+            if child.keyword == 'leaf-list':
+                sm = child.search_one('ordered-by')
+                if sm is not None and sm.arg == 'user':
+                    n.set('ordered-by', 'user')
+
+        # Tailf annotations
+        for ch in child.substmts:
+            if (
+                isinstance(ch.keyword, tuple) and
+                'tailf' in ch.keyword[0]
+            ):
+                if (
+                    ch.keyword[0] in self.module_namespaces and
+                    len(ch.keyword) == 2
+                ):
+                    n.set(
+                        etree.QName(self.module_namespaces[ch.keyword[0]],
+                                    ch.keyword[1]),
+                        ch.arg if ch.arg else '',
+                    )
+                else:
+                    logger.warning("Special Tailf annotation at {}, "
+                                   "keyword = {}"
+                                   .format(ch.pos, ch.keyword))
+
+        featurenames = [f.arg for f in child.search('if-feature')]
+        if hasattr(child, 'i_augment'):
+            featurenames.extend([
+                f.arg for f in child.i_augment.search('if-feature')
+                if f.arg not in featurenames
+            ])
+        if featurenames:
+            n.set('if-feature', ' '.join(featurenames))
+
+        if hasattr(child, 'i_children'):
+            for c in child.i_children:
+                if mode == 'rpc' and c.keyword in ['input', 'output']:
+                    self.depict_a_schema_node(module, n, c, mode=c.keyword)
+                else:
+                    self.depict_a_schema_node(module, n, c, mode=mode)
+
+    @staticmethod
+    def set_access(statement, node, mode):
+        if (
+            mode in ['input', 'rpc'] or
+            statement.keyword == 'rpc' or
+            statement.keyword == ('tailf-common', 'action')
+        ):
+            node.set('access', 'write')
+        elif (
+            mode in ['output', 'notification'] or
+            statement.keyword == 'notification'
+        ):
+            node.set('access', 'read-only')
+        elif hasattr(statement, 'i_config') and statement.i_config:
+            node.set('access', 'read-write')
+        else:
+            node.set('access', 'read-only')
+
+    def set_leaf_datatype_value(self, leaf_statement, leaf_node):
+        sm = leaf_statement.search_one('type')
+        if sm is None:
+            datatype = ''
+        else:
+            if sm.arg == 'leafref':
+                p = sm.search_one('path')
+                if p is not None:
+                    # Try to make the path as compact as possible.
+                    # Remove local prefixes, and only use prefix when
+                    # there is a module change in the path.
+                    target = []
+                    curprefix = leaf_statement.i_module.i_prefix
+                    for name in p.arg.split('/'):
+                        if name.find(":") == -1:
+                            prefix = curprefix
+                        else:
+                            [prefix, name] = name.split(':', 1)
+                        if prefix == curprefix:
+                            target.append(name)
+                        else:
+                            target.append(prefix + ':' + name)
+                            curprefix = prefix
+                    datatype = "-> %s" % "/".join(target)
+                else:
+                    datatype = sm.arg
+            elif sm.arg == 'identityref':
+                idn_base = sm.search_one('base')
+                datatype = sm.arg + ":" + idn_base.arg
+            else:
+                datatype = sm.arg
+            leaf_node.set('datatype', datatype)
+
+            type_values = self.type_values(sm)
+            if type_values:
+                leaf_node.set('values', type_values)
+            if sm.arg == 'union':
+                leaf_node.set(
+                    'unionmembertypes',
+                    '|'.join([m.arg for m in sm.search('type')])
+                )
+
+    def type_values(self, type_statement):
+        if type_statement is None:
+            return ''
+        if (
+            type_statement.i_is_derived is False and
+            type_statement.i_typedef is not None
+        ):
+            return self.type_values(
+                type_statement.i_typedef.search_one('type'))
+        if type_statement.arg == 'boolean':
+            return 'true|false'
+        if type_statement.arg == 'union':
+            return self.type_union_values(type_statement)
+        if type_statement.arg == 'enumeration':
+            return '|'.join([e.arg for e in type_statement.search('enum')])
+        if type_statement.arg == 'identityref':
+            return self.type_identityref_values(type_statement)
+        return ''
+
+    def type_union_values(self, type_statement):
+        vlist = []
+        for type in type_statement.search('type'):
+            v = self.type_values(type)
+            if v:
+                vlist.append(v)
+        return '|'.join(vlist)
+
+    def type_identityref_values(self, type_statement):
+        base_idn = type_statement.search_one('base')
+        if base_idn:
+            # identity has a base
+            base_idns = base_idn.arg.split(':')
+            my_modulename = type_statement.i_module.i_modulename
+            if len(base_idns) > 1:
+                modulename = \
+                    type_statement.i_module.i_prefixes.get(base_idns[0])
+                if modulename is None:
+                    return ''
+                else:
+                    idn_key = modulename[0] + ':' + base_idns[1]
+            else:
+                idn_key = my_modulename + ':' + base_idn.arg
+
+            value_stmts = []
+            values = self.identity_deps.get(idn_key, [])
+            for value in values:
+                ids = value.split(':')
+                value_stmts.append(self.module_prefixes[ids[0]] + ':' + ids[1])
+            if values:
+                return '|'.join(value_stmts)
+        return ''
@@ -107,6 +107,11 @@ class Composer(object):
         else:
             ret = re.search(Tag.BRACE[0], self.path[0])
             if ret:
+                if (
+                    self.device.auto_load_model(ret.group(1)) is not None and
+                    self.path[0] in self.device.roots
+                ):
+                    return self.device.roots[self.path[0]]
                 url_to_name = {i[2]: i[0] for i in self.device.namespaces
                                if i[1] is not None}
                 if ret.group(1) in url_to_name:
@@ -123,7 +128,8 @@ class Composer(object):
 
     @property
     def model_ns(self):
-        return self.device.models[self.model_name].url
+        model_name = self.model_name
+        return self.device.models[model_name].url
 
     @property
     def is_config(self):
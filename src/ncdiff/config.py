@@ -1,5 +1,7 @@
 import re
+import json
 import random
+import hashlib
 import pprint
 import logging
 from lxml import etree
@@ -7,10 +9,14 @@ from copy import deepcopy
 from ncclient import operations, xml_
 
 from .model import ModelDiff
-from .errors import ConfigError, ModelMissing, ModelIncompatible
-from .netconf import NetconfParser, NetconfCalculator
-from .composer import Composer
+from .errors import ConfigError, ConfigDeltaError, ModelMissing, \
+    ModelIncompatible
+from .netconf import NetconfParser, NetconfCalculator, NetconfChunker
+from .composer import Composer, Tag
 from .calculator import BaseCalculator
+from .stats import stats_phase
+from .cache import cached_xpath
+from .ref import IdentityRef, InstanceIdentifier
 
 # create a logger for this module
 logger = logging.getLogger(__name__)
@@ -25,11 +31,104 @@ value_tag = '{' + yang_url + '}value'
 insert_tag = '{' + yang_url + '}insert'
 
 
+def _leaf_digest(tag, text):
+    # digest of a node without children, see Config._node_digest()
+    h = hashlib.sha256(tag.encode('utf-8'))
+    h.update(b'\x00')
+    h.update((text or '').encode('utf-8'))
+    return h.digest()
+
+
+def _inner_digest(tag, unordered, ordered):
+    # digest of a node from digests of its children, see
+    # Config._node_digest()
+    h = hashlib.sha256(tag.encode('utf-8'))
+    h.update(b'\x01')
+    for digest in sorted(unordered):
+        h.update(digest)
+    for child_tag in sorted(ordered):
+        h.update(b'\x02' + child_tag.encode('utf-8') + b'\x00')
+        for digest in ordered[child_tag]:
+            h.update(digest)
+    return h.digest()
+
+
 def _cmperror(x, y):
     raise TypeError("can't compare '%s' to '%s'" % (
                     type(x).__name__, type(y).__name__))
 
 
+class _ChunkSink(object):
+    '''_ChunkSink
+
+    A file-like object that collects the output of an lxml xmlfile writer
+    until it is consumed.
+    '''
+
+    def __init__(self):
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+
+    def pop(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        self.size = 0
+        return data
+
+
+def _write_node(xf, sink, node, parent_nsmap, pretty, level, chunk_size):
+    nsmap = {k: v for k, v in node.nsmap.items()
+             if parent_nsmap.get(k) != v}
+    with xf.element(node.tag, attrib=dict(node.attrib), nsmap=nsmap):
+        if node.text and (len(node) == 0 or node.text.strip()):
+            xf.write(node.text)
+        for child in node:
+            if pretty:
+                xf.write('\n' + '  '*(level+1))
+            if isinstance(child.tag, str):
+                yield from _write_node(xf, sink, child, node.nsmap,
+                                       pretty, level+1, chunk_size)
+                if child.tail and child.tail.strip():
+                    xf.write(child.tail)
+            else:
+                # comments and processing instructions are written as is
+                xf.write(child)
+        if pretty and len(node) > 0:
+            xf.write('\n' + '  '*level)
+    if sink.size >= chunk_size:
+        yield sink.pop()
+
+
+def _iter_xml(ele, pretty, chunk_size):
+    if not isinstance(chunk_size, int) or chunk_size <= 0:
+        raise ValueError("argument 'chunk_size' must be a positive integer, "
+                         "but not {} '{}'"
+                         .format(type(chunk_size), chunk_size))
+    return _xml_chunks(ele, pretty, chunk_size)
+
+
+def _xml_chunks(ele, pretty, chunk_size):
+    sink = _ChunkSink()
+    with etree.xmlfile(sink, encoding='utf-8', buffered=False) as xf:
+        yield from _write_node(xf, sink, ele, {}, pretty, 0, chunk_size)
+    if pretty:
+        sink.write(b'\n')
+    if sink.size > 0:
+        yield sink.pop()
+
+
+def _write_chunks(chunks, fileobj):
+    size = 0
+    for chunk in chunks:
+        fileobj.write(chunk)
+        size += len(chunk)
+    return size
+
+
 class Config(object):
     '''Config
 
@@ -57,6 +156,24 @@ class Config(object):
     roots : `dict`
         A dictionary of roots of self.ele. Dictionary keys are tags of roots in
         `{url}tagname` notation, and values are corresponding model names.
+
+    digest : `str`
+        A schema-aware SHA-256 digest of the config. Equal digests mean equal
+        configs: == and != compare digests, and configs can be used in sets
+        and as dict keys. Only tags and values are covered, so XML attributes
+        like nc:operation and whitespace between nodes are ignored, and a
+        node without text equals a node with empty text. The <, <=, > and >=
+        comparisons still compare attributes.
+
+    canonical : `Element`
+        A copy of the config in canonical form: defaults are stripped,
+        instances of system-ordered lists and leaf-lists are sorted by keys,
+        and identityref and instance-identifier values are in the notation of
+        IdentityRef.default.
+
+    c14n : `bytes`
+        Canonical XML (C14N) of canonical. Two configs are equal if and only
+        if their c14n are equal.
     '''
 
     def __init__(self, ncdevice, config=None, validate=True,
@@ -163,16 +280,21 @@ class Config(object):
 
     def __eq__(self, other):
         if isinstance(other, Config):
-            return BaseCalculator(self.device, self.ele, other.ele).eq
+            return self._node_digest(self.ele, None) == \
+                   other._node_digest(other.ele, None)
         else:
             _cmperror(self, other)
 
     def __ne__(self, other):
         if isinstance(other, Config):
-            return BaseCalculator(self.device, self.ele, other.ele).ne
+            return self._node_digest(self.ele, None) != \
+                   other._node_digest(other.ele, None)
         else:
             _cmperror(self, other)
 
+    def __hash__(self):
+        return hash(self._node_digest(self.ele, None))
+
     @property
     def xml(self):
         return etree.tostring(self.ele,
@@ -183,6 +305,21 @@ class Config(object):
     def ns(self):
         return self.device._get_ns(self.ele)
 
+    @property
+    def digest(self):
+        return self._node_digest(self.ele, None).hex()
+
+    @property
+    def canonical(self):
+        ele = etree.Element(config_tag, nsmap={'nc': nc_url})
+        self._canonical_children(self.ele, None, ele)
+        self._trim_defaults(ele)
+        return ele
+
+    @property
+    def c14n(self):
+        return etree.tostring(self.canonical, method='c14n')
+
     @property
     def models(self):
         return sorted(list(set([v for k, v in self.roots.items()])))
@@ -198,6 +335,12 @@ class Config(object):
                 if not ret:
                     raise ConfigError("unknown root including URL '{}'"
                                       .format(child.tag))
+                if (
+                    self.device.auto_load_model(ret.group(1)) is not None and
+                    child.tag in self.device.roots
+                ):
+                    roots[child.tag] = self.device.roots[child.tag]
+                    continue
                 url_to_name = {i[2]: i[0] for i in self.device.namespaces
                                if i[1] is not None}
                 if ret.group(1) in url_to_name:
@@ -263,7 +406,11 @@ class Config(object):
             There is no return of this method.
         '''
 
-        self._trim_defaults(self.ele)
+        stats = self.device.stats
+        with stats_phase(stats, 'trim'):
+            if stats is not None:
+                stats.tree_size(self.ele)
+            self._trim_defaults(self.ele)
 
     def validate_config(self):
         '''validate_config
@@ -284,8 +431,9 @@ class Config(object):
             If config contains error.
         '''
 
-        self.roots
-        self._validate_node(self.ele)
+        with stats_phase(self.device.stats, 'validate'):
+            self.roots
+            self._validate_node(self.ele)
 
     def ns_help(self):
         '''ns_help
@@ -301,11 +449,67 @@ class Config(object):
 
         pprint.pprint(self.ns)
 
+    def iterxml(self, pretty=False, chunk_size=65536):
+        '''iterxml
+
+        High-level api: Serialize the config incrementally and yield UTF-8
+        encoded chunks, so a full copy of the XML string is never held in
+        memory.
+
+        Parameters
+        ----------
+
+        pretty : `bool`
+            True if the output is pretty-printed.
+
+        chunk_size : `int`
+            Approximate size of each chunk in bytes. A chunk is yielded once
+            the buffered output reaches this size.
+
+        Returns
+        -------
+
+        generator
+            A generator of bytes.
+        '''
+
+        return _iter_xml(self.ele, pretty, chunk_size)
+
+    def write(self, fileobj, pretty=False, chunk_size=65536):
+        '''write
+
+        High-level api: Serialize the config incrementally to a file-like
+        object, for example, a file opened in binary mode or a socket file
+        from socket.makefile('wb').
+
+        Parameters
+        ----------
+
+        fileobj : `object`
+            A file-like object that has a write() method accepting bytes.
+
+        pretty : `bool`
+            True if the output is pretty-printed.
+
+        chunk_size : `int`
+            Approximate size of each write() call in bytes.
+
+        Returns
+        -------
+
+        int
+            Number of bytes written.
+        '''
+
+        return _write_chunks(
+            self.iterxml(pretty=pretty, chunk_size=chunk_size), fileobj)
+
     def xpath(self, *args, **kwargs):
         '''xpath
 
         High-level api: It is a wrapper of xpath method in lxml package. If
-        namespaces is not given, self.ns is used by default.
+        namespaces is not given, self.ns is used by default. Compiled
+        expressions are cached in the xpath_cache of the device.
 
         Returns
         -------
@@ -315,15 +519,17 @@ class Config(object):
         '''
 
         if 'namespaces' not in kwargs:
-            kwargs['namespaces'] = {i[1]: i[2] for i in self.device.namespaces
-                                    if i[1] is not None}
-        return self.ele.xpath(*args, **kwargs)
+            kwargs['namespaces'] = self.device.prefixes
+        return cached_xpath(getattr(self.device, 'xpath_cache', None),
+                            self.ele, args, kwargs)
 
     def filter(self, *args, **kwargs):
         '''filter
 
         High-level api: Filter the config using xpath method. If namespaces is
-        not given, self.ns is used by default.
+        not given, self.ns is used by default. Only matched subtrees and their
+        ancestors, including keys of list ancestors, are copied to the new
+        Config instance.
 
         Returns
         -------
@@ -333,22 +539,290 @@ class Config(object):
             filter xpath expression.
         '''
 
+        results = self.xpath(*args, **kwargs)
+        config = type(self)(self.device, validate=False,
+                            remove_deprecated=self.remove_deprecated)
+        if not isinstance(results, list):
+            config.ele = deepcopy(self.ele)
+            return config
+        filtrates = set(n for n in results if etree.iselement(n))
+        if not filtrates:
+            return config
+        if self.ele in filtrates:
+            config.ele = deepcopy(self.ele)
+            return config
+
+        # ancestors of filtrates, skipping filtrates inside other filtrates
         ancestors = set()
-        filtrates = set()
-        config = type(self)(self.device,  deepcopy(self.ele))
-        results = config.xpath(*args, **kwargs)
-        if isinstance(results, list):
-            for node in results:
-                if etree.iselement(node):
-                    ancestors |= set(list(node.iterancestors()))
-                    filtrates.add(node)
-            if filtrates:
-                config._node_filter(config.ele, ancestors, filtrates)
-            else:
-                config.ele = etree.Element(config_tag, nsmap={'nc': nc_url})
+        for node in filtrates:
+            spine = []
+            for ancestor in node.iterancestors():
+                if ancestor in filtrates:
+                    spine = []
+                    break
+                if ancestor in ancestors:
+                    break
+                spine.append(ancestor)
+            ancestors.update(spine)
+        config.ele = self._copy_spine(self.ele, None, ancestors, filtrates)
         return config
 
-    def _trim_defaults(self, node):
+    def _copy_spine(self, node, parent, ancestors, filtrates):
+        '''_copy_spine
+
+        Low-level api: Copy a node which is an ancestor of filtrates, and copy
+        its children that are filtrates, ancestors of filtrates, or keys when
+        the node is a list. This is a recursive method.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A node to be copied.
+
+        parent : `Element`
+            The copy of the parent node, or None if node is the config root.
+
+        ancestors : `set`
+            A set of ancestors of filtrates.
+
+        filtrates : `set`
+            A set of filtrates which are result of xpath evaluation.
+
+        Returns
+        -------
+
+        Element
+            The copy of the node.
+        '''
+
+        if parent is None:
+            copy = etree.Element(node.tag, node.attrib, nsmap=node.nsmap)
+        else:
+            nsmap = {k: v for k, v in node.nsmap.items()
+                     if parent.nsmap.get(k) != v}
+            copy = etree.SubElement(parent, node.tag, node.attrib,
+                                    nsmap=nsmap)
+        copy.text = node.text
+        copy.tail = node.tail
+        keys = ()
+        if node.tag != config_tag:
+            record = self.device.get_schema_record(node)
+            if record.type == 'list':
+                keys = record.keys
+        for child in node:
+            if child in filtrates or child.tag in keys:
+                copy.append(deepcopy(child))
+            elif child in ancestors:
+                self._copy_spine(child, copy, ancestors, filtrates)
+        return copy
+
+    def _node_digest(self, node, record, visit=None, digests=None):
+        '''_node_digest
+
+        Low-level api: Compute a Merkle digest of a node. Digests of children
+        are sorted, except instances of user-ordered lists and leaf-lists,
+        which keep their order, so the digest does not depend on the order of
+        siblings or namespace prefixes, including prefixes in identityref and
+        instance-identifier values. This is a recursive method.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A config node.
+
+        record : `SchemaNode`
+            The SchemaNode record of node, or None if node is the config root.
+
+        visit : `callable`
+            If it is not None, it is called as visit(node, record, digest)
+            for each node after its children, e.g., to collect digests of
+            all subtrees.
+
+        digests : `dict`
+            Digests of subtrees known already, keyed by nodes. A node found in
+            it is not computed again, and visit is not called for it.
+
+        Returns
+        -------
+
+        bytes
+            A SHA-256 digest.
+        '''
+
+        if digests is not None:
+            digest = digests.get(node)
+            if digest is not None:
+                return digest
+        if len(node) == 0:
+            digest = _leaf_digest(node.tag, self._canonical_text(node, record))
+            if visit is not None:
+                visit(node, record, digest)
+            return digest
+
+        unordered = []
+        ordered = {}
+        # siblings of the same tag share a schema node
+        records = {} if record is None else record.children
+        for child in node:
+            if not isinstance(child.tag, str):
+                continue
+            child_record = records.get(child.tag)
+            if child_record is None:
+                child_record = self.device.get_schema_record(child)
+                if record is None:
+                    records[child.tag] = child_record
+            digest = self._node_digest(child, child_record, visit, digests)
+            if child_record.user_ordered:
+                ordered.setdefault(child.tag, []).append(digest)
+            else:
+                unordered.append(digest)
+        digest = _inner_digest(node.tag, unordered, ordered)
+        if visit is not None:
+            visit(node, record, digest)
+        return digest
+
+    def _canonical_ref(self, node, record):
+        '''_canonical_ref
+
+        Low-level api: Return an IdentityRef or InstanceIdentifier instance if
+        the node is of type identityref or instance-identifier.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A config node.
+
+        record : `SchemaNode`
+            The SchemaNode record of node.
+
+        Returns
+        -------
+
+        IdentityRef
+            An IdentityRef or InstanceIdentifier instance, or None if the
+            node has no value or is of another type.
+        '''
+
+        if node.text is None or record is None or record.datatype is None:
+            return None
+        if record.datatype[:11] == 'identityref':
+            return IdentityRef(self.device, node)
+        elif record.datatype == 'instance-identifier':
+            return InstanceIdentifier(self.device, node)
+        return None
+
+    def _canonical_text(self, node, record):
+        '''_canonical_text
+
+        Low-level api: Return the text value of a node in canonical form.
+        Values of identityref and instance-identifier are converted to the
+        notation of IdentityRef.default, and whitespace in containers is
+        ignored.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A config node.
+
+        record : `SchemaNode`
+            The SchemaNode record of node, or None if node is the config root.
+
+        Returns
+        -------
+
+        str
+            The text value in canonical form, or None if there is no value.
+        '''
+
+        if record is None:
+            return node.text
+        if record.type == 'container':
+            return None
+        ref = self._canonical_ref(node, record)
+        if ref is None:
+            return node.text
+        return ref.default
+
+    def _canonical_children(self, node, record, parent):
+        '''_canonical_children
+
+        Low-level api: Copy children of a node to parent in canonical form.
+        Children are sorted by tags, and instances of a system-ordered list or
+        leaf-list are sorted by their keys in canonical form, while instances
+        of a user-ordered list or leaf-list keep their order. Each node
+        declares the default namespace when its namespace differs from its
+        parent, and the prefixes used in identityref and instance-identifier
+        values are declared by model names. This is a recursive method.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A config node.
+
+        record : `SchemaNode`
+            The SchemaNode record of node, or None if node is the config root.
+
+        parent : `Element`
+            A node in the canonical tree that receives the copies.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        entries = []
+        for index, child in enumerate(node):
+            if not isinstance(child.tag, str):
+                continue
+            child_record = None
+            if record is not None:
+                child_record = record.children.get(child.tag)
+            if child_record is None:
+                child_record = self.device.get_schema_record(child)
+            if child_record.user_ordered:
+                key = ()
+            elif child_record.type == 'list':
+                key = []
+                for tag in child_record.keys:
+                    key_node = child.find(tag)
+                    if key_node is None:
+                        key.append('')
+                    else:
+                        key.append(self._canonical_text(
+                            key_node, child_record.children.get(tag)) or '')
+                key = tuple(key)
+            elif child_record.type == 'leaf-list':
+                key = (self._canonical_text(child, child_record) or '',)
+            else:
+                key = ()
+            entries.append((child.tag, key, index, child, child_record))
+        entries.sort(key=lambda e: e[:3])
+
+        parent_url = etree.QName(parent).namespace
+        for tag, key, index, child, child_record in entries:
+            url = etree.QName(tag).namespace
+            nsmap = {} if url == parent_url else {None: url}
+            text = None
+            if len(child) == 0:
+                ref = self._canonical_ref(child, child_record)
+                if ref is None:
+                    text = self._canonical_text(child, child_record)
+                else:
+                    text = ref.default
+                    nsmap.update({k: v for k, v in ref.default_ns.items()
+                                  if k is not None})
+            copy = etree.SubElement(parent, tag, nsmap=nsmap or None)
+            copy.text = text
+            self._canonical_children(child, child_record, copy)
+
+    def _trim_defaults(self, node, children=None):
         '''_trim_defaults
 
         Low-level api: Trim default values in config. This is a recursive
@@ -360,6 +834,10 @@ class Config(object):
         node : `Element`
             A node to be processed.
 
+        children : `list`
+            Children of node to be processed, or None if all of them are
+            processed.
+
         Returns
         -------
 
@@ -367,8 +845,10 @@ class Config(object):
             There is no return of this method.
         '''
 
+        if self.device.stats is not None:
+            self.device.stats.visit('trim', len(node))
         leaf_list_defaults = {}
-        for child in node:
+        for child in (node if children is None else children):
 
             child_schema_node = self.device.get_schema_node(child)
             if child_schema_node is None:
@@ -474,6 +954,8 @@ class Config(object):
                                       "attribute '{}': {}"
                                       .format(tag, self.device.get_xpath(node)))
 
+        if self.device.stats is not None:
+            self.device.stats.visit('validate', len(node))
         for child in node:
 
             child_schema_node = self.device.get_schema_node(child)
@@ -513,59 +995,6 @@ class Config(object):
             ):
                 node.remove(child)
 
-    def _node_filter(self, node, ancestors, filtrates):
-        '''_node_filter
-
-        Low-level api: Remove unrelated nodes in config. This is a recursive
-        method.
-
-        Parameters
-        ----------
-
-        node : `Element`
-            A node to be processed.
-
-        ancestors : `list`
-            A list of ancestors of filtrates.
-
-        filtrates : `list`
-            A list of filtrates which are result of xpath evaluation.
-
-        Returns
-        -------
-
-        None
-            There is no return of this method.
-        '''
-
-        if node in filtrates:
-            return
-        elif node in ancestors:
-            if node.tag != config_tag:
-                s_node = self.get_schema_node(node)
-            if (
-                node.tag != config_tag and
-                s_node.get('type') == 'list'
-            ):
-                for child in node.getchildren():
-                    s_node = self.get_schema_node(child)
-                    if s_node.get('is_key') or child in filtrates:
-                        continue
-                    elif child in ancestors:
-                        self._node_filter(child, ancestors, filtrates)
-                    else:
-                        node.remove(child)
-            else:
-                for child in node.getchildren():
-                    if child in filtrates:
-                        continue
-                    elif child in ancestors:
-                        self._node_filter(child, ancestors, filtrates)
-                    else:
-                        node.remove(child)
-        else:
-            node.getparent().remove(node)
-
 
 class ConfigDelta(object):
     '''ConfigDelta
@@ -850,6 +1279,418 @@ class ConfigDelta(object):
             for child in node:
                 self.reorder(child, seed, depth, current_depth + 1)
 
+    def iterxml(self, pretty=False, chunk_size=65536):
+        '''iterxml
+
+        High-level api: Serialize the Netconf presentation of the delta
+        incrementally and yield UTF-8 encoded chunks, so a full copy of the
+        XML string is never held in memory.
+
+        Parameters
+        ----------
+
+        pretty : `bool`
+            True if the output is pretty-printed.
+
+        chunk_size : `int`
+            Approximate size of each chunk in bytes. A chunk is yielded once
+            the buffered output reaches this size.
+
+        Returns
+        -------
+
+        generator
+            A generator of bytes.
+        '''
+
+        return _iter_xml(self.nc, pretty, chunk_size)
+
+    def write(self, fileobj, pretty=False, chunk_size=65536):
+        '''write
+
+        High-level api: Serialize the Netconf presentation of the delta
+        incrementally to a file-like object, for example, a file opened in
+        binary mode or a socket file from socket.makefile('wb').
+
+        Parameters
+        ----------
+
+        fileobj : `object`
+            A file-like object that has a write() method accepting bytes.
+
+        pretty : `bool`
+            True if the output is pretty-printed.
+
+        chunk_size : `int`
+            Approximate size of each write() call in bytes.
+
+        Returns
+        -------
+
+        int
+            Number of bytes written.
+        '''
+
+        return _write_chunks(
+            self.iterxml(pretty=pretty, chunk_size=chunk_size), fileobj)
+
+    def changes(self, type=Tag.XPATH):
+        '''changes
+
+        High-level api: Yield the changes from config_src to config_dst as
+        ChangeRecord instances, i.e., (xpath, kind, old_value, new_value,
+        schema_type) tuples, without building the Netconf presentation.
+
+        Parameters
+        ----------
+
+        type : `tuple`
+            A tuple constant defined in yang.ncdiff.Tag, which is the notation
+            of xpaths in records. Most commonly it could be Tag.XPATH or
+            Tag.LXML_XPATH.
+
+        Returns
+        -------
+
+        generator
+            A generator of ChangeRecord instances.
+
+
+        Code Example::
+
+            >>> for record in delta.changes():
+            ...     print(record.xpath, record.kind, record.new_value)
+            ...
+            /oc-if:interfaces/interface[name="GigabitEthernet0/0"]/config/description modify TEST
+            >>>
+        '''
+
+        return NetconfCalculator(self.device,
+                                 self.config_dst.ele,
+                                 self.config_src.ele).changes(type=type)
+
+    def iterjsonl(self, type=Tag.XPATH):
+        '''iterjsonl
+
+        High-level api: Yield the changes as JSON Lines, one UTF-8 encoded
+        line per ChangeRecord. Keys of each JSON object are field names of
+        ChangeRecord.
+
+        Parameters
+        ----------
+
+        type : `tuple`
+            A tuple constant defined in yang.ncdiff.Tag, which is the notation
+            of xpaths in records.
+
+        Returns
+        -------
+
+        generator
+            A generator of bytes.
+        '''
+
+        for record in self.changes(type=type):
+            yield (json.dumps(record._asdict(), separators=(',', ':')) +
+                   '\n').encode('utf-8')
+
+    def write_jsonl(self, fileobj, type=Tag.XPATH):
+        '''write_jsonl
+
+        High-level api: Write the changes as JSON Lines to a file-like object
+        incrementally.
+
+        Parameters
+        ----------
+
+        fileobj : `object`
+            A file-like object that has a write() method accepting bytes.
+
+        type : `tuple`
+            A tuple constant defined in yang.ncdiff.Tag, which is the notation
+            of xpaths in records.
+
+        Returns
+        -------
+
+        int
+            Number of bytes written.
+        '''
+
+        return _write_chunks(self.iterjsonl(type=type), fileobj)
+
+    def chunks(self, max_bytes=None, max_nodes=None):
+        '''chunks
+
+        High-level api: Split the Netconf presentation of the delta into an
+        ordered list of edit-config contents, each of which is under a byte
+        budget and/or a node budget when possible. Sending them one by one in
+        the order returned has the same effect as sending self.nc at once.
+
+        Parameters
+        ----------
+
+        max_bytes : `int`
+            Budget of serialized size of one chunk in bytes. None means no
+            limit.
+
+        max_nodes : `int`
+            Budget of the number of nodes in one chunk. None means no limit.
+
+        Returns
+        -------
+
+        list
+            A list of tuples. Each tuple has two elements: an edit-config
+            content Element rooted at nc:config, and its serialized size in
+            bytes.
+        '''
+
+        return NetconfChunker(self.device, self.nc,
+                              max_bytes=max_bytes,
+                              max_nodes=max_nodes).chunks
+
+    def verify(self, dst_digest=None, src_digests=None):
+        '''verify
+
+        High-level api: Return True if applying the delta to config_src
+        results in config_dst, i.e., config_src + delta == config_dst. Instead
+        of applying self.nc to a copy of config_src, only digests along the
+        paths touched by self.nc are recomputed, and digests of untouched
+        subtrees are reused. A subtree is copied only where merging digests
+        is not enough, e.g., a leaf being set, or instances of a user-ordered
+        list or leaf-list being inserted, and then NetconfCalculator.node_add
+        and default trimming are applied to the copy. Then the resulting
+        digest of the root is compared with config_dst.digest. Callers that
+        keep digests already, e.g., PushSubscriber, can pass them in, so only
+        touched paths are computed.
+
+        Parameters
+        ----------
+
+        dst_digest : `str`
+            Digest of config_dst, i.e., config_dst.digest, if it is known
+            already.
+
+        src_digests : `dict`
+            Digests of subtrees of config_src keyed by nodes, e.g., collected
+            by the visit argument of Config._node_digest(). Digests of
+            untouched subtrees are taken from it when they are found.
+
+        Returns
+        -------
+
+        bool
+            True if the round trip succeeds, False if the result differs from
+            config_dst or the delta cannot be applied to config_src.
+        '''
+
+        nc = self.nc
+        calculator = NetconfCalculator(self.device, self.config_src.ele, nc)
+        try:
+            digest = self._verify_node(calculator, self.config_src.ele, nc,
+                                       None, src_digests)
+        except ConfigDeltaError as e:
+            logger.debug("delta cannot be applied: {}".format(e))
+            return False
+        if dst_digest is None:
+            dst_digest = self.config_dst.digest
+        return digest.hex() == dst_digest
+
+    def _verify_node(self, calculator, node, delta_node, record,
+                     src_digests=None):
+        '''_verify_node
+
+        Low-level api: Return the digest of a config node after a delta node
+        is merged into it, or None if the node would be removed. Children
+        that are merged without other operations are processed recursively,
+        and other touched children are processed by _verify_copies(). This is
+        a recursive method.
+
+        Parameters
+        ----------
+
+        calculator : `NetconfCalculator`
+            A calculator whose _pair_children() and node_add() are used.
+
+        node : `Element`
+            A node in config_src.
+
+        delta_node : `Element`
+            The peer of node in self.nc.
+
+        record : `SchemaNode`
+            The SchemaNode record of node, or None if node is the config root.
+
+        src_digests : `dict`
+            Known digests of subtrees of config_src keyed by nodes, or None.
+
+        Returns
+        -------
+
+        bytes
+            A digest in the same form as Config._node_digest(), or None.
+        '''
+
+        config = self.config_src
+        if self.device.stats is not None:
+            self.device.stats.visit('verify')
+        by_tag = {}
+        for child, delta_child in calculator._pair_children(node, delta_node):
+            tag = (child if child is not None else delta_child).tag
+            by_tag.setdefault(tag, []).append((child, delta_child))
+
+        unordered = []
+        ordered = {}
+        copies = []
+        keys = record.keys if record is not None else ()
+        for tag, pairs in by_tag.items():
+            child_record = None
+            if record is not None:
+                child_record = record.children.get(tag)
+            if child_record is None:
+                sample = pairs[0][0] if pairs[0][0] is not None \
+                    else pairs[0][1]
+                child_record = self.device.get_schema_record(sample)
+            untouched = tag in keys or all(p[1] is None for p in pairs)
+            if not untouched and (child_record.user_ordered or
+                                  child_record.type == 'leaf-list'):
+                # insert positions and leaf-list defaults depend on siblings
+                copies.extend(pairs)
+                continue
+            if child_record.user_ordered:
+                digests = ordered.setdefault(tag, [])
+            else:
+                digests = unordered
+            if untouched:
+                digests.extend(config._node_digest(child, child_record,
+                                                   None, src_digests)
+                               for child, delta_child in pairs)
+                continue
+            for child, delta_child in pairs:
+                if delta_child is None:
+                    digests.append(config._node_digest(child, child_record,
+                                                       None, src_digests))
+                    continue
+                operation = delta_child.get(operation_tag, 'merge')
+                if operation == 'remove' and child is None:
+                    continue
+                if operation in ('delete', 'remove') and child is not None:
+                    continue
+                if (
+                    operation == 'merge' and child is not None and
+                    child_record.type in ('container', 'list')
+                ):
+                    digest = self._verify_node(calculator, child, delta_child,
+                                               child_record, src_digests)
+                    if digest is not None:
+                        digests.append(digest)
+                else:
+                    copies.append((child, delta_child))
+
+        if copies:
+            for child, child_record in self._verify_copies(calculator, node,
+                                                           delta_node,
+                                                           copies, keys):
+                digest = config._node_digest(child, child_record)
+                if child_record.user_ordered:
+                    ordered.setdefault(child.tag, []).append(digest)
+                else:
+                    unordered.append(digest)
+
+        if not unordered and not ordered:
+            if record is None:
+                return _leaf_digest(node.tag, node.text)
+            elif record.type == 'list' or (record.type == 'container' and
+                                           not record.presence):
+                # removed by node_add() or _trim_defaults()
+                return None
+            return _leaf_digest(node.tag, None)
+        return _inner_digest(node.tag, unordered, ordered)
+
+    def _verify_copies(self, calculator, node, delta_node, pairs, keys):
+        '''_verify_copies
+
+        Low-level api: Apply delta children to copies of config children
+        under a copy of the path from the root to the config node, then trim
+        defaults, as config_src + delta does.
+
+        Parameters
+        ----------
+
+        calculator : `NetconfCalculator`
+            A calculator whose node_add() is used.
+
+        node : `Element`
+            A node in config_src.
+
+        delta_node : `Element`
+            The peer of node in self.nc.
+
+        pairs : `list`
+            A list of tuples (child, delta_child), where child or delta_child
+            could be None.
+
+        keys : `tuple`
+            Tags of keys if node is a list instance.
+
+        Returns
+        -------
+
+        list
+            A list of tuples (child, record) of resulting children, key
+            children excluded.
+        '''
+
+        copy = self._verify_spine(node)
+        delta_copy = self._verify_spine(delta_node)
+        for child, delta_child in pairs:
+            if child is not None:
+                copy.append(deepcopy(child))
+            if delta_child is not None:
+                delta_copy.append(deepcopy(delta_child))
+        calculator.node_add(copy, delta_copy)
+        self.config_src._trim_defaults(copy)
+        return [(child, self.device.get_schema_record(child))
+                for child in copy if child.tag not in keys]
+
+    def _verify_spine(self, node):
+        '''_verify_spine
+
+        Low-level api: Copy a node and its ancestors, without any other
+        children except keys of list instances, so schema nodes of the copy
+        can be found.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A node in a config or delta tree.
+
+        Returns
+        -------
+
+        Element
+            The copy of node.
+        '''
+
+        copy = None
+        for ancestor in reversed([node] + list(node.iterancestors())):
+            if copy is None:
+                copy = etree.Element(ancestor.tag, nsmap=ancestor.nsmap)
+                continue
+            copy = etree.SubElement(copy, ancestor.tag, nsmap=ancestor.nsmap)
+            record = self.device.get_schema_record(ancestor)
+            if record.type == 'list':
+                for key in record.keys:
+                    key_node = ancestor.find(key)
+                    if key_node is not None:
+                        key_copy = etree.SubElement(copy, key,
+                                                    nsmap=key_node.nsmap)
+                        key_copy.text = key_node.text
+        return copy
+
+
 class ConfigCompatibility(object):
     '''ConfigCompatibility
 
@@ -0,0 +1,241 @@
+import logging
+from threading import Lock
+
+from .config import Config, ConfigDelta
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class DriftReport(object):
+    '''DriftReport
+
+    Result of one drift check of a device.
+
+    Attributes
+    ----------
+    name : `str`
+        Name of the device.
+
+    drifted : `bool`
+        True if the running config differs from the intended config.
+
+    intended_digest : `str`
+        Digest of the intended config.
+
+    running_digest : `str`
+        Digest of the running config.
+
+    compared : `bool`
+        True if digests differ so a full diff was calculated.
+
+    delta : `ConfigDelta`
+        A ConfigDelta instance from the running config to the intended
+        config if the device drifted, otherwise None.
+
+    edit_config : `Element`
+        The config element of an edit-config message that brings the device
+        back to the intended config, or None if the device did not drift.
+    '''
+
+    def __init__(self, name, intended_digest, running_digest, delta=None,
+                 edit_config=None):
+        '''
+        __init__ instantiates a DriftReport instance.
+        '''
+
+        self.name = name
+        self.intended_digest = intended_digest
+        self.running_digest = running_digest
+        self.compared = intended_digest != running_digest
+        self.delta = delta
+        self.edit_config = edit_config
+
+    def __repr__(self):
+        return '<{}.{} {} {} at {}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.name,
+            'drifted' if self.drifted else 'in sync',
+            hex(id(self)),
+            )
+
+    def __bool__(self):
+        return self.drifted
+
+    @property
+    def drifted(self):
+        return self.delta is not None
+
+
+class DriftChecker(object):
+    '''DriftChecker
+
+    A thread-safe drift checker of many devices. The intended config of each
+    device is kept together with its digest. A fresh config is compared by
+    digest first, and a full diff is calculated only when digests differ.
+
+    Attributes
+    ----------
+    names : `list`
+        Names of devices that have an intended config.
+
+    counters : `dict`
+        Dictionary keys are 'checks', 'skipped' and 'drifted'. 'skipped' is
+        the number of checks that did not need a full diff.
+    '''
+
+    def __init__(self, **kwargs):
+        '''
+        __init__ instantiates a DriftChecker instance. Keyword arguments, e.g.,
+        preferred_create or preferred_delete, are passed to ConfigDelta when
+        building remediation.
+        '''
+
+        self.delta_kwargs = kwargs
+        self._lock = Lock()
+        self._intended = {}
+        self.counters = {'checks': 0, 'skipped': 0, 'drifted': 0}
+
+    def __repr__(self):
+        return '<{}.{} {} devices at {}>'.format(self.__class__.__module__,
+                                                 self.__class__.__name__,
+                                                 len(self._intended),
+                                                 hex(id(self)))
+
+    def __len__(self):
+        return len(self._intended)
+
+    def __contains__(self, name):
+        return name in self._intended
+
+    @property
+    def names(self):
+        return sorted(self._intended.keys())
+
+    def set_intended(self, name, config):
+        '''set_intended
+
+        High-level api: Set the intended config of a device.
+
+        Parameters
+        ----------
+
+        name : `str`
+            Name of the device.
+
+        config : `Config`
+            The intended config.
+
+        Returns
+        -------
+
+        str
+            Digest of the intended config.
+        '''
+
+        if not isinstance(config, Config):
+            raise TypeError("argument 'config' must be yang.ncdiff.Config, "
+                            "but not '{}'".format(type(config)))
+        digest = config.digest
+        with self._lock:
+            self._intended[name] = (config, digest)
+        return digest
+
+    def get_intended(self, name):
+        '''get_intended
+
+        High-level api: Return the intended config of a device.
+
+        Parameters
+        ----------
+
+        name : `str`
+            Name of the device.
+
+        Returns
+        -------
+
+        Config
+            The intended config. KeyError is raised if it is not set.
+        '''
+
+        with self._lock:
+            if name not in self._intended:
+                raise KeyError("intended config of device '{}' is not set"
+                               .format(name))
+            return self._intended[name][0]
+
+    def remove(self, name):
+        '''remove
+
+        High-level api: Forget the intended config of a device. Nothing
+        happens if it is not set.
+
+        Parameters
+        ----------
+
+        name : `str`
+            Name of the device.
+
+        Returns
+        -------
+
+        None
+            Nothing returns.
+        '''
+
+        with self._lock:
+            self._intended.pop(name, None)
+
+    def check(self, name, running):
+        '''check
+
+        High-level api: Check a device against its intended config.
+
+        Parameters
+        ----------
+
+        name : `str`
+            Name of the device.
+
+        running : `Config` or `RPCReply`
+            The running config, or a reply of get-config, which is processed
+            by ModelDevice.extract_config() of the intended config's device.
+
+        Returns
+        -------
+
+        DriftReport
+            A DriftReport instance.
+        '''
+
+        with self._lock:
+            if name not in self._intended:
+                raise KeyError("intended config of device '{}' is not set"
+                               .format(name))
+            intended, intended_digest = self._intended[name]
+        if not isinstance(running, Config):
+            running = intended.device.extract_config(running)
+        running_digest = running.digest
+
+        delta = edit_config = None
+        if running_digest != intended_digest:
+            # different digests mean different configs, see Config.digest,
+            # but an empty diff is still not reported as drift
+            delta = ConfigDelta(running, intended, **self.delta_kwargs)
+            edit_config = delta.nc
+            if len(edit_config) == 0:
+                delta = edit_config = None
+        report = DriftReport(name, intended_digest, running_digest,
+                             delta=delta, edit_config=edit_config)
+        with self._lock:
+            self.counters['checks'] += 1
+            if not report.compared:
+                self.counters['skipped'] += 1
+            if report.drifted:
+                self.counters['drifted'] += 1
+        if report.drifted:
+            logger.info('Device {} drifted from its intended config'
+                        .format(name))
+        return report
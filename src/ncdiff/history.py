@@ -0,0 +1,369 @@
+import time
+import logging
+from lxml import etree
+from weakref import WeakValueDictionary
+from collections import deque
+from ncclient import xml_
+
+from .config import Config, ConfigDelta
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+nc_url = xml_.BASE_NS_1_0
+config_tag = '{' + nc_url + '}config'
+
+
+class _Node(object):
+    '''_Node
+
+    An immutable node shared by all snapshots containing the same subtree.
+    '''
+
+    __slots__ = ('digest', 'tag', 'text', 'nsmap', 'children', 'key', 'keys',
+                 'ordered', '__weakref__')
+
+    def __init__(self, digest, tag, text, nsmap, children, key, keys,
+                 ordered):
+        self.digest = digest
+        self.tag = tag
+        self.text = text
+        self.nsmap = nsmap
+        self.children = children
+        self.key = key
+        self.keys = keys
+        self.ordered = ordered
+
+    @property
+    def identity(self):
+        return (self.tag, self.key)
+
+
+class Snapshot(object):
+    '''Snapshot
+
+    One config snapshot in a ConfigHistory.
+
+    Attributes
+    ----------
+    label : `object`
+        Label of the snapshot, by default the time when it was added.
+
+    digest : `str`
+        Digest of the config, same as Config.digest.
+    '''
+
+    def __init__(self, label, root):
+        '''
+        __init__ instantiates a Snapshot instance.
+        '''
+
+        self.label = label
+        self.root = root
+
+    def __repr__(self):
+        return '<{}.{} {} {} at {}>'.format(self.__class__.__module__,
+                                            self.__class__.__name__,
+                                            self.label,
+                                            self.digest[:12],
+                                            hex(id(self)))
+
+    @property
+    def digest(self):
+        return self.root.digest.hex()
+
+
+class ConfigHistory(object):
+    '''ConfigHistory
+
+    A history of config snapshots of one device. Subtrees are stored once
+    and keyed by the schema-aware digests of Config.digest together with the
+    type of their schema nodes, so a subtree that does not change between
+    snapshots is shared by all of them, and a subtree is released when no
+    kept snapshot refers to it. Snapshots are
+    rebuilt into Config instances on demand. The delta between two snapshots
+    walks only subtrees whose digests differ, and NetconfCalculator.sub runs
+    on the changed parts only.
+
+    Attributes
+    ----------
+    device : `object`
+        An instance of yang.ncdiff.ModelDevice, which represents a modeled
+        device.
+
+    maxlen : `int`
+        Maximum number of snapshots kept, or None if there is no limit. The
+        oldest snapshot is dropped when a new one exceeds the limit.
+
+    snapshots : `list`
+        A list of Snapshot instances, from the oldest to the newest.
+
+    nodes : `int`
+        Number of distinct subtrees stored.
+    '''
+
+    def __init__(self, device, maxlen=None):
+        '''
+        __init__ instantiates a ConfigHistory instance.
+        '''
+
+        self.device = device
+        self.maxlen = maxlen
+        self._snapshots = deque(maxlen=maxlen)
+        self._nodes = WeakValueDictionary()
+
+    def __repr__(self):
+        return '<{}.{} {} snapshots {} nodes at {}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            len(self),
+            self.nodes,
+            hex(id(self)),
+            )
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def __getitem__(self, index):
+        return self._snapshots[index]
+
+    def __iter__(self):
+        return iter(list(self._snapshots))
+
+    @property
+    def snapshots(self):
+        return list(self._snapshots)
+
+    @property
+    def nodes(self):
+        return len(self._nodes)
+
+    def add(self, config, label=None):
+        '''add
+
+        High-level api: Add a config snapshot. Only subtrees that are not
+        stored yet are copied.
+
+        Parameters
+        ----------
+
+        config : `Config`
+            A config of the device.
+
+        label : `object`
+            Label of the snapshot, e.g., a timestamp. The default is
+            time.time().
+
+        Returns
+        -------
+
+        Snapshot
+            The new Snapshot instance.
+        '''
+
+        if not isinstance(config, Config):
+            raise TypeError("argument 'config' must be yang.ncdiff.Config, "
+                            "but not '{}'".format(type(config)))
+        built = {}
+        nodes = self._nodes
+
+        def visit(node, record, digest):
+            # the same subtree can sit under schema nodes of different
+            # types, e.g., a leaf and an ordered-by user leaf-list sharing a
+            # tag, so the record-derived fields are part of the lookup key
+            if record is None:
+                ident = digest
+            else:
+                ident = (digest, record.type, record.user_ordered,
+                         record.keys)
+            stored = nodes.get(ident)
+            if stored is None:
+                children = tuple(built.pop(c) for c in node
+                                 if isinstance(c.tag, str))
+                text = node.text if not children else None
+                nsmap = None
+                if text is not None and ':' in text:
+                    # namespace declarations used by identityref and
+                    # instance-identifier values
+                    nsmap = {p: u for p, u in node.nsmap.items()
+                             if p is not None and p + ':' in text} or None
+                key = keys = None
+                ordered = False
+                if record is not None:
+                    ordered = record.user_ordered
+                    if record.type == 'list':
+                        keys = record.keys
+                        key = tuple(node.findtext(k) for k in keys)
+                    elif record.type == 'leaf-list':
+                        key = text
+                stored = _Node(digest, node.tag, text, nsmap, children, key,
+                               keys, ordered)
+                nodes[ident] = stored
+            else:
+                for c in node:
+                    built.pop(c, None)
+            built[node] = stored
+
+        config._node_digest(config.ele, None, visit)
+        snapshot = Snapshot(time.time() if label is None else label,
+                            built.pop(config.ele))
+        self._snapshots.append(snapshot)
+        return snapshot
+
+    def config(self, index):
+        '''config
+
+        High-level api: Rebuild a snapshot into a Config instance.
+
+        Parameters
+        ----------
+
+        index : `int`
+            Index of the snapshot.
+
+        Returns
+        -------
+
+        Config
+            A Config instance.
+        '''
+
+        ele = etree.Element(config_tag, nsmap={'nc': nc_url})
+        for child in self._snapshots[index].root.children:
+            self._build(ele, child, None)
+        return Config(self.device, ele, validate=False)
+
+    def changed(self, index1, index2):
+        '''changed
+
+        High-level api: Return True if two snapshots are different.
+
+        Parameters
+        ----------
+
+        index1 : `int`
+            Index of a snapshot.
+
+        index2 : `int`
+            Index of another snapshot.
+
+        Returns
+        -------
+
+        bool
+            True if the digests of two snapshots differ.
+        '''
+
+        return self._snapshots[index1].root is not \
+            self._snapshots[index2].root
+
+    def delta(self, index1, index2, **kwargs):
+        '''delta
+
+        High-level api: Return the delta from one snapshot to another. Both
+        DAGs are walked from the roots, and subtrees whose digests are equal
+        are skipped, so the ConfigDelta is calculated on two partial configs
+        that contain only changed subtrees, their ancestors and list keys.
+        Entries of a user-ordered list or leaf-list are all kept if their
+        sequence changes.
+
+        Parameters
+        ----------
+
+        index1 : `int`
+            Index of the source snapshot.
+
+        index2 : `int`
+            Index of the destination snapshot.
+
+        kwargs : `dict`
+            Keyword arguments of ConfigDelta, e.g., preferred_create. If
+            preferred_replace is not 'merge' or diff_type is not 'minimum',
+            whole snapshots are compared, since the edit-config then needs
+            unchanged siblings too.
+
+        Returns
+        -------
+
+        ConfigDelta
+            A ConfigDelta instance whose nc is the edit-config from the first
+            snapshot to the second one.
+        '''
+
+        root1 = self._snapshots[index1].root
+        root2 = self._snapshots[index2].root
+        if (
+            kwargs.get('preferred_replace', 'merge') != 'merge' or
+            kwargs.get('diff_type', 'minimum') != 'minimum'
+        ):
+            return ConfigDelta(self.config(index1), self.config(index2),
+                               **kwargs)
+        ele1 = etree.Element(config_tag, nsmap={'nc': nc_url})
+        ele2 = etree.Element(config_tag, nsmap={'nc': nc_url})
+        if root1 is not root2:
+            self._prune(root1, root2, ele1, ele2, None)
+        return ConfigDelta(Config(self.device, ele1, validate=False),
+                           Config(self.device, ele2, validate=False),
+                           **kwargs)
+
+    def _build(self, parent, node, parent_url):
+        url = etree.QName(node.tag).namespace
+        nsmap = {} if url == parent_url else {None: url}
+        if node.nsmap:
+            nsmap.update(node.nsmap)
+        ele = etree.SubElement(parent, node.tag, nsmap=nsmap or None)
+        ele.text = node.text
+        for child in node.children:
+            self._build(ele, child, url)
+        return ele
+
+    def _prune(self, node1, node2, ele1, ele2, parent_url):
+        # copy children of node1 and node2 that differ into ele1 and ele2
+        url = etree.QName(node1.tag).namespace
+        ordered1, unordered1 = self._group(node1)
+        ordered2, unordered2 = self._group(node2)
+
+        for tag in sorted(set(ordered1) | set(ordered2)):
+            children1 = ordered1.get(tag, [])
+            children2 = ordered2.get(tag, [])
+            if [c.digest for c in children1] != [c.digest for c in children2]:
+                for child in children1:
+                    self._build(ele1, child, url)
+                for child in children2:
+                    self._build(ele2, child, url)
+
+        keys = set(node1.keys or ())
+        for identity, child1 in unordered1.items():
+            child2 = unordered2.get(identity)
+            if child2 is None:
+                self._build(ele1, child1, url)
+            elif child1 is child2:
+                if child1.tag in keys:
+                    self._build(ele1, child1, url)
+                    self._build(ele2, child2, url)
+            elif not child1.children and not child2.children:
+                self._build(ele1, child1, url)
+                self._build(ele2, child2, url)
+            else:
+                sub1 = self._build_shallow(ele1, child1, url)
+                sub2 = self._build_shallow(ele2, child2, url)
+                self._prune(child1, child2, sub1, sub2, url)
+        for identity, child2 in unordered2.items():
+            if identity not in unordered1:
+                self._build(ele2, child2, url)
+
+    def _build_shallow(self, parent, node, parent_url):
+        url = etree.QName(node.tag).namespace
+        nsmap = None if url == parent_url else {None: url}
+        return etree.SubElement(parent, node.tag, nsmap=nsmap)
+
+    @staticmethod
+    def _group(node):
+        ordered = {}
+        unordered = {}
+        for child in node.children:
+            if child.ordered:
+                ordered.setdefault(child.tag, []).append(child)
+            else:
+                unordered[child.identity] = child
+        return ordered, unordered
@@ -1,15 +1,22 @@
 import os
 import re
+import time
 
 import logging
 from lxml import etree
 from ncclient import manager, operations, transport, xml_
 from ncclient.devices.default import DefaultDeviceHandler
 
-from .model import Model, ModelDownloader, ModelCompiler
+from .model import Model
 from .config import Config
 from .errors import ModelError, ModelMissing, ConfigError
 from .composer import Tag, Composer
+from .stats import Stats
+from .registry import DeviceSchema, registry as default_registry
+from .cache import SchemaNodeCache
+from .store import ModuleStore
+# patch ncclient RPCReply, Notification, EditConfig and RPC
+from . import patches
 
 # create a logger for this module
 logger = logging.getLogger(__name__)
@@ -26,6 +33,66 @@ special_prefixes = {
     tailf_url: 'tailf',
     ncEvent_url: 'ncEvent',
     }
+xpath_predicate = re.compile(
+    r'\[\s*([^\s=\[\]]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')\s*\]')
+
+
+def parse_xpath(xpath):
+    '''parse_xpath
+
+    Split an absolute xpath in the notation of ModelDevice.get_xpath() into
+    steps. Each step is a tuple of an identifier and a list of predicates,
+    and each predicate is a tuple of an identifier and a value, e.g.,
+    '/oc-if:interfaces/interface[name="Gi0/0"]' is split into
+    [('oc-if:interfaces', []), ('interface', [('name', 'Gi0/0')])].
+    '''
+
+    steps = []
+    step = ''
+    quote = None
+    depth = 0
+    for c in xpath:
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in '"\'' and depth > 0:
+            quote = c
+        elif c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif c == '/' and depth == 0:
+            steps.append(step)
+            step = ''
+            continue
+        step += c
+    steps.append(step)
+    if (
+        quote is not None or depth != 0 or
+        len(steps) < 2 or steps[0] != '' or '' in steps[1:]
+    ):
+        raise ValueError("'{}' is not an absolute xpath".format(xpath))
+
+    ret = []
+    for step in steps[1:]:
+        match = re.match(r'^([^\[\]\s]+)(\[.*\])?$', step)
+        if not match:
+            raise ValueError("cannot parse '{}' in xpath '{}'"
+                             .format(step, xpath))
+        name, predicates = match.group(1), match.group(2) or ''
+        pairs = []
+        position = 0
+        for m in xpath_predicate.finditer(predicates):
+            if m.start() != position:
+                break
+            position = m.end()
+            value = m.group(2) if m.group(2) is not None else m.group(3)
+            pairs.append((m.group(1), value))
+        if position != len(predicates):
+            raise ValueError("cannot parse predicates '{}' in xpath '{}'"
+                             .format(predicates, xpath))
+        ret.append((name, pairs))
+    return ret
 
 
 def connect(*args, **kwargs):
@@ -45,13 +112,16 @@ def connect(*args, **kwargs):
     if "hostkey_verify" not in kwargs or kwargs["hostkey_verify"]:
         session.load_known_hosts()
 
+    auto_load = kwargs.pop('auto_load', False)
+    schema_registry = kwargs.pop('schema_registry', None)
     try:
         session.connect(*args, **kwargs)
     except Exception as ex:
         if session.transport:
             session.close()
         raise
-    return ModelDevice(session, device_handler, **kwargs)
+    return ModelDevice(session, device_handler, auto_load=auto_load,
+                       schema_registry=schema_registry, **kwargs)
 
 
 class ModelDevice(manager.Manager):
@@ -71,6 +141,11 @@ class ModelDevice(manager.Manager):
         A list of models this ModelDevice instance supports. The information is
         retrived from attribute server_capabilities.
 
+    models_revisions : `dict`
+        A dictionary of module revisions this ModelDevice instance supports.
+        Dictionary keys are module names, and values are revisions, or an
+        empty string if the revision is unknown.
+
     models_loaded : `list`
         A list of models this ModelDevice instance has loaded. Loading a model
         means the ModelDevice instance has obtained schema infomation of the
@@ -86,6 +161,28 @@ class ModelDevice(manager.Manager):
     roots : `dict`
         A dictionary of roots in loaded models. Dictionary keys are roots in
         `{url}tagname` notation, and values are model names.
+
+    stats : `Stats`
+        An instance of Stats if statistics collection is enabled by
+        enable_stats(), otherwise None.
+
+    schema_nodes : `dict`
+        Compact records of schema nodes in all loaded models. Dictionary keys
+        are schema nodes, and values are SchemaNode instances.
+
+    auto_load : `bool`
+        True if a model is loaded on demand when a root in its namespace is
+        first seen in a config. False by default.
+
+    models_autoloaded : `list`
+        A list of model names that have been loaded on demand, in the order
+        they were loaded.
+
+    schema : `DeviceSchema`
+        Schema information of the device: models, schema lookup caches,
+        compiler and namespaces. It is private to the device by default. If
+        argument schema_registry is given, devices advertising the same
+        capabilities share one DeviceSchema.
     '''
 
     def __init__(self, session, device_handler, *args, **kwargs):
@@ -100,12 +197,63 @@ class ModelDevice(manager.Manager):
         for arg in supported_args:
             if arg in kwargs:
                 setattr(self, arg, kwargs[arg])
-
-        self.models = {}
-        self.nodes = {}
-        self.compiler = None
+        self.auto_load = kwargs.get('auto_load', False)
+
+        # schema_registry can be True (the process-wide registry), a
+        # SchemaRegistry instance, or None (a private schema)
+        schema_registry = kwargs.get('schema_registry')
+        if schema_registry is True:
+            schema_registry = default_registry
+        if schema_registry is not None and schema_registry is not False:
+            self.schema = schema_registry.get(self.server_capabilities)
+        else:
+            self.schema = DeviceSchema()
         self._models_loadable = None
-        self._namespaces = None
+        self._models_revisions = None
+        self.stats = None
+
+    @property
+    def models(self):
+        return self.schema.models
+
+    @models.setter
+    def models(self, value):
+        self.schema.models = value
+
+    @property
+    def nodes(self):
+        return self.schema.nodes
+
+    @nodes.setter
+    def nodes(self, value):
+        if not isinstance(value, SchemaNodeCache):
+            raise TypeError("attribute 'nodes' must be SchemaNodeCache, "
+                            "but not '{}'".format(type(value)))
+        self.schema.nodes = value
+
+    @property
+    def schema_nodes(self):
+        return self.schema.schema_nodes
+
+    @schema_nodes.setter
+    def schema_nodes(self, value):
+        self.schema.schema_nodes = value
+
+    @property
+    def compiler(self):
+        return self.schema.compiler
+
+    @compiler.setter
+    def compiler(self, value):
+        self.schema.compiler = value
+
+    @property
+    def models_autoloaded(self):
+        return self.schema.models_autoloaded
+
+    @property
+    def _model_lock(self):
+        return self.schema.lock
 
     def __repr__(self):
         return '<{}.{} object at {}>'.format(self.__class__.__module__,
@@ -117,16 +265,40 @@ class ModelDevice(manager.Manager):
         if self.compiler is None:
             raise ValueError('please first call scan_models() to build '
                              'up supported namespaces of a device')
-        if self._namespaces is None:
-            self._namespaces = []
+        if self.schema.namespaces is None:
+            namespaces = []
             for m in self.compiler.context.dependencies.findall('./module'):
                 if m.get('prefix') is not None:
-                    self._namespaces.append((
+                    namespaces.append((
                         m.get('id'),
                         m.get('prefix'),
                         m.findtext('namespace')
                     ))
-        return self._namespaces
+            self.schema.url_names = {i[2]: i[0] for i in namespaces
+                                     if i[1] is not None}
+            # the first model wins if two models share a URL
+            self.schema.url_prefixes = {i[2]: i[1]
+                                        for i in reversed(namespaces)}
+            self.schema.namespaces = namespaces
+            self.schema.prefixes = None
+        return self.schema.namespaces
+
+    @property
+    def prefixes(self):
+        prefixes = self.schema.prefixes
+        if prefixes is None:
+            prefixes = {i[1]: i[2] for i in self.namespaces
+                        if i[1] is not None}
+            self.schema.prefixes = prefixes
+        return prefixes
+
+    @property
+    def xpath_cache(self):
+        return self.schema.xpath_cache
+
+    @property
+    def instanceid_cache(self):
+        return self.schema.instanceid_cache
 
     @property
     def models_loadable(self):
@@ -155,13 +327,15 @@ class ModelDevice(manager.Manager):
                 if c[:len(NC_MONITORING)] == NC_MONITORING]:
             n = {'nc': nc_url, 'ncm': NC_MONITORING}
             p = '/nc:rpc-reply/nc:data/ncm:netconf-state/ncm:schemas' \
-                '/ncm:schema/ncm:identifier'
+                '/ncm:schema'
             try:
                 reply = super().execute(operations.retrieve.Get,
                                         filter=NC_MONITORING_FILTER)
                 if reply.ok:
-                    self._models_loadable = \
-                        sorted([n.text for n in reply.data.xpath(p, namespaces=n)])
+                    self._set_models_loadable(
+                        reply.data.xpath(p, namespaces=n),
+                        '{%s}identifier' % NC_MONITORING,
+                        '{%s}version' % NC_MONITORING)
             except Exception as e:
                 logger.warning(
                     "Error when sending Netconf GET of /netconf-state/schemas "
@@ -181,13 +355,15 @@ class ModelDevice(manager.Manager):
                 if c[:len(YANG_LIB_1_0)] == YANG_LIB_1_0]:
             n = {'nc': nc_url, 'yanglib': YANG_LIB}
             p = '/nc:rpc-reply/nc:data/yanglib:modules-state' \
-                '/yanglib:module/yanglib:name'
+                '/yanglib:module'
             try:
                 reply = super().execute(operations.retrieve.Get,
                                         filter=YANG_LIB_FILTER)
                 if reply.ok:
-                    self._models_loadable = \
-                        sorted([n.text for n in reply.data.xpath(p, namespaces=n)])
+                    self._set_models_loadable(
+                        reply.data.xpath(p, namespaces=n),
+                        '{%s}name' % YANG_LIB,
+                        '{%s}revision' % YANG_LIB)
             except Exception as e:
                 logger.warning(
                     "Error when sending Netconf GET of /modules-state/module "
@@ -203,14 +379,39 @@ class ModelDevice(manager.Manager):
 
         # RFC6020 section 5.6.4
         regexp_str = r'module=([a-zA-Z0-9-]+)\&{0,1}'
+        revision_regexp_str = r'revision=([0-9-]+)'
         modules = []
+        revisions = {}
         for capability in iter(self.server_capabilities):
             match = re.search(regexp_str, capability)
             if match:
                 modules.append(match.group(1))
+                match_revision = re.search(revision_regexp_str, capability)
+                revisions[match.group(1)] = \
+                    match_revision.group(1) if match_revision else ''
         self._models_loadable = sorted(modules)
+        self._models_revisions = revisions
         return self._models_loadable
 
+    def _set_models_loadable(self, nodes, name_tag, revision_tag):
+        modules = []
+        revisions = {}
+        for node in nodes:
+            name = node.findtext(name_tag)
+            if name is None:
+                continue
+            modules.append(name)
+            revisions[name] = node.findtext(revision_tag) or ''
+        self._models_loadable = sorted(modules)
+        self._models_revisions = revisions
+
+    @property
+    def models_revisions(self):
+        if self._models_revisions is None:
+            # models_loadable retrieves revisions as well
+            self.models_loadable
+        return self._models_revisions
+
     @property
     def models_loaded(self):
         return sorted(self.models.keys())
@@ -222,7 +423,59 @@ class ModelDevice(manager.Manager):
             roots.update({r: model.name for r in model.roots})
         return roots
 
-    def scan_models(self, folder='./yang', download='check'):
+    def enable_stats(self, callback=None):
+        '''enable_stats
+
+        High-level api: Start collecting statistics on hot paths of this
+        device and calculators working on it, e.g., schema node lookups,
+        calls of _node_le and _pair_children, and nodes visited in phases
+        trim, validate, sub and add.
+
+        Parameters
+        ----------
+
+        callback : `callable`
+            An optional hook called as callback(phase, stats) at the end of
+            every phase, e.g., to feed a metrics exporter.
+
+        Returns
+        -------
+
+        Stats
+            An instance of Stats, which is also available as self.stats.
+
+
+        Code Example::
+
+            >>> stats = m.enable_stats()
+            >>> delta = config2 - config1
+            >>> stats.as_dict()
+            ...
+            >>>
+        '''
+
+        self.stats = Stats(callback=callback)
+        return self.stats
+
+    def disable_stats(self):
+        '''disable_stats
+
+        High-level api: Stop collecting statistics.
+
+        Returns
+        -------
+
+        Stats
+            The Stats instance collected so far, or None if it was not
+            enabled.
+        '''
+
+        stats = self.stats
+        self.stats = None
+        return stats
+
+    def scan_models(self, folder='./yang', download='check',
+                    download_threads=2, store=None):
         '''scan_models
 
         High-level api: Download models from the device by <get-schema>
@@ -238,10 +491,20 @@ class ModelDevice(manager.Manager):
         download : `str`
             A string is `check`, `force` or `ignore`. If it is `check`, the
             content in the folder is compared with self.server_capabilities.
-            Downloading will be skipped if the checking says good. If it is
-            `force`, downloading starts without checking. Another option is
-            `ignore`, which allows the compiler to work on existing YANG files
-            in a folder without downloading.
+            Downloading will be skipped if the checking says good, otherwise
+            only new or changed modules are downloaded. If it is `force`, the
+            folder is cleaned up and all modules are downloaded. Another option
+            is `ignore`, which allows the compiler to work on existing YANG
+            files in a folder without downloading.
+
+        download_threads : `int`
+            Number of concurrent <get-schema> requests when downloading.
+
+        store : `ModuleStore` or `str`
+            A ModuleStore instance, or a path to it. When it is given, YANG
+            files and compiled models are shared with other devices and
+            folders using the same store, and the folder holds links to the
+            store and a manifest.
 
 
         Returns
@@ -268,10 +531,32 @@ class ModelDevice(manager.Manager):
             >>>
         '''
 
-        if download in ['check', 'force']:
-            d = ModelDownloader(self, folder)
-            d.download_all(check_before_download=(download == 'check'))
-        self.compiler = ModelCompiler(folder)
+        from .compiler import ModelDownloader, ModelCompiler
+
+        if isinstance(store, str):
+            store = ModuleStore(store)
+
+        with self._model_lock:
+            # another device sharing the schema has done the work
+            if (
+                self.schema.shared and
+                download != 'force' and
+                self.compiler is not None and
+                self.compiler.dir_yang == os.path.abspath(folder)
+            ):
+                logger.debug('Skip scanning models as schema {} has been '
+                             'scanned'.format(self.schema.fingerprint))
+                return
+            if download in ['check', 'force']:
+                d = ModelDownloader(self, folder, num_threads=download_threads,
+                                    store=store)
+                d.download_all(check_before_download=(download == 'check'))
+            self.compiler = ModelCompiler(folder, store=store)
+            self.schema.namespaces = None
+            self.schema.prefixes = None
+            self.schema.url_names = None
+            self.schema.url_prefixes = None
+            self.schema.instanceid_cache.clear()
 
     def load_model(self, model):
         '''load_model
@@ -305,6 +590,13 @@ class ModelDevice(manager.Manager):
             >>>
         '''
 
+        with self._model_lock:
+            # another device sharing the schema has loaded it
+            if self.schema.shared and model in self.models:
+                return self.models[model]
+            return self._load_model(model)
+
+    def _load_model(self, model):
         if os.path.isfile(model):
             file_name, file_ext = os.path.splitext(model)
             if file_ext.lower() == '.xml':
@@ -326,15 +618,68 @@ class ModelDevice(manager.Manager):
         else:
             raise ValueError("argument 'model' {} needs to be either a model " \
                              "name or a compiled model xml file".format(model))
+        # new dictionaries are swapped in, so readers in other threads never
+        # see a dictionary changing size during iteration
+        schema_nodes = dict(self.schema_nodes)
+        roots = None
         if m.name in self.models:
-            self.nodes = {k: v for k, v in self.nodes.items()
-                          if self.roots[k.split(' ')[0]] != m.name}
+            roots = self.models[m.name].roots
+            for schema_node in self.models[m.name].schema_nodes:
+                schema_nodes.pop(schema_node, None)
             logger.info('Model {} is reloaded'.format(m.name))
         else:
             logger.info('Model {} is loaded'.format(m.name))
-        self.models[m.name] = m
+        schema_nodes.update(m.schema_nodes)
+        models = dict(self.models)
+        models[m.name] = m
+        self.schema_nodes = schema_nodes
+        self.models = models
+        # cached lookups are invalidated last, so a lookup starting after
+        # this point always resolves schema nodes in the new models
+        if roots is not None:
+            self.nodes.invalidate(roots)
         return m
 
+    def auto_load_model(self, url):
+        '''auto_load_model
+
+        High-level api: Load the model of a namespace on demand if
+        self.auto_load is True. This method is thread-safe, and each model is
+        loaded at most once.
+
+        Parameters
+        ----------
+
+        url : `str`
+            A namespace URL of a config root.
+
+        Returns
+        -------
+
+        str
+            Model name if the model is loaded, either now or earlier. None if
+            self.auto_load is False or the URL is not a namespace of a
+            loadable model.
+        '''
+
+        if not self.auto_load or self.compiler is None:
+            return None
+        url_names = self.schema.url_names
+        if url_names is None:
+            self.namespaces
+            url_names = self.schema.url_names
+        name = url_names.get(url)
+        if name in self.models:
+            return name
+        if name is None or name not in self.models_loadable:
+            return None
+        with self._model_lock:
+            if name not in self.models:
+                self._load_model(name)
+                self.models_autoloaded.append(name)
+                logger.info("Model {} is loaded on demand".format(name))
+        return name
+
     def execute(self, operation, *args, **kwargs):
         '''execute
 
@@ -344,6 +689,10 @@ class ModelDevice(manager.Manager):
         poweroff_machine and reboot_machine. Since ModelDevice is a subclass of
         manager in ncclient package, any method supported by ncclient is
         available here. Refer to ncclient document for more details.
+
+        Operations get and get_config accept an argument 'models', which
+        retrieves whole roots of some models, or an argument 'xpaths', which
+        retrieves the subtree filter built by subtree_filter().
         '''
 
         def pop_models():
@@ -380,6 +729,19 @@ class ModelDevice(manager.Manager):
             logger.debug("argument 'filter' is set to '{}'".format(filter_xml))
             return filter_ele
 
+        def pop_xpaths(config):
+            xpaths = kwargs.pop('xpaths', None)
+            if xpaths is None:
+                return False
+            if 'models' in kwargs:
+                raise ValueError("argument 'models' and argument 'xpaths' "
+                                 "cannot be specified at the same time")
+            if 'filter' in kwargs:
+                logger.warning("argument 'filter' is ignored as argument "
+                               "'xpaths' is specified")
+            kwargs['filter'] = self.subtree_filter(xpaths, config=config)
+            return True
+
         def get_access_type(model_name, root):
             check_models([model_name])
             node = list(self.models[model_name].tree.iterchildren(tag=root))[0]
@@ -397,7 +759,7 @@ class ModelDevice(manager.Manager):
         else:
             cls = operation
         if cls == operations.retrieve.Get:
-            models = pop_models()
+            models = None if pop_xpaths(False) else pop_models()
             if models is not None:
                 check_models(models)
                 roots = [k for k, v in self.roots.items()
@@ -411,7 +773,7 @@ class ModelDevice(manager.Manager):
         elif cls == operations.retrieve.GetConfig:
             if not args and 'source' not in kwargs:
                 args = tuple(['running'])
-            models = pop_models()
+            models = None if pop_xpaths(True) else pop_models()
             if models is not None:
                 check_models(models)
                 roots = [k for k, v in self.roots.items()
@@ -435,9 +797,11 @@ class ModelDevice(manager.Manager):
         reply = super().execute(cls, *args, **kwargs)
         if isinstance(reply, operations.rpc.RPCReply):
             reply.ns = self._get_ns(reply._root)
+            reply.xpath_cache = self.xpath_cache
         if getattr(transport, 'notify', None) and \
            isinstance(reply, transport.notify.Notification):
             reply.ns = self._get_ns(reply._root_ele)
+            reply.xpath_cache = self.xpath_cache
         return reply
 
     def take_notification(self, block=True, timeout=None):
@@ -472,9 +836,11 @@ class ModelDevice(manager.Manager):
         reply = super().take_notification(block=block, timeout=timeout)
         if isinstance(reply, operations.rpc.RPCReply):
             reply.ns = self._get_ns(reply._root)
+            reply.xpath_cache = self.xpath_cache
         if getattr(transport, 'notify', None) and \
            isinstance(reply, transport.notify.Notification):
             reply.ns = self._get_ns(reply._root_ele)
+            reply.xpath_cache = self.xpath_cache
         return reply
 
     def extract_config(self, reply, type='netconf', remove_deprecated=False):
@@ -573,6 +939,25 @@ class ModelDevice(manager.Manager):
             >>>
         '''
 
+        if self.stats is None:
+            return self._get_schema_node(config_node)
+        start = time.perf_counter()
+        try:
+            return self._get_schema_node(config_node)
+        finally:
+            self.stats.count('get_schema_node')
+            self.stats.time('get_schema_node', time.perf_counter() - start)
+
+    def _get_schema_node(self, config_node, partition=None):
+        '''_get_schema_node
+
+        Low-level api: Implementation of get_schema_node(). This is a
+        recursive method. Argument partition is the partition of self.nodes
+        taken before the lookup resolves anything. If load_model()
+        invalidates it during the lookup, schema nodes resolved by the lookup
+        are not cached.
+        '''
+
         def get_child(parent, tag):
             children = [i for i in parent.iter(tag=tag) \
                         if i.attrib['type'] != 'choice' and \
@@ -604,31 +989,71 @@ class ModelDevice(manager.Manager):
                     return False
             return True
 
+        nodes = self.nodes
         n = Composer(self, config_node)
         path = n.path
         config_path_str = ' '.join(path)
-        if config_path_str in self.nodes:
-            return self.nodes[config_path_str]
+        child = nodes.get(config_path_str)
+        if child is not None:
+            if self.stats is not None:
+                self.stats.count('nodes_hit')
+            return child
+        if self.stats is not None:
+            self.stats.count('nodes_miss')
+        if partition is None:
+            partition = nodes.partition(path[0])
         if len(path) > 1:
-            parent = self.get_schema_node(config_node.getparent())
+            parent = self._get_schema_node(config_node.getparent(),
+                                           partition)
+            record = self.schema_nodes.get(parent)
+            if record is not None and \
+               record.children.get(config_node.tag) is not None:
+                child = record.children[config_node.tag].element
+                nodes.set(config_path_str, child, partition)
+                return child
             child = get_child(parent, config_node.tag)
             if child is None:
                 raise ConfigError("unable to locate a child '{}' of {} in " \
                                   "schema tree" \
                                   .format(config_node.tag,
                                           self.get_xpath(parent)))
-            self.nodes[config_path_str] = child
+            nodes.set(config_path_str, child, partition)
             return child
         else:
-            tree = self.models[n.model_name].tree
+            model_name = n.model_name
+            tree = self.models[model_name].tree
             child = get_child(tree, config_node.tag)
             if child is None:
                 raise ConfigError("unable to locate a root '{}' in {} schema " \
                                   "tree" \
-                                  .format(config_node.tag, n.model_name))
-            self.nodes[config_path_str] = child
+                                  .format(config_node.tag, model_name))
+            nodes.set(config_path_str, child, partition)
             return child
 
+    def get_schema_record(self, node):
+        '''get_schema_record
+
+        High-level api: Given an Element node in config tree or schema tree,
+        get_schema_record returns the compact record of its schema node.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            An Element node in config tree or schema tree.
+
+        Returns
+        -------
+
+        SchemaNode
+            A SchemaNode instance.
+        '''
+
+        record = self.schema_nodes.get(node)
+        if record is None:
+            record = self.schema_nodes[self.get_schema_node(node)]
+        return record
+
     def get_model_name(self, node):
         '''get_model_name
 
@@ -700,6 +1125,156 @@ class ModelDevice(manager.Manager):
 
         return Composer(self, node).get_xpath(type, instance=instance)
 
+    def subtree_filter(self, xpaths, config=False):
+        '''subtree_filter
+
+        High-level api: Build the smallest subtree filter that selects given
+        xpaths, using schema information of loaded models. Xpaths are in the
+        notation of get_xpath(), either Tag.XPATH or Tag.LXML_XPATH. A list
+        predicate, e.g., [name="Gi0/0"], becomes a content match node, and
+        a leaf-list predicate, e.g., [text()="abc"], becomes a content match
+        leaf-list node. Overlapping xpaths are merged, and an xpath covered by
+        another one is dropped.
+
+        Parameters
+        ----------
+
+        xpaths : `str` or `list`
+            An xpath or a list of xpaths.
+
+        config : `bool`
+            True if the filter is for get-config, so read-only nodes are not
+            allowed.
+
+        Returns
+        -------
+
+        Element
+            A filter node that can be used in get or get-config.
+
+
+        Code Example::
+
+            >>> f = m.subtree_filter([
+                    '/oc-if:interfaces/interface[name="Gi0/0"]/config',
+                    '/oc-if:interfaces/interface[name="Gi0/0"]/state/counters',
+                    ])
+            >>> print(etree.tostring(f, encoding='unicode', pretty_print=True))
+            <nc:filter xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0" type="subtree">
+              <oc-if:interfaces xmlns:oc-if="http://openconfig.net/yang/interfaces">
+                <oc-if:interface>
+                  <oc-if:name>Gi0/0</oc-if:name>
+                  <oc-if:config/>
+                  <oc-if:state>
+                    <oc-if:counters/>
+                  </oc-if:state>
+                </oc-if:interface>
+              </oc-if:interfaces>
+            </nc:filter>
+            >>>
+        '''
+
+        if isinstance(xpaths, str):
+            xpaths = [xpaths]
+        entries = {}
+        for xpath in xpaths:
+            self._add_filter_path(entries, xpath, config)
+        filter_ele = etree.Element(filter_tag, type='subtree',
+                                   nsmap={'nc': nc_url})
+        self._build_filter_nodes(filter_ele, entries)
+        return filter_ele
+
+    def _add_filter_path(self, entries, xpath, config):
+        default_ns = ''
+        record = None
+        steps = parse_xpath(xpath)
+        for index, (name, predicates) in enumerate(steps):
+            prefix, tag = self.convert_tag(default_ns, name,
+                                           src=Tag.XPATH, dst=Tag.LXML_ETREE)
+            if record is None:
+                model_name = self.roots.get(tag)
+                if model_name is None:
+                    model_name = self.auto_load_model(etree.QName(tag).namespace)
+                if model_name is None or tag not in self.roots:
+                    raise ModelMissing("root '{}' in xpath '{}' is not found "
+                                       "in loaded models of device {}"
+                                       .format(name, xpath, self))
+                record = self.schema_nodes[self.models[model_name].tree]
+            child = record.children.get(tag)
+            if child is None:
+                raise ValueError("'{}' in xpath '{}' is not a data node in "
+                                 "the schema".format(name, xpath))
+            record = child
+            if config and record.access == 'read-only':
+                raise ValueError("'{}' in xpath '{}' is read-only, so it "
+                                 "cannot be retrieved by get-config"
+                                 .format(name, xpath))
+
+            matches = []
+            text = None
+            for p_name, value in predicates:
+                if p_name in ('text()', '.') and record.type == 'leaf-list':
+                    text = value
+                    continue
+                if record.type != 'list':
+                    raise ValueError("predicate [{}] in xpath '{}' is not "
+                                     "allowed on a {}"
+                                     .format(p_name, xpath, record.type))
+                p_prefix, p_tag = self.convert_tag(prefix, p_name,
+                                                   src=Tag.XPATH,
+                                                   dst=Tag.LXML_ETREE)
+                p_record = record.children.get(p_tag)
+                if p_record is None or p_record.type != 'leaf':
+                    raise ValueError("predicate [{}] in xpath '{}' is not a "
+                                     "leaf of the list".format(p_name, xpath))
+                matches.append((p_tag, p_prefix, value))
+            order = {k: i for i, k in enumerate(record.keys)}
+            matches = tuple(sorted(set(matches),
+                                   key=lambda m: (order.get(m[0], len(order)),
+                                                  m[0], m[2])))
+
+            # nothing to add if a selected sibling covers this step
+            key = (tag, matches, text)
+            for (t, m, x), entry in entries.items():
+                if (
+                    entry['selected'] and t == tag and
+                    set(m) <= set(matches) and (x is None or x == text)
+                ):
+                    return
+            entry = entries.setdefault(key, {
+                'prefix': prefix,
+                'selected': False,
+                'children': {},
+            })
+            if index == len(steps) - 1:
+                # a selection node selects the whole subtree, so siblings it
+                # covers are removed
+                entry['selected'] = True
+                entry['children'] = {}
+                for k in [k for k in entries if k != key and k[0] == tag and
+                          set(matches) <= set(k[1]) and
+                          (text is None or k[2] == text)]:
+                    del entries[k]
+            entries = entry['children']
+            default_ns = prefix
+
+    def _build_filter_nodes(self, parent, entries):
+
+        def sub_element(parent, tag, prefix):
+            url = etree.QName(tag).namespace
+            if url == etree.QName(parent).namespace:
+                return etree.SubElement(parent, tag)
+            else:
+                return etree.SubElement(parent, tag, nsmap={prefix: url})
+
+        for (tag, matches, text), entry in entries.items():
+            node = sub_element(parent, tag, entry['prefix'])
+            if text is not None:
+                node.text = text
+            for m_tag, m_prefix, value in matches:
+                sub_element(node, m_tag, m_prefix).text = value
+            self._build_filter_nodes(node, entry['children'])
+
     def get_statement(self, node):
         '''get_statement
 
@@ -778,6 +1353,10 @@ class ModelDevice(manager.Manager):
             ...
         '''
 
+        record = self.schema_nodes.get(schema_node)
+        if record is not None:
+            return [r.element for r in record.defaults_in_use]
+
         default_nodes = []
         for child in schema_node:
             if (
@@ -987,13 +1566,15 @@ class ModelDevice(manager.Manager):
             A dict of nsmap.
         '''
 
+        url_to_prefix = self.schema.url_prefixes
+        if url_to_prefix is None:
+            self.namespaces
+            url_to_prefix = self.schema.url_prefixes
+
         def get_prefix(url):
             if url in special_prefixes:
                 return special_prefixes[url]
-            for i in self.namespaces:
-                if url == i[2]:
-                    return i[1]
-            return None
+            return url_to_prefix.get(url)
 
         root = reply.getroottree()
         urls = set()
@@ -1,22 +1,13 @@
 import math
 import os
 import re
-import queue
+import sys
+import hashlib
 import logging
 
 from lxml import etree
 from copy import deepcopy
-from ncclient import operations
-from threading import Thread, current_thread
-from pyang import statements
-try:
-    from pyang.repository import FileRepository
-except ImportError:
-    from pyang import FileRepository
-try:
-    from pyang.context import Context
-except ImportError:
-    from pyang import Context
+from concurrent.futures import ProcessPoolExecutor
 
 from .errors import ModelError
 
@@ -28,6 +19,23 @@ logging.getLogger('ncclient.operations').setLevel(logging.WARNING)
 
 PARSER = etree.XMLParser(encoding='utf-8', remove_blank_text=True)
 
+# classes that need pyang are defined in module compiler and imported lazily
+_COMPILER_CLASSES = [
+    'DownloadWorker',
+    'ContextWorker',
+    'CompilerContext',
+    'ModelDownloader',
+    'ModelCompiler',
+]
+
+
+def __getattr__(name):
+    if name in _COMPILER_CLASSES:
+        from . import compiler
+        return getattr(compiler, name)
+    raise AttributeError("module '{}' has no attribute '{}'"
+                         .format(__name__, name))
+
 
 def write_xml(filename, element):
     element_tree = etree.ElementTree(element)
@@ -51,6 +59,209 @@ def read_xml(filename):
         return None
 
 
+class SchemaNode(object):
+    '''SchemaNode
+
+    A compact record of one schema node in a Model tree. It is built once when
+    the model is loaded and maps one-to-one to the schema Element, so hot
+    paths can read pre-parsed facts instead of parsing string attributes of
+    the Element again and again.
+
+    Attributes
+    ----------
+    element : `Element`
+        The schema node as an Element object.
+
+    tag : `str`
+        Tag of the schema node in `{url}tagname` notation.
+
+    type : `str`
+        Interned node type, e.g., 'container', 'list', 'leaf', 'leaf-list',
+        'choice' or 'case'. None for the model root.
+
+    access : `str`
+        Interned access type, e.g., 'read-write', 'read-only' or 'write'.
+
+    keys : `tuple`
+        Tags of keys in `{url}tagname` notation if the node is a list, in the
+        order defined in the key statement. Otherwise an empty tuple.
+
+    is_key : `bool`
+        True if the node is a key of its parent list.
+
+    user_ordered : `bool`
+        True if the node is a list or leaf-list ordered by user.
+
+    presence : `bool`
+        True if the node is a presence container.
+
+    default : `str` or `tuple`
+        None if the node does not have a default. A string if the node is a
+        leaf, or a tuple of strings if the node is a leaf-list.
+
+    datatype : `str`
+        Interned data type of a leaf or leaf-list, otherwise None.
+
+    status : `str`
+        Interned 'deprecated' or 'obsolete', otherwise None.
+
+    mandatory : `bool`
+        True if the node is mandatory.
+
+    parent : `SchemaNode`
+        Record of the parent Element, or None for the model root.
+
+    children : `dict`
+        Data children of the node, seen through choice and case nodes.
+        Dictionary keys are tags, and values are SchemaNode instances. A value
+        is None if the tag is not unique.
+
+    defaults_in_use : `tuple`
+        SchemaNode instances of descendants whose default values are in use
+        when this node exists in a data tree, in document order. It is the
+        precomputed result of ModelDevice.default_in_use().
+    '''
+
+    __slots__ = ('element', 'tag', 'type', 'access', 'keys', 'is_key',
+                 'user_ordered', 'presence', 'default', 'datatype', 'status',
+                 'mandatory', 'parent', 'children', 'defaults_in_use')
+
+    def __init__(self, element, parent=None):
+        '''
+        __init__ instantiates a SchemaNode instance.
+        '''
+
+        def intern(value):
+            return None if value is None else sys.intern(value)
+
+        get = element.get
+        self.element = element
+        self.tag = element.tag
+        self.type = intern(get('type'))
+        self.access = intern(get('access'))
+        self.is_key = get('is_key') == 'true'
+        self.user_ordered = get('ordered-by') == 'user'
+        self.presence = get('presence') == 'true'
+        self.datatype = intern(get('datatype'))
+        self.status = intern(get('status'))
+        self.mandatory = get('mandatory') == 'true'
+        self.parent = parent
+        self.children = {}
+        self.defaults_in_use = ()
+
+        default = get('default')
+        if default is not None and self.type == 'leaf-list':
+            self.default = tuple(default.split(','))
+        else:
+            self.default = default
+
+        keys = get('key')
+        if self.type == 'list' and keys is not None:
+            # same rule as Composer.keys
+            tags = {}
+            for child in element:
+                tags.setdefault(etree.QName(child).localname, child.tag)
+            names = [k.split(':')[-1] for k in re.split(' +', keys.strip())]
+            self.keys = tuple(tags[n] for n in names if n in tags)
+        else:
+            self.keys = ()
+
+    def __repr__(self):
+        return '<{}.{} {} {} at {}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.type,
+            self.tag,
+            hex(id(self)),
+            )
+
+    @staticmethod
+    def build(tree, prefixes=None):
+        '''build
+
+        High-level api: Build SchemaNode records of a model tree.
+
+        Parameters
+        ----------
+
+        tree : `Element`
+            The model tree.
+
+        prefixes : `dict`
+            Prefixes used in the model, whose values are URLs. They resolve
+            prefixed default cases of choices.
+
+        Returns
+        -------
+
+        dict
+            A dictionary whose keys are schema Elements and values are
+            SchemaNode instances.
+        '''
+
+        records = {}
+        transparent = ('choice', 'case')
+
+        def add_child(children, tag, record):
+            if tag in children:
+                children[tag] = None
+            else:
+                children[tag] = record
+
+        def default_case(choice):
+            prefix, _, name = choice.default.rpartition(':')
+            if prefix:
+                url = (prefixes or {}).get(prefix)
+            else:
+                url = etree.QName(choice.tag).namespace
+            if url is not None:
+                case = choice.element.find('{' + url + '}' + name)
+                if case is not None:
+                    return records.get(case)
+            for case in choice.element:
+                if (
+                    isinstance(case.tag, str) and
+                    etree.QName(case).localname == name
+                ):
+                    return records.get(case)
+            return None
+
+        def defaults_in_use(child_records):
+            # same rule as ModelDevice.default_in_use()
+            defaults = []
+            for r in child_records:
+                if r.type in ('leaf', 'leaf-list') and r.default is not None:
+                    defaults.append(r)
+                elif r.type == 'choice' and r.default is not None:
+                    case = default_case(r)
+                    if case is not None:
+                        defaults.append(case)
+                        defaults.extend(case.defaults_in_use)
+                elif r.type == 'container' and not r.presence:
+                    defaults.extend(r.defaults_in_use)
+            return tuple(defaults)
+
+        def build_node(element, parent):
+            record = SchemaNode(element, parent)
+            records[element] = record
+            child_records = []
+            for child in element:
+                if not isinstance(child.tag, str):
+                    continue
+                child_record = build_node(child, record)
+                child_records.append(child_record)
+                if child_record.type in transparent:
+                    for tag, r in child_record.children.items():
+                        add_child(record.children, tag, r)
+                else:
+                    add_child(record.children, child.tag, child_record)
+            record.defaults_in_use = defaults_in_use(child_records)
+            return record
+
+        build_node(tree, None)
+        return records
+
+
 class Model(object):
     '''Model
 
@@ -84,7 +295,18 @@ class Model(object):
 
     width : `dict`
         This is used to facilitate pretty print of a model. Dictionary keys are
-        nodes in the model tree, and values are indents.
+        nodes in the model tree, and values are indents. It is filled on
+        demand and safe to use from several threads.
+
+    schema_nodes : `dict`
+        Compact records of all nodes in the model tree. Dictionary keys are
+        nodes in the model tree, and values are SchemaNode instances.
+
+    digests : `dict`
+        Digests of all subtrees in the model tree, built on first access.
+        Dictionary keys are nodes in the model tree, and values are SHA-256
+        digests. Two subtrees have the same digest if and only if
+        ModelDiff.node_equal() returns True.
     '''
 
     def __init__(self, tree):
@@ -101,6 +323,8 @@ class Model(object):
         self.urls = {v: k for k, v in self.prefixes.items()}
         self.convert_tree()
         self.width = {}
+        self.schema_nodes = SchemaNode.build(self.tree, self.prefixes)
+        self._digests = None
 
     def __str__(self):
         return self.emit_tree(self.tree)
@@ -109,6 +333,51 @@ class Model(object):
     def roots(self):
         return [c.tag for c in self.tree]
 
+    @property
+    def digests(self):
+        if self._digests is None:
+            self._digests = self.get_digests(self.tree)
+        return self._digests
+
+    @staticmethod
+    def get_digests(tree):
+        '''get_digests
+
+        High-level api: Compute digests of all subtrees of a model tree. A
+        digest covers the tag, text and attributes of a node, and digests of
+        its children regardless of their order.
+
+        Parameters
+        ----------
+
+        tree : `Element`
+            A model tree.
+
+        Returns
+        -------
+
+        dict
+            A dictionary whose keys are nodes in the tree, and values are
+            SHA-256 digests.
+        '''
+
+        digests = {}
+        # in reverse document order, children are visited before parents.
+        # XML cannot contain NUL characters, so joining fields by NUL is
+        # unambiguous
+        for node in reversed(list(tree.iter(etree.Element))):
+            text = node.text
+            fields = [node.tag, '\x01' if text is None else '\x02' + text]
+            for item in sorted(node.items()):
+                fields.extend(item)
+            digest = hashlib.sha256('\x00'.join(fields).encode('utf-8'))
+            children = [digests[c] for c in node.iterchildren(etree.Element)]
+            if children:
+                children.sort()
+                digest.update(b''.join(children))
+            digests[node] = digest.digest()
+        return digests
+
     def emit_tree(self, tree):
         '''emit_tree
 
@@ -206,15 +475,19 @@ class Model(object):
         '''
 
         parent = element.getparent()
-        if parent in self.width:
-            return self.width[parent]
+        width = self.width.get(parent)
+        if width is not None:
+            return width
         ret = 0
         for sibling in parent:
             w = len(self.get_name_str(sibling))
             if w > ret:
                 ret = w
-        self.width[parent] = math.ceil((ret + 3) / 3.0) * 3
-        return self.width[parent]
+        # threads racing here compute the same value, and the entry is added
+        # by one assignment, so the cache needs no lock
+        width = math.ceil((ret + 3) / 3.0) * 3
+        self.width[parent] = width
+        return width
 
     @staticmethod
     def get_depth_str(element, type='other'):
@@ -491,840 +764,6 @@ class Model(object):
             self.tree.remove(ns)
 
 
-class DownloadWorker(Thread):
-
-    def __init__(self, downloader):
-        Thread.__init__(self)
-        self.downloader = downloader
-
-    def run(self):
-        while not self.downloader.download_queue.empty():
-            try:
-                module = self.downloader.download_queue.get(timeout=0.01)
-            except queue.Empty:
-                pass
-            else:
-                try:
-                    self.downloader.download(module)
-                except Exception:
-                    logger.exception('Got error while downloading')
-                self.downloader.download_queue.task_done()
-        logger.debug('Thread {} exits'.format(current_thread().name))
-
-
-class ContextWorker(Thread):
-
-    def __init__(self, context):
-        Thread.__init__(self)
-        self.context = context
-
-    def run(self):
-        varnames = Context.add_module.__code__.co_varnames
-        while not self.context.modulefile_queue.empty():
-            try:
-                modulefile = self.context.modulefile_queue.get(timeout=0.01)
-            except queue.Empty:
-                pass
-            else:
-                with open(modulefile, 'r', encoding='utf-8') as f:
-                    text = f.read()
-                kwargs = {
-                    'ref': modulefile,
-                    'text': text,
-                }
-                if 'primary_module' in varnames:
-                    kwargs['primary_module'] = True
-                if 'format' in varnames:
-                    kwargs['format'] = 'yang'
-                if 'in_format' in varnames:
-                    kwargs['in_format'] = 'yang'
-                module_statement = self.context.add_module(**kwargs)
-                if module_statement is not None:
-                    self.context.update_dependencies(module_statement)
-                self.context.modulefile_queue.task_done()
-        logger.debug('Thread {} exits'.format(current_thread().name))
-
-
-class CompilerContext(Context):
-
-    def __init__(self, repository):
-        Context.__init__(self, repository)
-        self.dependencies = None
-        self.modulefile_queue = None
-        if 'prune' in dir(statements.Statement):
-            self.num_threads = 2
-        else:
-            self.num_threads = 1
-
-    def _get_latest_revision(self, modulename):
-        latest = None
-        for module_name, module_revision in self.modules:
-            if module_name == modulename and (
-                latest is None or module_revision > latest
-            ):
-                latest = module_revision
-        return latest
-
-    def get_statement(self, modulename, xpath=None):
-        revision = self._get_latest_revision(modulename)
-        if revision is None:
-            return None
-        if xpath is None:
-            return self.modules[(modulename, revision)]
-
-        # in order to follow the Xpath, the module is required to be validated
-        node_statement = self.modules[(modulename, revision)]
-        if node_statement.i_is_validated is not True:
-            return None
-
-        # xpath is given, so find the node statement
-        xpath_list = xpath.split('/')
-
-        # only absolute Xpaths are supported
-        if len(xpath_list) < 2:
-            return None
-        if (
-            xpath_list[0] == '' and xpath_list[1] == '' or
-            xpath_list[0] != ''
-        ):
-            return None
-
-        # find the node statement
-        root_prefix = node_statement.i_prefix
-        for n in xpath_list[1:]:
-            node_statement = self.get_child(root_prefix, node_statement, n)
-            if node_statement is None:
-                return None
-        return node_statement
-
-    def get_child(self, root_prefix, parent, child_id):
-        child_id_list = child_id.split(':')
-        if len(child_id_list) > 1:
-            children = [
-                c for c in parent.i_children
-                if c.arg == child_id_list[1] and
-                c.i_module.i_prefix == child_id_list[0]
-            ]
-        elif len(child_id_list) == 1:
-            children = [
-                c for c in parent.i_children
-                if c.arg == child_id_list[0] and
-                c.i_module.i_prefix == root_prefix
-            ]
-        return children[0] if children else None
-
-    def update_dependencies(self, module_statement):
-        if self.dependencies is None:
-            self.dependencies = etree.Element('modules')
-        for m in [
-            m for m in self.dependencies
-            if m.attrib.get('id') == module_statement.arg
-        ]:
-            self.dependencies.remove(m)
-        module_node = etree.SubElement(self.dependencies, 'module')
-        module_node.set('id', module_statement.arg)
-        module_node.set('type', module_statement.keyword)
-        if module_statement.keyword == 'module':
-            statement = module_statement.search_one('prefix')
-            if statement is not None:
-                module_node.set('prefix', statement.arg)
-            statement = module_statement.search_one("namespace")
-            if statement is not None:
-                namespace = etree.SubElement(module_node, 'namespace')
-                namespace.text = statement.arg
-        if module_statement.keyword == 'submodule':
-            statement = module_statement.search_one("belongs-to")
-            if statement is not None:
-                belongs_to = etree.SubElement(module_node, 'belongs-to')
-                belongs_to.set('module', statement.arg)
-
-        dependencies = set()
-        for parent_node_name, child_node_name, attr_name in [
-            ('includes', 'include', 'module'),
-            ('imports', 'import', 'module'),
-            ('revisions', 'revision', 'date'),
-            ('augments', 'augment', 'xpath'),
-            ('deviations', 'deviation', 'xpath'),
-        ]:
-            statements = module_statement.search(child_node_name)
-            if statements:
-                parent = etree.SubElement(module_node, parent_node_name)
-                for statement in statements:
-                    child = etree.SubElement(parent, child_node_name)
-                    child.set(attr_name, statement.arg)
-                    if child_node_name in ['include', 'import']:
-                        dependencies.add(statement.arg)
-                        if child_node_name == 'import':
-                            child.set('prefix',
-                                      statement.search_one('prefix').arg)
-
-        for node_name in [
-            'container',
-            'leaf',
-            'leaf-list',
-            'list',
-            'choice',
-            'uses',
-        ]:
-            exposed_statements = []
-            for stmt in module_statement.search(node_name):
-                for substmt in stmt.substmts:
-                    if (
-                        'tailf' in substmt.keyword[0] and
-                        len(substmt.keyword) == 2 and
-                        substmt.keyword[1] == 'hidden'
-                    ):
-                        break
-                else:
-                    exposed_statements.append(stmt)
-            if exposed_statements:
-                parent = etree.SubElement(module_node, 'roots')
-                break
-
-        return dependencies
-
-    def write_dependencies(self):
-        dependencies_file = os.path.join(
-            self.repository.dirs[0],
-            'dependencies.xml',
-        )
-        write_xml(dependencies_file, self.dependencies)
-
-    def read_dependencies(self):
-        dependencies_file = os.path.join(
-            self.repository.dirs[0],
-            'dependencies.xml',
-        )
-        self.dependencies = read_xml(dependencies_file)
-
-    def load_context(self):
-        self.modulefile_queue = queue.Queue()
-        for filename in os.listdir(self.repository.dirs[0]):
-            if filename.lower().endswith('.yang'):
-                filepath = os.path.join(self.repository.dirs[0], filename)
-                self.modulefile_queue.put(filepath)
-        for x in range(self.num_threads):
-            worker = ContextWorker(self)
-            worker.daemon = True
-            worker.name = 'context_worker_{}'.format(x)
-            worker.start()
-        self.modulefile_queue.join()
-        self.write_dependencies()
-
-    def validate_context(self):
-        revisions = {}
-        for mudule_name, module_revision in self.modules:
-            if mudule_name not in revisions or (
-                mudule_name in revisions and
-                revisions[mudule_name] < module_revision
-            ):
-                revisions[mudule_name] = module_revision
-        self.sort_modules()
-        self.validate()
-        if 'prune' in dir(statements.Statement):
-            for mudule_name, module_revision in revisions.items():
-                self.modules[(mudule_name, module_revision)].prune()
-
-    def sort_modules(self):
-        submodules = {k: m for k, m in self.modules.items()
-                      if m.keyword == "submodule"}
-        for k in submodules:
-            del self.modules[k]
-        self.modules.update(submodules)
-
-    def internal_reset(self):
-        self.modules = {}
-        self.revs = {}
-        self.errors = []
-        for mod, rev, handle in self.repository.get_modules_and_revisions(
-                self):
-            if mod not in self.revs:
-                self.revs[mod] = []
-            revs = self.revs[mod]
-            revs.append((rev, handle))
-
-
-class ModelDownloader(object):
-    '''ModelDownloader
-
-    Abstraction of a Netconf schema downloader.
-
-    Attributes
-    ----------
-    device : `ModelDevice`
-        Model name.
-
-    dir_yang : `str`
-        Path to yang files.
-
-    yang_capabilities : `str`
-        Path to capabilities.txt file in the folder of yang files.
-
-    need_download : `bool`
-        True if the content of capabilities.txt file disagrees with device
-        capabilities exchange. False otherwise.
-    '''
-
-    def __init__(self, nc_device, folder):
-        '''
-        __init__ instantiates a ModelDownloader instance.
-        '''
-
-        self.device = nc_device
-        self.dir_yang = os.path.abspath(folder)
-        if not os.path.isdir(self.dir_yang):
-            os.makedirs(self.dir_yang)
-        self.yang_capabilities = os.path.join(
-            self.dir_yang,
-            'capabilities.txt',
-        )
-        repo = FileRepository(path=self.dir_yang)
-        self.context = CompilerContext(repository=repo)
-        self.download_queue = queue.Queue()
-        self.num_threads = 2
-
-    @property
-    def need_download(self):
-        if os.path.isfile(self.yang_capabilities):
-            with open(self.yang_capabilities, 'r') as f:
-                c = f.read()
-            if c == '\n'.join(sorted(list(self.device.server_capabilities))):
-                return False
-        return True
-
-    def download_all(self, check_before_download=True):
-        '''download_all
-
-        High-level api: Convert cxml tree to an internal schema tree. This
-        method is recursive.
-
-        Parameters
-        ----------
-
-        check_before_download : `bool`
-            True if checking capabilities.txt file is required.
-
-        Returns
-        -------
-
-        None
-            Nothing returns.
-        '''
-
-        # check the content of self.yang_capabilities
-        if check_before_download and not self.need_download:
-            logger.info('Skip downloading as the content of {} '
-                        'matches device hello message'
-                        .format(self.yang_capabilities))
-            return
-
-        # clean up folder self.dir_yang
-        for root, dirs, files in os.walk(self.dir_yang):
-            for f in files:
-                os.remove(os.path.join(root, f))
-
-        # download all
-        self.to_be_downloaded = set(self.device.models_loadable)
-        self.context.dependencies = etree.Element('modules')
-        for module in sorted(list(self.to_be_downloaded)):
-            self.download_queue.put(module)
-        for x in range(self.num_threads):
-            worker = DownloadWorker(self)
-            worker.daemon = True
-            worker.name = 'download_worker_{}'.format(x)
-            worker.start()
-        self.download_queue.join()
-
-        # write self.yang_capabilities
-        capabilities = '\n'.join(sorted(list(self.device.server_capabilities)))
-        with open(self.yang_capabilities, 'wb') as f:
-            f.write(capabilities.encode('utf-8'))
-
-        # write dependencies
-        self.context.write_dependencies()
-
-    def download(self, module):
-        '''download
-
-        High-level api: Download a module schema.
-
-        Parameters
-        ----------
-
-        module : `str`
-            Module name that will be downloaded.
-
-        Returns
-        -------
-
-        None
-            Nothing returns.
-        '''
-
-        logger.debug('Downloading {}.yang...'.format(module))
-        try:
-            from .manager import ModelDevice
-            reply = super(ModelDevice, self.device).execute(
-                operations.retrieve.GetSchema,
-                module,
-            )
-        except operations.rpc.RPCError:
-            logger.warning("Module or submodule '{}' cannot be downloaded"
-                           .format(module))
-            return
-        if reply.ok:
-            varnames = Context.add_module.__code__.co_varnames
-            fname = os.path.join(self.dir_yang, module+'.yang')
-            with open(fname, 'wb') as f:
-                f.write(reply.data.encode('utf-8'))
-            kwargs = {
-                'ref': fname,
-                'text': reply.data,
-            }
-            if 'primary_module' in varnames:
-                kwargs['primary_module'] = True
-            if 'format' in varnames:
-                kwargs['format'] = 'yang'
-            if 'in_format' in varnames:
-                kwargs['in_format'] = 'yang'
-            module_statement = self.context.add_module(**kwargs)
-            dependencies = self.context.update_dependencies(module_statement)
-            s = dependencies - self.to_be_downloaded
-            if s:
-                logger.info('{} requires submodules: {}'
-                            .format(module, ', '.join(s)))
-                self.to_be_downloaded.update(s)
-                for m in s:
-                    self.download_queue.put(m)
-        else:
-            logger.warning("module or submodule '{}' cannot be downloaded:\n{}"
-                           .format(module, reply._raw))
-
-
-class ModelCompiler(object):
-    '''ModelCompiler
-
-    Abstraction of a YANG file compiler.
-
-    Attributes
-    ----------
-    dir_yang : `str`
-        Path to yang files.
-
-    dependencies : `Element`
-        Dependency infomation stored in an Element object.
-
-    context : `CompilerContext`
-        A CompilerContext object that holds the context of all modules.
-
-    module_prefixes : `dict`
-        A dictionary that stores module prefixes. It is keyed by module names.
-
-    module_namespaces : `dict`
-        A dictionary that stores module namespaces. It is keyed by module
-        names.
-
-    identity_deps : `dict`
-        A dictionary that stores module identities. It is keyed by bases.
-
-    pyang_errors : `list`
-        A list of tuples. Each tuple contains a pyang error.Position object,
-        an error tag and a tuple of some error arguments. It is possible to
-        call pyang.error.err_to_str() to print out detailed error messages.
-    '''
-
-    def __init__(self, folder):
-        '''
-        __init__ instantiates a ModelCompiler instance.
-        '''
-
-        self.dir_yang = os.path.abspath(folder)
-        self.context = None
-        self.module_prefixes = {}
-        self.module_namespaces = {}
-        self.identity_deps = {}
-        self.build_dependencies()
-
-    @property
-    def pyang_errors(self):
-        if self.context is None:
-            return []
-        else:
-            return self.context.errors
-
-    def _read_from_cache(self, name):
-        cached_name = os.path.join(self.dir_yang, name + ".xml")
-        return read_xml(cached_name)
-
-    def _write_to_cache(self, name, element):
-        cached_name = os.path.join(self.dir_yang, name + ".xml")
-        write_xml(cached_name, element)
-
-    def build_dependencies(self):
-        '''build_dependencies
-
-        High-level api: Briefly compile all yang files and find out dependency
-        infomation of all modules.
-
-        Returns
-        -------
-
-        None
-            Nothing returns.
-        '''
-
-        if self.context is None:
-            repo = FileRepository(path=self.dir_yang)
-            self.context = CompilerContext(repository=repo)
-        if self.context.dependencies is None:
-            self.context.read_dependencies()
-            if self.context.dependencies is None:
-                self.context.load_context()
-
-    def get_dependencies(self, module):
-        '''get_dependencies
-
-        High-level api: Get dependency infomationa of a module.
-
-        Parameters
-        ----------
-
-        module : `str`
-            Module name that is inquired about.
-
-        Returns
-        -------
-
-        tuple
-            A tuple with two elements: a set of imports and a set of depends.
-        '''
-
-        if self.context is None or self.context.dependencies is None:
-            self.build_dependencies()
-        dependencies = self.context.dependencies
-
-        imports = set()
-        for m in list(filter(lambda i: i.get('id') == module,
-                             dependencies.findall('./module'))):
-            imports.update(set(i.get('module')
-                               for i in m.findall('./imports/import')))
-        depends = set()
-        for m in dependencies:
-            if list(filter(lambda i: i.get('module') == module,
-                           m.findall('./imports/import'))):
-                depends.add(m.get('id'))
-            if list(filter(lambda i: i.get('module') == module,
-                           m.findall('./includes/include'))):
-                depends.add(m.get('id'))
-        return (imports, depends)
-
-    def compile(self, module):
-        '''compile
-
-        High-level api: Compile a module. The module cannot be a submodule.
-
-        Parameters
-        ----------
-
-        module : `str`
-            Module name that is inquired about.
-
-        Returns
-        -------
-
-        Model
-            A Model object.
-        '''
-        cached_tree = self._read_from_cache(module)
-
-        if cached_tree is not None:
-            return Model(cached_tree)
-
-        varnames = Context.add_module.__code__.co_varnames
-        imports, depends = self.get_dependencies(module)
-        required_module_set = imports | depends
-        required_module_set.add(module)
-        self.context.internal_reset()
-        for m in required_module_set:
-            modulefile = os.path.join(self.context.repository.dirs[0],
-                                      m + '.yang')
-            if os.path.isfile(modulefile):
-                with open(modulefile, 'r', encoding='utf-8') as f:
-                    text = f.read()
-                kwargs = {
-                    'ref': modulefile,
-                    'text': text,
-                }
-                if 'primary_module' in varnames:
-                    kwargs['primary_module'] = True
-                if 'format' in varnames:
-                    kwargs['format'] = 'yang'
-                if 'in_format' in varnames:
-                    kwargs['in_format'] = 'yang'
-                self.context.add_module(**kwargs)
-        self.context.validate_context()
-        vm = self.context.get_module(module)
-        st = etree.Element(vm.arg)
-        st.set('type', vm.keyword)
-        statement = vm.search_one('prefix')
-        if statement is None:
-            raise ValueError("Module '{}' is a {} which belongs to '{}'. "
-                             "Please compile '{}' instead."
-                             .format(module, vm.keyword,
-                                     vm.i_including_modulename,
-                                     vm.i_including_modulename))
-        else:
-            st.set('prefix', statement.arg)
-
-        for m_statement in self.context.modules.values():
-            if m_statement.keyword == 'module':
-                namespace = etree.SubElement(st, 'namespace')
-                namespace.set('prefix', m_statement.i_prefix)
-                statement = m_statement.search_one('namespace')
-                if statement is not None:
-                    namespace.text = statement.arg
-                    self.module_namespaces[m_statement.i_modulename] = \
-                        statement.arg
-                    etree.register_namespace(
-                        m_statement.i_prefix, statement.arg)
-
-                # prepare self.module_prefixes
-                self.module_prefixes[m_statement.i_modulename] = \
-                    m_statement.i_prefix
-
-                # prepare self.identity_deps
-                for idn in m_statement.i_identities.values():
-                    curr_idn = m_statement.arg + ':' + idn.arg
-                    base_idn = idn.search_one("base")
-                    if base_idn is None:
-                        # identity does not have a base
-                        self.identity_deps.setdefault(curr_idn, [])
-                    else:
-                        # identity has a base
-                        base_idns = base_idn.arg.split(':')
-                        if len(base_idns) > 1:
-                            # base is located in another module
-                            mn = m_statement.i_prefixes.get(base_idns[0])
-                            b_idn = base_idns[1] if mn is None \
-                                else mn[0] + ':' + base_idns[1]
-                        else:
-                            b_idn = module + ':' + base_idn.arg
-                        if self.identity_deps.get(b_idn) is None:
-                            self.identity_deps.setdefault(b_idn, [])
-                        else:
-                            self.identity_deps[b_idn].append(curr_idn)
-
-        for child in vm.i_children:
-            if child.keyword in statements.data_definition_keywords:
-                self.depict_a_schema_node(vm, st, child)
-        for child in vm.i_children:
-            if child.keyword == 'rpc':
-                self.depict_a_schema_node(vm, st, child, mode='rpc')
-        for child in vm.i_children:
-            if child.keyword == 'notification':
-                self.depict_a_schema_node(vm, st, child, mode='notification')
-
-        self._write_to_cache(module, st)
-
-        return Model(st)
-
-    def depict_a_schema_node(self, module, parent, child, mode=None):
-        n = etree.SubElement(
-            parent, '{' +
-            self.module_namespaces[child.i_module.i_modulename] +
-            '}' + child.arg)
-        self.set_access(child, n, mode)
-        n.set('type', child.keyword)
-        sm = child.search_one('status')
-        if sm is not None and sm.arg in ['deprecated', 'obsolete']:
-            n.set('status', sm.arg)
-        sm = child.search('default')
-        if sm is not None and len(sm) > 0:
-            n.set('default', ",".join(map(lambda x: x.arg, sm)))
-        if child.keyword == 'list':
-            sm = child.search_one('key')
-            if sm is not None:
-                n.set('key', sm.arg)
-            sm = child.search_one('ordered-by')
-            if sm is not None and sm.arg == 'user':
-                n.set('ordered-by', 'user')
-        elif child.keyword == 'container':
-            sm = child.search_one('presence')
-            if sm is not None:
-                n.set('presence', 'true')
-        elif child.keyword == 'choice':
-            sm = child.search_one('mandatory')
-            if sm is not None and sm.arg == 'true':
-                n.set('mandatory', 'true')
-            cases = [c.arg for c in child.search('case')]
-            if cases:
-                n.set('values', '|'.join(cases))
-        elif child.keyword in ['leaf', 'leaf-list']:
-            self.set_leaf_datatype_value(child, n)
-            sm = child.search_one('mandatory')
-            if (
-                sm is not None and sm.arg == 'true' or
-                hasattr(child, 'i_is_key')
-            ):
-                n.set('mandatory', 'true')
-
-            if hasattr(child, 'i_is_key'):
-                n.set('is_key', 'true')
-
-            if child.keyword == 'leaf-list':
-                sm = child.search_one('ordered-by')
-                if sm is not None and sm.arg == 'user':
-                    n.set('ordered-by', 'user')
-
-        # Tailf annotations
-        for ch in child.substmts:
-            if (
-                isinstance(ch.keyword, tuple) and
-                'tailf' in ch.keyword[0]
-            ):
-                if (
-                    ch.keyword[0] in self.module_namespaces and
-                    len(ch.keyword) == 2
-                ):
-                    n.set(
-                        etree.QName(self.module_namespaces[ch.keyword[0]],
-                                    ch.keyword[1]),
-                        ch.arg if ch.arg else '',
-                    )
-                else:
-                    logger.warning("Special Tailf annotation at {}, "
-                                   "keyword = {}"
-                                   .format(ch.pos, ch.keyword))
-
-        featurenames = [f.arg for f in child.search('if-feature')]
-        if hasattr(child, 'i_augment'):
-            featurenames.extend([
-                f.arg for f in child.i_augment.search('if-feature')
-                if f.arg not in featurenames
-            ])
-        if featurenames:
-            n.set('if-feature', ' '.join(featurenames))
-
-        if hasattr(child, 'i_children'):
-            for c in child.i_children:
-                if mode == 'rpc' and c.keyword in ['input', 'output']:
-                    self.depict_a_schema_node(module, n, c, mode=c.keyword)
-                else:
-                    self.depict_a_schema_node(module, n, c, mode=mode)
-
-    @staticmethod
-    def set_access(statement, node, mode):
-        if (
-            mode in ['input', 'rpc'] or
-            statement.keyword == 'rpc' or
-            statement.keyword == ('tailf-common', 'action')
-        ):
-            node.set('access', 'write')
-        elif (
-            mode in ['output', 'notification'] or
-            statement.keyword == 'notification'
-        ):
-            node.set('access', 'read-only')
-        elif hasattr(statement, 'i_config') and statement.i_config:
-            node.set('access', 'read-write')
-        else:
-            node.set('access', 'read-only')
-
-    def set_leaf_datatype_value(self, leaf_statement, leaf_node):
-        sm = leaf_statement.search_one('type')
-        if sm is None:
-            datatype = ''
-        else:
-            if sm.arg == 'leafref':
-                p = sm.search_one('path')
-                if p is not None:
-                    # Try to make the path as compact as possible.
-                    # Remove local prefixes, and only use prefix when
-                    # there is a module change in the path.
-                    target = []
-                    curprefix = leaf_statement.i_module.i_prefix
-                    for name in p.arg.split('/'):
-                        if name.find(":") == -1:
-                            prefix = curprefix
-                        else:
-                            [prefix, name] = name.split(':', 1)
-                        if prefix == curprefix:
-                            target.append(name)
-                        else:
-                            target.append(prefix + ':' + name)
-                            curprefix = prefix
-                    datatype = "-> %s" % "/".join(target)
-                else:
-                    datatype = sm.arg
-            elif sm.arg == 'identityref':
-                idn_base = sm.search_one('base')
-                datatype = sm.arg + ":" + idn_base.arg
-            else:
-                datatype = sm.arg
-            leaf_node.set('datatype', datatype)
-
-            type_values = self.type_values(sm)
-            if type_values:
-                leaf_node.set('values', type_values)
-            if sm.arg == 'union':
-                leaf_node.set(
-                    'unionmembertypes',
-                    '|'.join([m.arg for m in sm.search('type')])
-                )
-
-    def type_values(self, type_statement):
-        if type_statement is None:
-            return ''
-        if (
-            type_statement.i_is_derived is False and
-            type_statement.i_typedef is not None
-        ):
-            return self.type_values(
-                type_statement.i_typedef.search_one('type'))
-        if type_statement.arg == 'boolean':
-            return 'true|false'
-        if type_statement.arg == 'union':
-            return self.type_union_values(type_statement)
-        if type_statement.arg == 'enumeration':
-            return '|'.join([e.arg for e in type_statement.search('enum')])
-        if type_statement.arg == 'identityref':
-            return self.type_identityref_values(type_statement)
-        return ''
-
-    def type_union_values(self, type_statement):
-        vlist = []
-        for type in type_statement.search('type'):
-            v = self.type_values(type)
-            if v:
-                vlist.append(v)
-        return '|'.join(vlist)
-
-    def type_identityref_values(self, type_statement):
-        base_idn = type_statement.search_one('base')
-        if base_idn:
-            # identity has a base
-            base_idns = base_idn.arg.split(':')
-            my_modulename = type_statement.i_module.i_modulename
-            if len(base_idns) > 1:
-                modulename = \
-                    type_statement.i_module.i_prefixes.get(base_idns[0])
-                if modulename is None:
-                    return ''
-                else:
-                    idn_key = modulename[0] + ':' + base_idns[1]
-            else:
-                idn_key = my_modulename + ':' + base_idn.arg
-
-            value_stmts = []
-            values = self.identity_deps.get(idn_key, [])
-            for value in values:
-                ids = value.split(':')
-                value_stmts.append(self.module_prefixes[ids[0]] + ':' + ids[1])
-            if values:
-                return '|'.join(value_stmts)
-        return ''
-
-
 class ModelDiff(object):
     '''ModelDiff
 
@@ -1355,6 +794,11 @@ class ModelDiff(object):
     width : `dict`
         This is used to facilitate pretty print of a model. Dictionary keys are
         nodes in the model tree, and values are indents.
+
+    files : `tuple`
+        Paths of the compiled model files if the instance is returned by
+        diff_revisions(), otherwise None. In that case model1 and model2 are
+        read from the files on first access.
     '''
 
     __str__ = Model.__str__
@@ -1366,18 +810,32 @@ class ModelDiff(object):
         __init__ instantiates a Model instance.
         '''
 
-        self.model1 = model1
-        self.model2 = model2
+        self._model1 = model1
+        self._model2 = model2
+        self.files = None
         self.width = {}
         if model1.tree.tag == model2.tree.tag:
             self.tree = etree.Element(model1.tree.tag)
             if id(self.model1) != id(self.model2):
-                self.compare_nodes(model1.tree, model2.tree, self.tree)
+                self.compare_nodes(model1.tree, model2.tree, self.tree,
+                                   model1.digests, model2.digests)
         else:
             raise ValueError("cannot generate diff of different modules: "
                              "'{}' vs '{}'"
                              .format(model1.tree.tag, model2.tree.tag))
 
+    @property
+    def model1(self):
+        if self._model1 is None:
+            self._model1 = Model(read_xml(self.files[0]))
+        return self._model1
+
+    @property
+    def model2(self):
+        if self._model2 is None:
+            self._model2 = Model(read_xml(self.files[1]))
+        return self._model2
+
     def __bool__(self):
         if list(self.tree):
             return True
@@ -1408,6 +866,82 @@ class ModelDiff(object):
         else:
             return self.emit_tree(tree_modified)
 
+    @staticmethod
+    def diff_revisions(folder, revisions=None, modules=None,
+                       max_workers=None):
+        '''diff_revisions
+
+        High-level api: Diff every consecutive pair of revisions of compiled
+        models in a folder. Each sub-folder holds compiled models of one
+        revision, e.g., the folder of a ModelCompiler for one image, where a
+        file name is a module name with extension 'xml'. Modules are diffed in
+        parallel by a pool of processes, and every model is read and digested
+        once even though it is in two pairs.
+
+        Parameters
+        ----------
+
+        folder : `str`
+            A folder of revisions.
+
+        revisions : `list`
+            Names of sub-folders from the oldest revision to the newest one.
+            The default is all sub-folders sorted by names.
+
+        modules : `list`
+            Names of modules to be diffed. The default is all modules found.
+
+        max_workers : `int`
+            Maximum number of worker processes. The default is the number of
+            processors.
+
+        Returns
+        -------
+
+        dict
+            A dictionary whose keys are module names, and values are lists of
+            tuples (revision1, revision2, ModelDiff). A module is diffed
+            between consecutive revisions that have it, so modules in only
+            one revision are not in the dictionary.
+        '''
+
+        if not os.path.isdir(folder):
+            raise ValueError("'{}' is not a folder".format(folder))
+        if revisions is None:
+            revisions = sorted(r for r in os.listdir(folder)
+                               if os.path.isdir(os.path.join(folder, r)))
+        files = {}
+        for revision in revisions:
+            path = os.path.join(folder, revision)
+            if not os.path.isdir(path):
+                raise ValueError("'{}' is not a folder".format(path))
+            for file_name in sorted(os.listdir(path)):
+                module, ext = os.path.splitext(file_name)
+                if ext.lower() != '.xml' or module == 'dependencies':
+                    continue
+                if modules is None or module in modules:
+                    files.setdefault(module, []).append(
+                        (revision, os.path.join(path, file_name)))
+        files = {k: v for k, v in files.items() if len(v) > 1}
+
+        ret = {}
+        if not files:
+            return ret
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(_diff_module, files.values())
+            for module, trees in zip(files, results):
+                ret[module] = []
+                pairs = zip(files[module], files[module][1:])
+                for ((revision1, file1), (revision2, file2)), tree in \
+                        zip(pairs, trees):
+                    diff = ModelDiff.__new__(ModelDiff)
+                    diff._model1 = diff._model2 = None
+                    diff.files = (file1, file2)
+                    diff.width = {}
+                    diff.tree = etree.fromstring(tree)
+                    ret[module].append((revision1, revision2, diff))
+        return ret
+
     def compare(self, xpath):
         '''compare
 
@@ -1551,7 +1085,7 @@ class ModelDiff(object):
         return spaces + element.get('diff')
 
     @staticmethod
-    def compare_nodes(node1, node2, ret):
+    def compare_nodes(node1, node2, ret, digests1=None, digests2=None):
         '''compare_nodes
 
         High-level api: Compare node1 and node2 and put the result in ret.
@@ -1568,6 +1102,14 @@ class ModelDiff(object):
         ret : `Element`
             A node in self.tree.
 
+        digests1 : `dict`
+            Subtree digests of the tree of node1, e.g., Model.digests. If
+            both digests1 and digests2 are given, peers are compared by
+            digests, otherwise by node_equal().
+
+        digests2 : `dict`
+            Subtree digests of the tree of node2.
+
         Returns
         -------
 
@@ -1575,24 +1117,90 @@ class ModelDiff(object):
             Nothing returns.
         '''
 
+        if digests1 is None or digests2 is None:
+            digests1 = digests2 = None
+        peers1 = ModelDiff.index_peers(node1)
+        peers2 = ModelDiff.index_peers(node2)
         for child in node2:
-            peer = ModelDiff.get_peer(child.tag, node1)
+            peer = ModelDiff.find_peer(child.tag, peers1)
             if peer is None:
                 ModelDiff.copy_subtree(ret, child, 'added')
             else:
-                if ModelDiff.node_equal(peer, child):
+                if digests1 is None:
+                    equal = ModelDiff.node_equal(peer, child)
+                else:
+                    equal = digests1[peer] == digests2[child]
+                if equal:
                     continue
                 else:
                     if child.attrib['type'] in ['leaf-list', 'leaf']:
                         ModelDiff.copy_node(ret, child, 'modified')
                     else:
                         ret_child = ModelDiff.copy_node(ret, child, '')
-                        ModelDiff.compare_nodes(peer, child, ret_child)
+                        ModelDiff.compare_nodes(peer, child, ret_child,
+                                                digests1, digests2)
         for child in node1:
-            peer = ModelDiff.get_peer(child.tag, node2)
+            peer = ModelDiff.find_peer(child.tag, peers2)
             if peer is None:
                 ModelDiff.copy_subtree(ret, child, 'deleted')
 
+    @staticmethod
+    def index_peers(node):
+        '''index_peers
+
+        Low-level api: Group children of a node by their tags, so peers are
+        found without searching the node again.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A node in a model tree.
+
+        Returns
+        -------
+
+        dict
+            A dictionary whose keys are tags, and values are lists of
+            children.
+        '''
+
+        peers = {}
+        for child in node:
+            peers.setdefault(child.tag, []).append(child)
+        return peers
+
+    @staticmethod
+    def find_peer(tag, peers):
+        '''find_peer
+
+        Low-level api: Same as get_peer(), but looks up a dictionary returned
+        by index_peers().
+
+        Parameters
+        ----------
+
+        tag : `str`
+            A tag in `{namespace}tagname` notaion.
+
+        peers : `dict`
+            A dictionary returned by index_peers().
+
+        Returns
+        -------
+
+        Element or None
+            None if not found. An Element object when found.
+        '''
+
+        children = peers.get(tag)
+        if children is None:
+            return None
+        elif len(children) > 1:
+            raise ModelError("not unique tag '{}'".format(tag))
+        else:
+            return children[0]
+
     @staticmethod
     def copy_subtree(ret, element, msg):
         '''copy_subtree
@@ -1821,3 +1429,20 @@ class ModelDiff(object):
                 if ModelDiff.trim(child, msg):
                     parent.remove(child)
         return len(list(parent)) == 0
+
+
+def _diff_module(files):
+    # run in a worker process of ModelDiff.diff_revisions(): diff
+    # consecutive revisions of one module and return serialized diff trees
+    trees = []
+    model1 = None
+    for revision, file_name in files:
+        tree = read_xml(file_name)
+        if tree is None:
+            raise ValueError("cannot read compiled model '{}'"
+                             .format(file_name))
+        model2 = Model(tree)
+        if model1 is not None:
+            trees.append(etree.tostring(ModelDiff(model1, model2).tree))
+        model1 = model2
+    return trees
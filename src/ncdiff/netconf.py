@@ -1,12 +1,17 @@
 import re
 import json
 import logging
+from bisect import bisect_left
+from collections import namedtuple
+from xml.parsers import expat
 from lxml import etree
 from copy import deepcopy
 from ncclient import operations, xml_
 
 from .errors import ConfigDeltaError, ModelError
 from .calculator import BaseCalculator
+from .composer import Tag
+from .stats import stats_phase
 
 # create a logger for this module
 logger = logging.getLogger(__name__)
@@ -34,6 +39,56 @@ def _inserterror(direction, path, attr_name, attr_value=None):
                                .format(path, direction, attr_name))
 
 
+ChangeRecord = namedtuple('ChangeRecord', ['xpath', 'kind', 'old_value',
+                                           'new_value', 'schema_type'])
+ChangeRecord.__doc__ = '''ChangeRecord
+
+One change between two configs, yielded by NetconfCalculator.changes().
+
+Attributes
+----------
+xpath : `str`
+    Xpath of the changed node, in the notation of ModelDevice.get_xpath().
+
+kind : `str`
+    'create', 'delete', 'modify' or 'move'.
+
+old_value : `str` or `int`
+    Old text value of a leaf or leaf-list, old position of a moved instance,
+    or None.
+
+new_value : `str` or `int`
+    New text value of a leaf or leaf-list, new position of a moved instance,
+    or None.
+
+schema_type : `str`
+    Type of the schema node, e.g., 'leaf', 'container' or 'list'.
+'''
+
+
+def _kept_positions(positions):
+    # indexes of a longest increasing subsequence of positions
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(positions)
+    for index, position in enumerate(positions):
+        i = bisect_left(tails, position)
+        if i > 0:
+            previous[index] = tail_indexes[i-1]
+        if i == len(tails):
+            tails.append(position)
+            tail_indexes.append(index)
+        else:
+            tails[i] = position
+            tail_indexes[i] = index
+    kept = set()
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        kept.add(index)
+        index = previous[index]
+    return kept
+
+
 def _copy_element(new_parent, element):
     new_child = etree.SubElement(new_parent, element.tag,
                                  attrib=element.attrib,
@@ -113,6 +168,290 @@ class NetconfParser(object):
         return ret
 
 
+class NetconfChunker(object):
+    '''NetconfChunker
+
+    A chunker to split the Netconf presentation of a ConfigDelta instance into
+    an ordered list of smaller edit-config payloads. Each payload stays under
+    a byte budget and/or a node budget when possible. Keys of a list entry
+    always travel with the entry, units that contain delete or remove
+    operations are sent before units that create or merge content, and
+    entries of user-ordered lists keep their document order so that the
+    anchors referred by yang:insert exist before they are referenced.
+
+    Attributes
+    ----------
+    device : `object`
+        An instance of yang.ncdiff.ModelDevice, which represents a modeled
+        device.
+
+    delta : `Element`
+        The edit-config content to be split, i.e., ConfigDelta.nc.
+
+    max_bytes : `int`
+        Budget of serialized size of one chunk in bytes. None means no limit.
+
+    max_nodes : `int`
+        Budget of the number of nodes in one chunk. None means no limit.
+
+    chunks : `list`
+        A list of tuples. Each tuple has two elements: an edit-config content
+        Element rooted at nc:config, and its serialized size in bytes.
+    '''
+
+    def __init__(self, device, delta, max_bytes=None, max_nodes=None):
+        '''
+        __init__ instantiates a NetconfChunker instance.
+        '''
+
+        for name, value in [('max_bytes', max_bytes),
+                            ('max_nodes', max_nodes)]:
+            if value is not None and (
+                not isinstance(value, int) or value <= 0
+            ):
+                raise ValueError("argument '{}' must be a positive integer "
+                                 "or None, but not {} '{}'"
+                                 .format(name, type(value), value))
+        self.device = device
+        self.delta = delta
+        self.max_bytes = max_bytes
+        self.max_nodes = max_nodes
+        self._spine_sizes = {}
+
+    @property
+    def chunks(self):
+        self._spine_sizes = {}
+        units = []
+        for child in self.delta:
+            units += self.split(child, [])
+
+        # deletes go first, but entries carrying yang:insert stay in document
+        # order with their anchors
+        first = [u for u in units if u[4]]
+        second = [u for u in units if not u[4]]
+
+        chunks = []
+        current = None
+        for spine, node, size, count, _ in first + second:
+            if current is not None:
+                added_size, added_count = self._get_added_size(
+                    current[3], spine, size, count)
+                if not self._fits(current[1] + added_size,
+                                  current[2] + added_count):
+                    chunks.append(current[0])
+                    current = None
+            if current is None:
+                root = etree.Element(config_tag, nsmap={'nc': nc_url})
+                current = [root, *self._get_spine_size([]), {}]
+                added_size, added_count = self._get_added_size(
+                    current[3], spine, size, count)
+            current[1] += added_size
+            current[2] += added_count
+            self._add_unit(current[0], current[3], spine, node)
+        if current is not None:
+            chunks.append(current[0])
+
+        ret = []
+        for chunk in chunks:
+            size = len(etree.tostring(chunk))
+            count = self._count_nodes(chunk)
+            if not self._fits(size, count):
+                logger.warning("a chunk of {} bytes and {} nodes exceeds the "
+                               "budget".format(size, count))
+            ret.append((chunk, size))
+        return ret
+
+    def split(self, node, spine, sizes=None):
+        '''split
+
+        High-level api: Split a node of the delta into units that are small
+        enough to fit in one chunk. A unit fits if a chunk of the unit alone,
+        i.e., nc:config, copies of the spine with their list keys, and the
+        node, is within the budgets. This method is recursive.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A node in the delta.
+
+        spine : `list`
+            A list of ancestors of the node, starting from a root of a model.
+
+        sizes : `dict`
+            Sizes of nodes returned by get_sizes(). They are computed from
+            the node if it is None.
+
+        Returns
+        -------
+
+        list
+            A list of units. Each unit is a tuple of five elements: the spine,
+            the node, the size of the node in bytes, the number of nodes in
+            it, and a flag indicating whether the unit must be sent before
+            other units.
+        '''
+
+        if sizes is None:
+            sizes = self.get_sizes(node)
+        size, count = sizes[node]
+        spine_size, spine_count = self._get_spine_size(spine)
+        fits = self._fits(spine_size + size, spine_count + count)
+        if fits or not self._is_splittable(node):
+            if not fits:
+                logger.warning("node {} cannot be split and it exceeds the "
+                               "budget of a chunk"
+                               .format(self.device.get_xpath(node)))
+            return [(spine, node, size, count,
+                     self._goes_first(node, spine))]
+
+        keys = self._get_keys(node)
+        units = []
+        for child in node:
+            if child.tag in keys:
+                continue
+            units += self.split(child, spine + [node], sizes)
+        return units
+
+    @staticmethod
+    def get_sizes(node):
+        '''get_sizes
+
+        High-level api: Compute the serialized size and the number of nodes
+        of every node in a subtree. The subtree is serialized once under
+        nc:config, as it is in a chunk, and positions where elements start
+        and end are taken from an expat parser.
+
+        Parameters
+        ----------
+
+        node : `Element`
+            A node in the delta.
+
+        Returns
+        -------
+
+        dict
+            A dictionary whose keys are nodes in the subtree, and values are
+            tuples of the size in bytes and the number of nodes.
+        '''
+
+        root = etree.Element(config_tag, nsmap={'nc': nc_url})
+        root.append(deepcopy(node))
+        data = etree.tostring(root)
+        # the copy has the same document order, and nc:config comes first
+        elements = [root] + list(node.iter(etree.Element))
+        starts = []
+        stack = []
+        sizes = {}
+        parser = expat.ParserCreate()
+
+        def start(name, attrs):
+            stack.append(len(starts))
+            starts.append(parser.CurrentByteIndex)
+
+        def end(name):
+            index = stack.pop()
+            begin = starts[index]
+            # lxml escapes '>' in text and attribute values
+            tag_end = data.index(b'>', begin) + 1
+            if data[tag_end - 2:tag_end] == b'/>':
+                finish = tag_end
+            else:
+                finish = data.index(b'>', parser.CurrentByteIndex) + 1
+            sizes[elements[index]] = finish - begin
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.Parse(data, True)
+
+        ret = {}
+        # in reverse document order, children are visited before parents
+        for element in reversed(elements[1:]):
+            ret[element] = (sizes[element],
+                            1 + sum(ret[c][1] for c in
+                                    element.iterchildren(etree.Element)))
+        return ret
+
+    def _get_spine_size(self, spine):
+        # size and node count of nc:config with copies of the spine, where
+        # the last copy is open so a node can be added to it
+        key = tuple(spine)
+        if key not in self._spine_sizes:
+            root = etree.Element(config_tag, nsmap={'nc': nc_url})
+            parent = root
+            for n in spine:
+                parent = self._copy_spine_node(n, parent)
+            if parent.text is None:
+                parent.text = ''
+            self._spine_sizes[key] = (len(etree.tostring(root)),
+                                      self._count_nodes(root))
+        return self._spine_sizes[key]
+
+    def _get_added_size(self, copies, spine, size, count):
+        # size and node count a unit adds to a chunk, where spine nodes
+        # copied already are shared with units in the chunk
+        shared = 0
+        while shared < len(spine) and spine[shared] in copies:
+            shared += 1
+        spine_size, spine_count = self._get_spine_size(spine)
+        base_size, base_count = self._get_spine_size(spine[:shared])
+        return spine_size - base_size + size, spine_count - base_count + count
+
+    def _fits(self, size, count):
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        if self.max_nodes is not None and count > self.max_nodes:
+            return False
+        return True
+
+    def _is_splittable(self, node):
+        if node.get(operation_tag, default='merge') != 'merge':
+            return False
+        keys = self._get_keys(node)
+        return len([c for c in node if c.tag not in keys]) > 0
+
+    def _get_keys(self, node):
+        return self.device.get_schema_record(node).keys
+
+    def _goes_first(self, node, spine):
+        for n in spine:
+            if n.get(insert_tag) is not None:
+                return False
+        deletes = False
+        for n in node.iter():
+            if n.get(insert_tag) is not None:
+                return False
+            if n.get(operation_tag) in ('delete', 'remove'):
+                deletes = True
+        return deletes
+
+    @staticmethod
+    def _count_nodes(node):
+        return sum(1 for n in node.iter())
+
+    def _copy_spine_node(self, node, parent=None):
+        if parent is None:
+            e = etree.Element(node.tag, attrib=node.attrib, nsmap=node.nsmap)
+        else:
+            e = etree.SubElement(parent, node.tag, attrib=node.attrib,
+                                 nsmap=node.nsmap)
+        e.text = node.text
+        for key in self._get_keys(node):
+            key_node = node.find(key)
+            if key_node is not None:
+                e.append(deepcopy(key_node))
+        return e
+
+    def _add_unit(self, root, copies, spine, node):
+        parent = root
+        for n in spine:
+            if n not in copies:
+                copies[n] = self._copy_spine_node(n, parent)
+            parent = copies[n]
+        parent.append(deepcopy(node))
+
+
 class NetconfCalculator(BaseCalculator):
     '''NetconfCalculator
 
@@ -194,28 +533,62 @@ class NetconfCalculator(BaseCalculator):
 
     @property
     def add(self):
-        ele1 = deepcopy(self.etree1)
-        ele2 = deepcopy(self.etree2)
-        self.node_add(ele1, ele2)
+        with stats_phase(self.stats, 'add'):
+            ele1 = deepcopy(self.etree1)
+            ele2 = deepcopy(self.etree2)
+            if self.stats is not None:
+                self.stats.tree_size(ele1, ele2)
+            self.node_add(ele1, ele2)
+            self._record_parse_text()
         return ele1
 
     @property
     def sub(self):
-        ele1 = deepcopy(self.etree1)
-        ele2 = deepcopy(self.etree2)
-        if self.diff_type == 'replace' and self.replace_depth == 0:
-            self.get_config_replace(ele1, ele2)
-        else:
-            self.node_sub(ele1, ele2, depth=0)
-        # add attribute at depth if diff_type is 'minimum-replace'
-        if self.diff_type == 'minimum-replace' and self.replace_xpath:
-            namespaces = self.device._get_ns(ele1)
-            logger.debug("Namespaces:\n{}".format(json.dumps(namespaces, indent=2)))
-            self.add_attribute_by_xpath(ele1, self.replace_xpath, 'operation', 'replace', namespaces)
-        elif self.diff_type == 'minimum-replace':
-            self.add_attribute_at_depth(ele1, self.replace_depth+1, 'operation', 'replace')
+        with stats_phase(self.stats, 'sub'):
+            ele1 = deepcopy(self.etree1)
+            ele2 = deepcopy(self.etree2)
+            if self.stats is not None:
+                self.stats.tree_size(ele1, ele2)
+            if self.diff_type == 'replace' and self.replace_depth == 0:
+                self.get_config_replace(ele1, ele2)
+            else:
+                self.node_sub(ele1, ele2, depth=0)
+            # add attribute at depth if diff_type is 'minimum-replace'
+            if self.diff_type == 'minimum-replace' and self.replace_xpath:
+                namespaces = self.device._get_ns(ele1)
+                logger.debug("Namespaces:\n{}".format(json.dumps(namespaces, indent=2)))
+                self.add_attribute_by_xpath(ele1, self.replace_xpath, 'operation', 'replace', namespaces)
+            elif self.diff_type == 'minimum-replace':
+                self.add_attribute_at_depth(ele1, self.replace_depth+1, 'operation', 'replace')
+            self._record_parse_text()
         return ele1
 
+    def changes(self, type=Tag.XPATH):
+        '''changes
+
+        High-level api: Yield the changes from self.etree2 to self.etree1 as
+        ChangeRecord instances. Nodes are paired in the same way as
+        node_sub(), but no edit-config is built and neither config is copied.
+        Records describe the minimum diff regardless of preferred_create,
+        preferred_replace, preferred_delete and diff_type.
+
+        Parameters
+        ----------
+
+        type : `tuple`
+            A tuple constant defined in yang.ncdiff.Tag, which is the notation
+            of xpaths in records. Most commonly it could be Tag.XPATH or
+            Tag.LXML_XPATH.
+
+        Returns
+        -------
+
+        generator
+            A generator of ChangeRecord instances.
+        '''
+
+        return self.node_changes(self.etree1, self.etree2, type)
+
     def add_attribute_at_depth(self, root, depth, attribute, value):
         '''add_attribute_at_depth
         High-level api: Add an attribute to all nodes at a specified depth.
@@ -471,6 +844,8 @@ class NetconfCalculator(BaseCalculator):
             There is no return of this method.
         '''
 
+        if self.stats is not None:
+            self.stats.visit('add')
         supported_node_type = [
             'leaf',
             'leaf-list',
@@ -1053,6 +1428,8 @@ class NetconfCalculator(BaseCalculator):
             There is no return of this method.
         '''
 
+        if self.stats is not None:
+            self.stats.visit('sub')
         if self.preferred_replace != 'merge':
             t_self = [
                 c.tag for c in list(node_self)
@@ -1261,6 +1638,86 @@ class NetconfCalculator(BaseCalculator):
                             ]
                             item.set(key_tag, ''.join(id_list))
 
+    def node_changes(self, node_self, node_other, type=Tag.XPATH):
+        '''node_changes
+
+        Low-level api: Yield changes from node_other to node_self. A created or
+        deleted subtree is one record at its root. A modified leaf is one
+        record with old and new values. Instances of a user-ordered list or
+        leaf-list that change their relative order are 'move' records with
+        old and new positions, and the fewest instances are reported. This is
+        a recursive method.
+
+        Parameters
+        ----------
+
+        node_self : `Element`
+            A config node in the new config.
+
+        node_other : `Element`
+            The peer config node in the old config.
+
+        type : `tuple`
+            A tuple constant defined in yang.ncdiff.Tag.
+
+        Returns
+        -------
+
+        generator
+            A generator of ChangeRecord instances.
+        '''
+
+        if self.stats is not None:
+            self.stats.visit('changes')
+        in_s_not_in_o, in_o_not_in_s, in_s_and_in_o = \
+            self._group_kids(node_self, node_other)
+        for kind, children in (('create', in_s_not_in_o),
+                               ('delete', in_o_not_in_s)):
+            for child in children:
+                record = self.device.get_schema_record(child)
+                value = None
+                if record.type in ('leaf', 'leaf-list'):
+                    value = self._parse_text(child)
+                yield ChangeRecord(self.device.get_xpath(child, type=type),
+                                   kind,
+                                   value if kind == 'delete' else None,
+                                   value if kind == 'create' else None,
+                                   record.type)
+        ordered_by_user = set()
+        for child_self, child_other in in_s_and_in_o:
+            record = self.device.get_schema_record(child_self)
+            if record.user_ordered:
+                ordered_by_user.add(child_self.tag)
+            if record.type == 'leaf':
+                if not self._same_text(child_self, child_other):
+                    yield ChangeRecord(
+                        self.device.get_xpath(child_self, type=type),
+                        'modify',
+                        self._parse_text(child_other),
+                        self._parse_text(child_self),
+                        record.type)
+            elif record.type in ('container', 'list'):
+                yield from self.node_changes(child_self, child_other, type)
+            elif record.type != 'leaf-list':
+                path = self.device.get_xpath(child_self)
+                raise ModelError("unknown schema node type: type of node {}"
+                                 "is '{}'".format(path, record.type))
+        if not ordered_by_user:
+            return
+        peers = dict(in_s_and_in_o)
+        for tag in sorted(ordered_by_user):
+            old_positions = {c: i for i, c in
+                             enumerate(node_other.iterchildren(tag=tag))}
+            common = [(i, c, old_positions[peers[c]])
+                      for i, c in enumerate(node_self.iterchildren(tag=tag))
+                      if c in peers]
+            kept = _kept_positions([old for i, c, old in common])
+            for index, (new, child, old) in enumerate(common):
+                if index not in kept:
+                    record = self.device.get_schema_record(child)
+                    yield ChangeRecord(self.device.get_xpath(child, type=type),
+                                       'move', old, new, record.type)
+
     def set_create_operation(self, node):
         '''set_create_operation
 
@@ -1281,22 +1738,26 @@ class NetconfCalculator(BaseCalculator):
             There is no return of this method.
         '''
 
-        schema_node = self.device.get_schema_node(node)
+        self._set_create_operation(node,
+                                   self.device.get_schema_record(node))
 
+    def _set_create_operation(self, node, record):
         # Create operation on non-presence containers is not allowed as per
         # ConfD implementation although the expected behavior is ambiguous in
         # RFC7950. More discussion can be found in the Tail-F ticket PS-47089.
-        if (
-            schema_node.get('type') == 'container' and
-            schema_node.get('presence') != 'true'
-        ):
-            default_xpaths = [self.device.get_xpath(n)
-                              for n in self.device.default_in_use(schema_node)]
+        if record.type == 'container' and not record.presence:
+            # schema nodes of defaults are precomputed and compared by
+            # identity; the tuple keeps the schema order, so it is turned
+            # into a set once for the lookups below
+            defaults = frozenset(record.defaults_in_use)
             for child in node:
-                child_xpath = self.device.get_xpath(
-                    self.device.get_schema_node(child))
-                if child_xpath not in default_xpaths:
-                    self.set_create_operation(child)
+                if not isinstance(child.tag, str):
+                    continue
+                child_record = record.children.get(child.tag)
+                if child_record is None:
+                    child_record = self.device.get_schema_record(child)
+                if child_record not in defaults:
+                    self._set_create_operation(child, child_record)
         else:
             node.set(operation_tag, 'create')
 
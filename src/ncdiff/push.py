@@ -0,0 +1,641 @@
+import logging
+from lxml import etree
+from copy import deepcopy
+from threading import Lock
+from urllib.parse import unquote
+from ncclient import xml_
+
+from .config import Config
+from .errors import ConfigDeltaError, ModelMissing
+from .netconf import NetconfCalculator
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+nc_url = xml_.BASE_NS_1_0
+yang_url = 'urn:ietf:params:xml:ns:yang:1'
+config_tag = '{' + nc_url + '}config'
+operation_tag = '{' + nc_url + '}operation'
+insert_tag = '{' + yang_url + '}insert'
+value_tag = '{' + yang_url + '}value'
+key_tag = '{' + yang_url + '}key'
+
+# yang-patch operations of RFC 8072 and their edit-config operations in
+# strict mode and in tolerant mode
+OPERATIONS = {
+    'create': ('create', 'merge'),
+    'delete': ('delete', 'remove'),
+    'insert': ('create', 'merge'),
+    'merge': ('merge', 'merge'),
+    'move': ('merge', 'merge'),
+    'replace': ('replace', 'replace'),
+    'remove': ('remove', 'remove'),
+}
+
+
+def _localname(node):
+    return etree.QName(node).localname
+
+
+def _find(parent, name):
+    for child in parent.iterchildren(tag=etree.Element):
+        if _localname(child) == name:
+            return child
+    return None
+
+
+def _findall(parent, name):
+    return [child for child in parent.iterchildren(tag=etree.Element)
+            if _localname(child) == name]
+
+
+def _findtext(parent, name):
+    child = _find(parent, name)
+    if child is None or child.text is None:
+        return None
+    return child.text.strip()
+
+
+def _with_nsmap(node, nsmap):
+    # lxml cannot add prefixes to an existing element, so build a new one
+    if all(node.nsmap.get(p) == u for p, u in nsmap.items()):
+        return node
+    new_nsmap = dict(node.nsmap)
+    new_nsmap.update(nsmap)
+    new_node = etree.Element(node.tag, attrib=node.attrib, nsmap=new_nsmap)
+    new_node.text = node.text
+    new_node.extend(list(node))
+    return new_node
+
+
+def _quote(value):
+    if "'" in value:
+        return '"{}"'.format(value)
+    return "'{}'".format(value)
+
+
+class PushEvent(object):
+    '''PushEvent
+
+    A change event produced when a YANG-push notification is applied to the
+    cached config.
+
+    Attributes
+    ----------
+    subscription_id : `str`
+        The subscription id in the notification.
+
+    event_time : `str`
+        The eventTime of the notification.
+
+    kind : `str`
+        'push-change-update' if edits were applied, or 'push-update' if the
+        cached config was replaced by a full datastore snapshot.
+
+    edits : `list`
+        A list of tuples (edit-id, operation, target) of yang-patch edits
+        that changed the config. Edits skipped in tolerant mode are not
+        included.
+
+    previous_digest : `str`
+        Digest of the cached config before the notification.
+
+    digest : `str`
+        Digest of the cached config after the notification.
+
+    changed : `bool`
+        True if the digest changed.
+    '''
+
+    def __init__(self, subscription_id, event_time, kind, edits,
+                 previous_digest, digest):
+        '''
+        __init__ instantiates a PushEvent instance.
+        '''
+
+        self.subscription_id = subscription_id
+        self.event_time = event_time
+        self.kind = kind
+        self.edits = edits
+        self.previous_digest = previous_digest
+        self.digest = digest
+
+    def __repr__(self):
+        return '<{}.{} {} {} edits at {}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.kind,
+            len(self.edits),
+            hex(id(self)),
+            )
+
+    def __bool__(self):
+        return self.changed
+
+    @property
+    def changed(self):
+        return self.previous_digest != self.digest
+
+
+class PushSubscriber(object):
+    '''PushSubscriber
+
+    Maintain a cached config of a device from YANG-push notifications
+    (RFC 8641) instead of periodic get-config. Each edit of the yang-patch
+    (RFC 8072) in a push-change-update is converted to an edit-config
+    payload and applied in place by NetconfCalculator.node_add(), so the
+    result is the same as applying the edit-config to the cached config.
+    Edits of one notification are applied atomically: nodes on the path of
+    each edit are saved before it is applied, and they are restored if an
+    edit fails. A push-update replaces the cached config. Digests of all
+    subtrees are kept, so the digest of the cached config is kept up to date
+    by computing digests of touched paths only, and a PushEvent is produced
+    for each notification.
+
+    Targets can be data resource identifiers, e.g.,
+    '/jon:address=Tom,Smith', or instance identifiers, e.g.,
+    "/jon:address[jon:first='Tom'][jon:last='Smith']". Prefixes are resolved
+    by namespace declarations of the target element, then by model names and
+    model prefixes of the device.
+
+    Attributes
+    ----------
+    config : `Config`
+        The cached config. It is changed in place by push-change-updates,
+        and replaced by push-updates.
+
+    digest : `str`
+        Digest of the cached config.
+
+    device : `ModelDevice`
+        The device of the cached config.
+
+    subscription_id : `str`
+        Only notifications of this subscription are processed if it is not
+        None.
+
+    strict : `bool`
+        If True, yang-patch create and delete keep their edit-config
+        semantics, so a notification that does not fit the cached config
+        raises ConfigDeltaError. If False, create is applied as merge, delete
+        as remove, and edits deleting nodes that are not cached are skipped.
+
+    callback : `callable`
+        A callable that is called with each PushEvent, or None.
+
+    counters : `dict`
+        Dictionary keys are 'notifications', 'edits', 'skipped', 'resyncs'
+        and 'ignored'. 'ignored' is the number of notifications that are not
+        YANG-push updates of the subscription.
+    '''
+
+    def __init__(self, config, subscription_id=None, strict=False,
+                 callback=None):
+        '''
+        __init__ instantiates a PushSubscriber instance.
+        '''
+
+        if not isinstance(config, Config):
+            raise TypeError("argument 'config' must be yang.ncdiff.Config, "
+                            "but not '{}'".format(type(config)))
+        self.config = config
+        self._digests = {}
+        self.digest = self._get_digest()
+        self.subscription_id = None if subscription_id is None \
+            else str(subscription_id)
+        self.strict = strict
+        self.callback = callback
+        self._lock = Lock()
+        self.counters = {'notifications': 0, 'edits': 0, 'skipped': 0,
+                         'resyncs': 0, 'ignored': 0}
+
+    def __repr__(self):
+        return '<{}.{} {} at {}>'.format(self.__class__.__module__,
+                                         self.__class__.__name__,
+                                         self.digest[:12],
+                                         hex(id(self)))
+
+    @property
+    def device(self):
+        return self.config.device
+
+    def process(self, notification):
+        '''process
+
+        High-level api: Apply one notification to the cached config.
+
+        Parameters
+        ----------
+
+        notification : `Notification` or `Element` or `str`
+            A Notification instance of ncclient, or a notification message as
+            an Element or an XML string.
+
+        Returns
+        -------
+
+        PushEvent
+            A PushEvent instance, or None if the notification is not a
+            push-change-update or push-update of the subscription.
+        '''
+
+        root = self._get_element(notification)
+        if _localname(root) in ('push-change-update', 'push-update'):
+            update = root
+        else:
+            update = _find(root, 'push-change-update')
+            if update is None:
+                update = _find(root, 'push-update')
+        subscription_id = None if update is None \
+            else _findtext(update, 'id')
+        if update is None or (
+            self.subscription_id is not None and
+            subscription_id != self.subscription_id
+        ):
+            with self._lock:
+                self.counters['ignored'] += 1
+            return None
+        event_time = _findtext(root, 'eventTime')
+        kind = _localname(update)
+
+        with self._lock:
+            previous_digest = self.digest
+            if kind == 'push-update':
+                contents = _find(update, 'datastore-contents')
+                ele = etree.Element(config_tag, nsmap={'nc': nc_url})
+                if contents is not None:
+                    for child in contents.iterchildren(tag=etree.Element):
+                        ele.append(deepcopy(child))
+                self.config = Config(self.device, ele, False)
+                self._digests = {}
+                applied, skipped = [], 0
+                self.counters['resyncs'] += 1
+            else:
+                applied, skipped = self._apply_changes(update)
+            self.counters['edits'] += len(applied)
+            self.counters['skipped'] += skipped
+            self.digest = self._get_digest()
+            self.counters['notifications'] += 1
+            event = PushEvent(subscription_id, event_time, kind, applied,
+                              previous_digest, self.digest)
+        if event.changed:
+            logger.debug('Cached config of subscription {} changed by {} '
+                         'edits'.format(subscription_id, len(applied)))
+        if self.callback is not None:
+            self.callback(event)
+        return event
+
+    def consume(self, notifications):
+        '''consume
+
+        High-level api: Apply notifications one by one and yield change
+        events. Notifications that are not YANG-push updates of the
+        subscription do not produce events.
+
+        Parameters
+        ----------
+
+        notifications : `iterable`
+            An iterable of notifications, e.g., recorded notification
+            messages, or iter(lambda: m.take_notification(timeout=60), None).
+
+        Returns
+        -------
+
+        generator
+            A generator of PushEvent instances.
+        '''
+
+        for notification in notifications:
+            event = self.process(notification)
+            if event is not None:
+                yield event
+
+    def edit_config(self, edit):
+        '''edit_config
+
+        High-level api: Convert a yang-patch edit to the config element of an
+        edit-config message.
+
+        Parameters
+        ----------
+
+        edit : `Element`
+            An edit node of a yang-patch.
+
+        Returns
+        -------
+
+        Element
+            The config element of an edit-config message.
+        '''
+
+        return self._build(edit)[0]
+
+    def _get_element(self, notification):
+        if etree.iselement(notification):
+            return notification
+        if isinstance(notification, (str, bytes)):
+            if isinstance(notification, str):
+                notification = notification.encode()
+            parser = etree.XMLParser(remove_blank_text=True)
+            return etree.XML(notification, parser)
+        if hasattr(notification, 'notification_ele'):
+            return notification.notification_ele
+        raise TypeError("argument 'notification' must be Notification, "
+                        "Element or XML string, but not '{}'"
+                        .format(type(notification)))
+
+    def _get_digest(self):
+        # digests of subtrees are kept, so only nodes that are not in
+        # _digests, i.e., new nodes and nodes on touched paths, are computed
+        def visit(node, record, digest):
+            self._digests[node] = digest
+
+        return self.config._node_digest(self.config.ele, None, visit,
+                                        self._digests).hex()
+
+    def _apply_changes(self, update):
+        ele = self.config.ele
+        calculator = NetconfCalculator(self.device, ele, None)
+        applied = []
+        skipped = 0
+        checkpoints = []
+        changes = _find(update, 'datastore-changes')
+        patch = None if changes is None else _find(changes, 'yang-patch')
+        edits = [] if patch is None else _findall(patch, 'edit')
+        try:
+            chains = []
+            for edit in edits:
+                delta, chain, operation = self._build(edit)
+                path = self._locate(calculator, ele, chain)
+                if (
+                    chain and operation in ('delete', 'remove') and
+                    len(path) < len(chain)
+                ):
+                    if self.strict:
+                        raise ConfigDeltaError(
+                            'data-missing: try to delete {} but it does not '
+                            'exist in cached config'
+                            .format(_findtext(edit, 'target')))
+                    skipped += 1
+                    continue
+                checkpoints += self._checkpoint(ele, chain, path)
+                if not chain:
+                    # the target is the datastore
+                    if operation in ('delete', 'remove', 'replace'):
+                        for child in list(ele):
+                            ele.remove(child)
+                calculator.node_add(ele, delta)
+                chains.append(chain)
+                applied.append((_findtext(edit, 'edit-id'), operation,
+                                _findtext(edit, 'target')))
+            for chain in chains:
+                self._trim(calculator, ele, chain)
+        except Exception:
+            for node, children in reversed(checkpoints):
+                node[:] = children
+            raise
+        return applied, skipped
+
+    def _locate(self, calculator, ele, chain):
+        # return existing nodes of the cached config on the path of an edit,
+        # paired the same way as node_add() does, up to the first node that
+        # does not exist
+        path = []
+        current = ele
+        for node, record in chain:
+            match = None
+            for one, two in calculator._pair_children(current,
+                                                      node.getparent()):
+                if two is node:
+                    match = one
+                    break
+            if match is None:
+                break
+            path.append(match)
+            current = match
+        return path
+
+    def _checkpoint(self, ele, chain, path):
+        # save children of nodes an edit may change, so they can be restored
+        # if a later edit fails, and drop digests of those nodes
+        if not chain:
+            # the target is the datastore
+            self._digests.clear()
+            children = list(ele)
+            ele[:] = [deepcopy(child) for child in children]
+            return [(ele, children)]
+        ancestors = [ele] + path[:len(chain) - 1]
+        checkpoints = []
+        for node in ancestors:
+            checkpoints.append((node, list(node)))
+            self._digests.pop(node, None)
+        if len(path) == len(chain):
+            # the target may be changed in place, so the edit is applied to a
+            # copy, and the target is kept as it is in all checkpoints
+            target = path[-1]
+            ancestors[-1].replace(target, deepcopy(target))
+            for node in target.iter():
+                self._digests.pop(node, None)
+        return checkpoints
+
+    def _trim(self, calculator, ele, chain):
+        # trim default values in the target of an applied edit, and then
+        # ancestors that become empty
+        if not chain:
+            self.config._trim_defaults(ele)
+            return
+        path = self._locate(calculator, ele, chain)
+        if len(path) < len(chain):
+            return
+        nodes = [ele] + path
+        for index in range(len(nodes) - 1, 0, -1):
+            node = nodes[index]
+            if index < len(nodes) - 1 and len(node) > 0:
+                break
+            self.config._trim_defaults(nodes[index - 1], [node])
+
+    def _resolve(self, name, default_url, nsmap, target):
+        if ':' in name:
+            ns, local = name.split(':', 1)
+            url = nsmap.get(ns)
+            if url is None:
+                matches = [i[2] for i in self.device.namespaces if i[0] == ns]
+                if not matches:
+                    matches = [i[2] for i in self.device.namespaces
+                               if i[1] == ns]
+                if len(matches) != 1:
+                    raise ValueError("cannot resolve namespace '{}' in "
+                                     "target '{}'".format(ns, target))
+                url = matches[0]
+        elif default_url is None:
+            raise ValueError("the first node '{}' in target '{}' does not "
+                             "have a namespace".format(name, target))
+        else:
+            local, url = name, default_url
+        return url, '{' + url + '}' + local
+
+    def _parse_target(self, target, nsmap):
+        # return a list of tuples (url, tag, record, keys), where keys is a
+        # list of tuples (tag, value) of a list entry, or the value of a
+        # leaf-list entry
+        if target is None:
+            raise ValueError('yang-patch edit does not have a target')
+        if target in ('', '/'):
+            return []
+        if '[' in target:
+            # ncclient.manager is imported by manager.py, so it is loaded only
+            # when an instance identifier is parsed
+            from .manager import parse_xpath
+            steps = []
+            for name, predicates in parse_xpath(target):
+                steps.append((name, [(p, v) for p, v in predicates]))
+        else:
+            if not target.startswith('/'):
+                raise ValueError("target '{}' is not an absolute path"
+                                 .format(target))
+            steps = []
+            for step in target[1:].split('/'):
+                name, sep, values = step.partition('=')
+                if not name:
+                    raise ValueError("cannot parse target '{}'"
+                                     .format(target))
+                steps.append((name, [unquote(v) for v in values.split(',')]
+                              if sep else []))
+
+        ret = []
+        url = None
+        record = None
+        for name, keys in steps:
+            url, tag = self._resolve(name, url, nsmap, target)
+            if record is None:
+                model_name = self.device.roots.get(tag)
+                if model_name is None:
+                    model_name = self.device.auto_load_model(url)
+                if model_name is None or tag not in self.device.roots:
+                    raise ModelMissing("root '{}' in target '{}' is not found "
+                                       "in loaded models of device {}"
+                                       .format(name, target, self.device))
+                record = self.device.schema_nodes[
+                    self.device.models[model_name].tree]
+            child = record.children.get(tag)
+            if child is None:
+                raise ValueError("'{}' in target '{}' is not a data node in "
+                                 "the schema".format(name, target))
+            record = child
+            if keys and isinstance(keys[0], tuple):
+                # instance-identifier predicates
+                if record.type == 'leaf-list':
+                    keys = keys[0][1]
+                else:
+                    keys = [(self._resolve(p, url, nsmap, target)[1], v)
+                            for p, v in keys]
+            elif keys:
+                # data resource identifier values
+                if record.type == 'leaf-list':
+                    keys = ','.join(keys)
+                elif record.type == 'list' and len(keys) == len(record.keys):
+                    keys = list(zip(record.keys, keys))
+                else:
+                    raise ValueError("'{}' in target '{}' does not match keys "
+                                     "of the schema node".format(name, target))
+            elif record.type == 'list':
+                raise ValueError("list '{}' in target '{}' does not have "
+                                 "keys".format(name, target))
+            ret.append((url, tag, record, keys))
+        return ret
+
+    def _build_node(self, url, tag, record, keys):
+        node = etree.Element(tag, nsmap={self._prefix(url): url})
+        if record.type == 'leaf-list':
+            node.text = keys or None
+        elif record.type == 'list':
+            for key, value in keys:
+                etree.SubElement(node, key).text = value
+        return node
+
+    def _prefix(self, url):
+        for name, prefix, ns in self.device.namespaces:
+            if ns == url:
+                return prefix
+        return None
+
+    def _build(self, edit):
+        operation = _findtext(edit, 'operation')
+        if operation not in OPERATIONS:
+            raise ValueError("unknown yang-patch operation '{}' in edit '{}'"
+                             .format(operation, _findtext(edit, 'edit-id')))
+        target_node = _find(edit, 'target')
+        nsmap = {} if target_node is None else \
+            {k: v for k, v in target_node.nsmap.items() if k is not None}
+        target = _findtext(edit, 'target')
+        steps = self._parse_target(target, nsmap)
+        nc_operation = OPERATIONS[operation][0 if self.strict else 1]
+        value = _find(edit, 'value')
+        if operation in ('create', 'insert', 'merge', 'replace') and \
+           value is None:
+            raise ValueError("yang-patch edit '{}' of operation '{}' does "
+                             "not have a value"
+                             .format(_findtext(edit, 'edit-id'), operation))
+
+        config = etree.Element(config_tag, nsmap={'nc': nc_url})
+        if not steps:
+            # the datastore is the target, so its content is the value
+            if operation not in ('delete', 'remove'):
+                for child in value.iterchildren(tag=etree.Element):
+                    child = deepcopy(child)
+                    child.set(operation_tag, nc_operation)
+                    config.append(child)
+            return config, [], operation
+
+        chain = []
+        parent = config
+        for index, (url, tag, record, keys) in enumerate(steps):
+            if index == len(steps) - 1:
+                break
+            node = self._build_node(url, tag, record, keys)
+            parent.append(node)
+            chain.append((node, record))
+            parent = node
+
+        url, tag, record, keys = steps[-1]
+        if operation in ('create', 'insert', 'merge', 'replace'):
+            nodes = [n for n in value.iterchildren(tag=etree.Element)
+                     if n.tag == tag]
+            if len(nodes) != 1:
+                raise ValueError("value of yang-patch edit '{}' must contain "
+                                 "one node {}, but it has {}"
+                                 .format(_findtext(edit, 'edit-id'), tag,
+                                         len(nodes)))
+            node = deepcopy(nodes[0])
+        else:
+            node = self._build_node(url, tag, record, keys)
+        node.set(operation_tag, nc_operation)
+
+        if operation in ('insert', 'move'):
+            if not record.user_ordered:
+                raise ValueError("target '{}' of yang-patch operation '{}' "
+                                 "is not ordered by user"
+                                 .format(target, operation))
+            where = _findtext(edit, 'where') or 'last'
+            node.set(insert_tag, where)
+            if where in ('before', 'after'):
+                point = self._parse_target(_findtext(edit, 'point'),
+                                           nsmap)[-1]
+                if record.type == 'leaf-list':
+                    node.set(value_tag, point[3])
+                else:
+                    predicates = []
+                    prefixes = {}
+                    for key, v in point[3]:
+                        key_url = etree.QName(key).namespace
+                        prefix = self._prefix(key_url)
+                        prefixes[prefix] = key_url
+                        predicates.append('[{}:{}={}]'.format(
+                            prefix, etree.QName(key).localname, _quote(v)))
+                    node = _with_nsmap(node, prefixes)
+                    node.set(key_tag, ''.join(predicates))
+        parent.append(node)
+        chain.append((node, record))
+        return config, chain, operation
@@ -33,9 +33,15 @@ class IdentityRef(object):
         self.device = device
         self.node = node
         self.to_node = to_node
-        self.node_url = self.device.convert_tag('', self.node.tag)[0]
+        self._node_url = None
         self._default_ns = {}
 
+    @property
+    def node_url(self):
+        if self._node_url is None:
+            self._node_url = self.device.convert_tag('', self.node.tag)[0]
+        return self._node_url
+
     @property
     def converted(self):
         if self.node.text is None:
@@ -136,10 +142,221 @@ class IdentityRef(object):
         return new_instanceid
 
 
+def _literal_end(text, start):
+    # index after the closing quote of a literal starting at text[start], a
+    # doubled quote inside the literal is an escaped quote
+    quote = text[start]
+    idx = start + 1
+    while idx < len(text):
+        if text[idx] == quote:
+            if idx + 1 < len(text) and text[idx+1] == quote:
+                idx += 2
+                continue
+            return idx + 1
+        idx += 1
+    return None
+
+
+def compile_instanceid(device, text, nsmap, tag=None):
+    '''compile_instanceid
+
+    Tokenize an instance-identifier value in one pass and resolve namespaces
+    of its node names.
+
+    Parameters
+    ----------
+
+    device : `object`
+        An instance of yang.ncdiff.ModelDevice, which represents a modeled
+        device.
+
+    text : `str`
+        Text value of an instance-identifier node.
+
+    nsmap : `dict`
+        nsmap of the instance-identifier node.
+
+    tag : `str`
+        Tag of the instance-identifier node, used in error messages.
+
+    Returns
+    -------
+
+    CompiledInstanceIdentifier
+        An instance of CompiledInstanceIdentifier.
+    '''
+
+    tokens = []
+    default_url = None
+    in_bracket = False
+    idx = 0
+    length = len(text)
+    while idx < length:
+        char = text[idx]
+        if char in '\'"':
+            end_idx = _literal_end(text, idx)
+            if end_idx is None:
+                raise ConfigError('found opening apostrophe or double quote, '
+                                  'but not the closing one in the node with '
+                                  'tag {}'.format(tag))
+            literal = text[idx:end_idx]
+            if char == '"':
+                literal = InstanceIdentifier.convert_literal(literal)
+            tokens.append((None, literal))
+            idx = end_idx
+            continue
+        if char.isspace():
+            # optional whitespace around '=' in predicates, which is not part
+            # of the canonical form
+            idx += 1
+            continue
+        if char in '/[]=*':
+            if char == '[':
+                in_bracket = True
+            elif char == ']':
+                in_bracket = False
+            elif char == '=' and \
+                 text[idx+1:].lstrip()[:1] not in ('\'', '"'):
+                raise ConfigError("do not see a apostrophe or double quote "
+                                  "after '=' in the node with tag {}"
+                                  .format(tag))
+            tokens.append((None, char))
+            idx += 1
+            continue
+
+        end_idx = idx
+        while end_idx < length and text[end_idx] not in '/[]=*\'"' and \
+              not text[end_idx].isspace():
+            end_idx += 1
+        name = text[idx:end_idx]
+        idx = end_idx
+        if name == '.' or name.isdigit():
+            # context node or position in a predicate
+            tokens.append((None, name))
+            continue
+        prefix, colon, id = name.partition(':')
+        if colon:
+            if prefix in nsmap:
+                url = nsmap[prefix]
+            else:
+                names = {ns[0]: ns[2] for ns in device.namespaces}
+                if prefix not in names:
+                    raise ConfigError("unknown prefix '{}' in the node with "
+                                      "tag {}".format(prefix, tag))
+                url = names[prefix]
+        else:
+            # RFC7950 section 9.13.2 and RFC7951 section 6.11
+            url, id = default_url, name
+        if url is None:
+            raise ConfigError("in the instance-identifier node with tag {}, "
+                              "the leftmost data node name '{}' is not in "
+                              "namespace-qualified form".format(tag, name))
+        if not in_bracket:
+            default_url = url
+        tokens.append((url, id))
+    if in_bracket:
+        raise ConfigError('found opening square bracket, but not the closing '
+                          'bracket in the node with tag {}'.format(tag))
+    return CompiledInstanceIdentifier(device, tokens)
+
+
+class CompiledInstanceIdentifier(object):
+    '''CompiledInstanceIdentifier
+
+    A tokenized instance-identifier value whose node names are resolved to
+    namespaces. It is independent of prefixes used in the original text, so
+    one instance serves all nodes that have the same text and nsmap.
+
+    Attributes
+    ----------
+    tokens : `tuple`
+        A tuple of tokens. A token is a tuple (URL, identifier) of a node
+        name, or a tuple (None, text) of anything else, e.g., separators and
+        literals in canonical form.
+
+    urls : `set`
+        URLs of all node names.
+
+    default : `str`
+        Canonical form where each node name is prefixed by its model name.
+    '''
+
+    def __init__(self, device, tokens):
+        '''
+        __init__ instantiates a CompiledInstanceIdentifier instance.
+        '''
+
+        self.device = device
+        self.tokens = tuple(tokens)
+        self.urls = {url for url, text in self.tokens if url is not None}
+        self._default = None
+        self._converted = {}
+
+    def __repr__(self):
+        return '<{}.{} {} at {}>'.format(self.__class__.__module__,
+                                         self.__class__.__name__,
+                                         self.default,
+                                         hex(id(self)))
+
+    @property
+    def default(self):
+        if self._default is None:
+            names = {url: self.device.convert_ns(url,
+                                                 src=Tag.NAMESPACE,
+                                                 dst=Tag.NAME)
+                     for url in self.urls}
+            self._default = ''.join(
+                text if url is None else '{}:{}'.format(names[url], text)
+                for url, text in self.tokens)
+        return self._default
+
+    def convert(self, to_node):
+        '''convert
+
+        High-level api: Return the value in prefixes of another node.
+
+        Parameters
+        ----------
+
+        to_node : `Element`
+            A data node whose nsmap is used.
+
+        Returns
+        -------
+
+        str
+            Converted value.
+        '''
+
+        to_nsmap = to_node.nsmap
+        key = frozenset(to_nsmap.items())
+        converted = self._converted.get(key)
+        if converted is not None:
+            return converted
+        url_to_prefix = {v: k for k, v in to_nsmap.items() if k is not None}
+        for url in self.urls:
+            if url not in url_to_prefix:
+                raise ConfigError("URL '{}' is not found in to_node.nsmap {} "
+                                  "(default namespace cannot be used here), "
+                                  "where the to_node has tag {}"
+                                  .format(url, to_nsmap, to_node.tag))
+        converted = ''.join(
+            text if url is None else '{}:{}'.format(url_to_prefix[url], text)
+            for url, text in self.tokens)
+        self._converted[key] = converted
+        return converted
+
+
 class InstanceIdentifier(IdentityRef):
     '''InstanceIdentifier
 
-    A class to process YANG built-in type instance-identifier.
+    A class to process YANG built-in type instance-identifier. The value is
+    compiled once per text and nsmap by compile_instanceid(), and compiled
+    values are shared through the instanceid_cache of the device if it has
+    one. The multi-pass helpers string(), cut(), parse_quote(),
+    parse_square_bracket(), parse_element() and convert_str_list(), and the
+    str_list attribute they worked on, are removed. Use compiled.tokens
+    instead.
 
     Attributes
     ----------
@@ -153,6 +370,9 @@ class InstanceIdentifier(IdentityRef):
     to_node : `Element`
         Another data node of type instance-identifier.
 
+    compiled : `CompiledInstanceIdentifier`
+        The compiled value of node.
+
     converted : `str`
         Converted text value of node, based on to_node.nsmap.
     '''
@@ -163,29 +383,42 @@ class InstanceIdentifier(IdentityRef):
         '''
 
         IdentityRef.__init__(self, device, node, to_node=to_node)
-        self.str_list = [(self.node.text, 0, self.node.text)]
+        self._compiled = None
+
+    @property
+    def compiled(self):
+        if self._compiled is None:
+            if self.node.text is None:
+                raise ConfigError("the node with tag {} is an "
+                                  "instance-identifier but no value"
+                                  .format(self.node.tag))
+            cache = getattr(self.device, 'instanceid_cache', None)
+            if cache is None:
+                self._compiled = compile_instanceid(self.device,
+                                                    self.node.text,
+                                                    self.node.nsmap,
+                                                    tag=self.node.tag)
+            else:
+                self._compiled = cache.compile(self.device,
+                                               self.node.text,
+                                               self.node.nsmap,
+                                               tag=self.node.tag)
+        return self._compiled
 
     @property
     def converted(self):
-        self.str_list = [(self.node.text, 0, self.node.text)]
-        self.parse_quote()
-        self.parse_square_bracket(to_node=self.to_node)
-        self.parse_element(to_node=self.to_node)
-        self.convert_str_list(to_node=self.to_node)
-        return ''.join([p[2] for p in self.str_list])
+        if self.to_node is None:
+            return self.default
+        return self.compiled.convert(self.to_node)
 
     @property
     def default(self):
-        self.str_list = [(self.node.text, 0, self.node.text)]
-        self.parse_quote()
-        self.parse_square_bracket()
-        self.parse_element()
-        self.convert_str_list()
-        return ''.join([p[2] for p in self.str_list])
-
-    def string(self, phase_num):
-        return ''.join([p[0] for p in self.str_list
-                        if p[1] == 0 or p[1] >= phase_num])
+        compiled = self.compiled
+        for url in compiled.urls:
+            if url not in self._default_ns.values():
+                self._default_ns[self.device.convert_ns(
+                    url, src=Tag.NAMESPACE, dst=Tag.NAME)] = url
+        return compiled.default
 
     def parse_prefixed_id(self, id, node):
         match = re.search(Tag.COLON[0], id)
@@ -226,173 +459,8 @@ class InstanceIdentifier(IdentityRef):
                                   "where the to_node has tag {}" \
                                   .format(url, to_node.nsmap, to_node.tag))
 
-    def convert_str_list(self, to_node=None):
-        default_url = None
-        new_str_list = []
-        for piece in self.str_list:
-            if piece[1] <= 1:
-                new_str_list.append(piece)
-            elif piece[1] == 2:
-                if piece[0] == '[' or \
-                   piece[0] == ']' or \
-                   piece[0] == '=' or \
-                   piece[0] == '.':
-                    new_str_list.append((piece[0], piece[1], piece[0]))
-                else:
-                    url, id = self.parse_prefixed_id(piece[0], self.node)
-                    if url is None:
-                        url = default_url
-                    if url is None:
-                        raise ConfigError("in the instance-identifier node " \
-                                          "with tag {}, the leftmost data " \
-                                          "node name '{}' is not in " \
-                                          "namespace-qualified form" \
-                                          .format(self.node.tag, piece[0]))
-                    else:
-                        converted_id = self.compose_prefixed_id(url, id,
-                                                                to_node=to_node)
-                        new_str_list.append((piece[0], piece[1], converted_id))
-            elif piece[1] == 3:
-                url, id = self.parse_prefixed_id(piece[0], self.node)
-                if url is not None:
-                    default_url = url
-                if default_url is None:
-                    raise ConfigError("in the instance-identifier node " \
-                                      "with tag {}, the leftmost data " \
-                                      "node name '{}' is not in " \
-                                      "namespace-qualified form" \
-                                      .format(self.node.tag, piece[0]))
-                else:
-                    converted_id = self.compose_prefixed_id(default_url, id,
-                                                            to_node=to_node)
-                    new_str_list.append((piece[0], piece[1], converted_id))
-        self.str_list = new_str_list
-
-    def cut(self, start_idx, end_idx, converted_str, phase_num):
-        def this_piece(idx, start_idx, end_idx, converted_str, phase_num):
-            string = self.str_list[idx][0]
-            original_phase_num = self.str_list[idx][1]
-            ret = [(string[:start_idx], original_phase_num, string[:start_idx]),
-                   (string[start_idx:end_idx], phase_num, converted_str),
-                   (string[end_idx:], original_phase_num, string[end_idx:])]
-            return [piece for piece in ret if piece[0]]
-
-        def all_pieces(idx, start_idx, end_idx, converted_str, phase_num):
-            return self.str_list[:idx] + \
-                   this_piece(idx, start_idx, end_idx,
-                              converted_str, phase_num) + \
-                   self.str_list[idx+1:]
-
-        str_len = end_idx - start_idx
-        position = 0
-        for idx, piece in enumerate(self.str_list):
-            if piece[1] == 0 or piece[1] == phase_num:
-                end_position = position + len(piece[0])
-                if start_idx >= position and end_idx <= end_position:
-                    self.str_list = all_pieces(idx,
-                                               start_idx-position,
-                                               end_idx-position,
-                                               converted_str,
-                                               phase_num)
-                    return
-                position += len(piece[0])
-
     @staticmethod
     def convert_literal(literal):
         converted_literal = literal[1:-1]
         converted_literal = re.sub("'", "''", converted_literal)
         return "'" + re.sub('""', '"', converted_literal) + "'"
-
-    def parse_quote(self):
-        string = self.string(1)
-        start_idx = None
-        start_escape = None
-        for idx, char in enumerate(string):
-            if start_idx is None and char == '=':
-                start_idx = idx + 1
-            elif start_idx is not None and idx == start_idx:
-                if char != "'" and char != '"':
-                    raise ConfigError("do not see a apostrophe or double " \
-                                      "quote after '=' in the node with tag " \
-                                      "{}" \
-                                      .format(self.node.tag))
-                else:
-                    opening_quote = char
-            elif start_idx is not None and idx > start_idx:
-                if char == opening_quote:
-                    if idx < len(string)-1 and string[idx+1] == opening_quote:
-                        start_escape = idx
-                        continue
-                    end_escape = idx + 1
-                    if start_escape is not None and \
-                       (end_escape-start_escape)%2 == 0:
-                        start_escape = None
-                        continue
-                    end_idx = idx + 1
-                    if opening_quote == '"':
-                        default_literal = \
-                            self.convert_literal(string[start_idx:end_idx])
-                    else:
-                        default_literal = string[start_idx:end_idx]
-                    self.cut(start_idx, end_idx, default_literal, 1)
-                    start_idx = None
-        if start_idx is not None:
-            raise ConfigError('found opening apostrophe or double quote, but ' \
-                              'not the closing one in the node with tag {}' \
-                              .format(self.node.tag))
-
-    def parse_square_bracket(self, to_node=None):
-        string = self.string(2)
-        start_idx = None
-        for idx, char in enumerate(string):
-            if start_idx is None and char == '[':
-                start_idx = idx
-            elif start_idx is not None and idx > start_idx:
-                if char == "]":
-                    end_idx = idx + 1
-                    substring = string[start_idx:end_idx]
-                    self.cut(start_idx, start_idx+1, '[', 2)
-                    self.cut(end_idx-1, end_idx, ']', 2)
-                    if substring[-2] == '=':
-                        tag = substring[1:-2]
-                        self.cut(end_idx-2, end_idx-1, '=', 2)
-                        if tag == '.':
-                            self.cut(start_idx+1, end_idx-2, '.', 2)
-                        else:
-                            self.cut(start_idx+1, end_idx-2, tag, 2)
-                        start_idx = None
-                    else:
-                        if re.search('^\[[1-9][0-9]*\]$', substring):
-                            numbers = substring[1:-1]
-                            self.cut(start_idx+1, end_idx-1, numbers, 2)
-                        else:
-                            tag = substring[1:-1]
-                            self.cut(start_idx+1, end_idx-1, tag, 2)
-                        start_idx = None
-        if start_idx is not None:
-            raise ConfigError('found opening square bracket, but not the ' \
-                              'closing bracket in the node with tag {}' \
-                              .format(self.node))
-
-    def parse_element(self, to_node=None):
-        SEPARATORS = "./"
-        string = self.string(3)
-        start_idx = None
-        for idx, char in enumerate(string):
-            if start_idx is None and char not in SEPARATORS:
-                start_idx = idx
-            elif start_idx is not None and char in SEPARATORS:
-                end_idx = idx
-                tag = string[start_idx:end_idx]
-                if tag == '*':
-                    self.cut(start_idx, end_idx, '*', 3)
-                else:
-                    self.cut(start_idx, end_idx, tag, 3)
-                start_idx = None
-        if start_idx is not None:
-            end_idx = idx + 1
-            tag = string[start_idx:end_idx]
-            if tag == '*':
-                self.cut(start_idx, end_idx, '*', 3)
-            else:
-                self.cut(start_idx, end_idx, tag, 3)
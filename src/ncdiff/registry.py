@@ -0,0 +1,242 @@
+import hashlib
+import logging
+from threading import Lock, RLock
+
+from .cache import XPathCache, InstanceIdentifierCache, SchemaNodeCache
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class DeviceSchema(object):
+    '''DeviceSchema
+
+    Schema information used by ModelDevice instances. A ModelDevice instance
+    owns a private DeviceSchema by default. When a SchemaRegistry is used,
+    devices advertising the same capabilities share one DeviceSchema, while
+    their Netconf sessions stay separate.
+
+    Read paths are thread-safe, so configs and deltas of one or more devices
+    sharing a DeviceSchema can be calculated in a thread pool. Loading a
+    model is serialized by lock. It builds new dictionaries of models and
+    schema_nodes and publishes each by one attribute assignment, and readers
+    never see a dictionary being changed. The lookup cache nodes is the
+    only structure written by readers, and it has its own lock. When a
+    model is reloaded, its entries in nodes are invalidated after the models
+    are published, and a lookup that started before that does not cache
+    what it resolves, so entries of the old schema tree never reach the
+    cache again. Configs of a model should not be diffed while the same
+    model is being reloaded.
+
+    Attributes
+    ----------
+    fingerprint : `str`
+        Fingerprint of the capabilities if the schema is in a registry,
+        otherwise None.
+
+    shared : `bool`
+        True if the schema is in a registry.
+
+    models : `dict`
+        A dictionary of loaded models. Dictionary keys are model names, and
+        values are Model instances.
+
+    nodes : `SchemaNodeCache`
+        A cache of schema node lookups. Keys are paths of config nodes, and
+        values are schema nodes. Entries of a model are invalidated when the
+        model is reloaded.
+
+    schema_nodes : `dict`
+        Compact records of schema nodes in all loaded models.
+
+    compiler : `ModelCompiler`
+        An instance of ModelCompiler.
+
+    namespaces : `list`
+        A cached list of tuples (model name, model prefix, model URL), or None
+        if it is not built yet.
+
+    prefixes : `dict`
+        A cached dictionary built from namespaces, whose keys are model
+        prefixes and values are model URLs, or None if it is not built yet.
+
+    url_names : `dict`
+        A cached dictionary built with namespaces, whose keys are model URLs
+        and values are model names, or None if it is not built yet.
+
+    url_prefixes : `dict`
+        A cached dictionary built with namespaces, whose keys are model URLs
+        and values are model prefixes, or None if it is not built yet.
+
+    xpath_cache : `XPathCache`
+        Compiled XPath expressions used by Config.xpath(), RPCReply.xpath()
+        and Notification.xpath().
+
+    instanceid_cache : `InstanceIdentifierCache`
+        Compiled values of instance-identifier nodes.
+
+    models_autoloaded : `list`
+        A list of model names that have been loaded on demand.
+
+    lock : `RLock`
+        A lock serializing changes of models and the compiler.
+    '''
+
+    def __init__(self, fingerprint=None):
+        '''
+        __init__ instantiates a DeviceSchema instance.
+        '''
+
+        self.fingerprint = fingerprint
+        self.models = {}
+        self.nodes = SchemaNodeCache()
+        self.schema_nodes = {}
+        self.compiler = None
+        self.namespaces = None
+        self.prefixes = None
+        self.url_names = None
+        self.url_prefixes = None
+        self.xpath_cache = XPathCache()
+        self.instanceid_cache = InstanceIdentifierCache()
+        self.models_autoloaded = []
+        self.lock = RLock()
+
+    def __repr__(self):
+        return '<{}.{} {} at {}>'.format(self.__class__.__module__,
+                                         self.__class__.__name__,
+                                         self.fingerprint,
+                                         hex(id(self)))
+
+    @property
+    def shared(self):
+        return self.fingerprint is not None
+
+
+class SchemaRegistry(object):
+    '''SchemaRegistry
+
+    A thread-safe registry of DeviceSchema instances keyed by a fingerprint
+    of device capabilities. A process-wide instance is available as
+    ncdiff.registry.registry.
+
+    Attributes
+    ----------
+    fingerprints : `list`
+        Fingerprints of all schemas in the registry.
+    '''
+
+    def __init__(self):
+        '''
+        __init__ instantiates a SchemaRegistry instance.
+        '''
+
+        self._lock = Lock()
+        self._schemas = {}
+
+    def __repr__(self):
+        return '<{}.{} {} schemas at {}>'.format(self.__class__.__module__,
+                                                 self.__class__.__name__,
+                                                 len(self),
+                                                 hex(id(self)))
+
+    def __len__(self):
+        return len(self._schemas)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self._schemas
+
+    @property
+    def fingerprints(self):
+        return sorted(self._schemas.keys())
+
+    @staticmethod
+    def fingerprint(capabilities):
+        '''fingerprint
+
+        High-level api: Compute a fingerprint of device capabilities. The
+        order of capabilities does not matter.
+
+        Parameters
+        ----------
+
+        capabilities : `list`
+            A list of capability strings, e.g., server_capabilities of a
+            ModelDevice instance.
+
+        Returns
+        -------
+
+        str
+            A hex digest of SHA-256.
+        '''
+
+        text = '\n'.join(sorted(set(capabilities)))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, capabilities):
+        '''get
+
+        High-level api: Return the DeviceSchema of given capabilities. A new
+        DeviceSchema is created if it does not exist.
+
+        Parameters
+        ----------
+
+        capabilities : `list`
+            A list of capability strings.
+
+        Returns
+        -------
+
+        DeviceSchema
+            A DeviceSchema instance shared by all devices having the same
+            capabilities.
+        '''
+
+        fingerprint = self.fingerprint(capabilities)
+        with self._lock:
+            if fingerprint not in self._schemas:
+                logger.debug('Schema {} is created'.format(fingerprint))
+                self._schemas[fingerprint] = DeviceSchema(fingerprint)
+            return self._schemas[fingerprint]
+
+    def remove(self, fingerprint):
+        '''remove
+
+        High-level api: Remove a DeviceSchema from the registry. Devices that
+        are using it keep working, but new devices will get a new one.
+
+        Parameters
+        ----------
+
+        fingerprint : `str`
+            Fingerprint of the DeviceSchema.
+
+        Returns
+        -------
+
+        DeviceSchema
+            The DeviceSchema removed, or None if it does not exist.
+        '''
+
+        with self._lock:
+            return self._schemas.pop(fingerprint, None)
+
+    def clear(self):
+        '''clear
+
+        High-level api: Remove all schemas from the registry.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        with self._lock:
+            self._schemas = {}
+
+
+# the process-wide registry
+registry = SchemaRegistry()
@@ -0,0 +1,250 @@
+import time
+import logging
+from contextlib import contextmanager, nullcontext
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class Stats(object):
+    '''Stats
+
+    An opt-in collector of counters and timers on hot paths of ModelDevice and
+    calculators. It is enabled by ModelDevice.enable_stats(). When it is not
+    enabled, ModelDevice.stats is None and the cost is one attribute check per
+    instrumented call. Updates are not locked, so counters may be slightly
+    low when several threads calculate against one device.
+
+    Attributes
+    ----------
+    counters : `dict`
+        A dictionary of call counters. Dictionary keys are counter names, for
+        example, 'get_schema_node', 'nodes_hit', 'nodes_miss',
+        'parse_text_hit', 'parse_text_miss', '_node_le' and '_pair_children'.
+        Values are integers.
+
+    timers : `dict`
+        A dictionary of cumulative time in seconds. Dictionary keys are timer
+        names, for example, 'get_schema_node', 'trim', 'validate', 'sub' and
+        'add'.
+
+    phases : `dict`
+        A dictionary of numbers of nodes visited in each phase. Dictionary
+        keys are phase names: 'trim', 'validate', 'sub' and 'add'.
+
+    peaks : `dict`
+        A dictionary of peak values, for example, 'tree_size', which is the
+        largest number of nodes in a tree processed so far.
+
+    callback : `callable`
+        An optional hook, which is called as callback(phase, stats) at the end
+        of every phase.
+    '''
+
+    def __init__(self, callback=None):
+        '''
+        __init__ instantiates a Stats instance.
+        '''
+
+        if callback is not None and not callable(callback):
+            raise TypeError("argument 'callback' must be callable or None, "
+                            "but not '{}'".format(type(callback)))
+        self.callback = callback
+        self.reset()
+
+    def __repr__(self):
+        return '<{}.{} {} at {}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.as_dict(),
+            hex(id(self)),
+            )
+
+    def reset(self):
+        '''reset
+
+        High-level api: Clear all counters, timers, phases and peaks.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        self.counters = {}
+        self.timers = {}
+        self.phases = {}
+        self.peaks = {}
+
+    def count(self, name, number=1):
+        '''count
+
+        High-level api: Increase a counter.
+
+        Parameters
+        ----------
+
+        name : `str`
+            Counter name, e.g., 'get_schema_node'.
+
+        number : `int`
+            Amount to add. The default is 1.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def time(self, name, seconds):
+        '''time
+
+        High-level api: Add time to a timer.
+
+        Parameters
+        ----------
+
+        name : `str`
+            Timer name, e.g., 'get_schema_node' or a phase name.
+
+        seconds : `float`
+            Time in seconds.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def visit(self, phase, number=1):
+        '''visit
+
+        High-level api: Add visited nodes to a phase.
+
+        Parameters
+        ----------
+
+        phase : `str`
+            Phase name, e.g., 'trim', 'validate', 'sub' or 'add'.
+
+        number : `int`
+            Number of nodes visited. The default is 1.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        self.phases[phase] = self.phases.get(phase, 0) + number
+
+    def peak(self, name, value):
+        '''peak
+
+        High-level api: Record a value if it is larger than the current peak.
+
+        Parameters
+        ----------
+
+        name : `str`
+            Peak name, e.g., 'tree_size'.
+
+        value : `int`
+            A new value.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        if value > self.peaks.get(name, 0):
+            self.peaks[name] = value
+
+    def tree_size(self, *trees):
+        '''tree_size
+
+        High-level api: Record the size of the largest tree given.
+
+        Parameters
+        ----------
+
+        trees : `Element`
+            One or more Element nodes.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        for tree in trees:
+            self.peak('tree_size', sum(1 for n in tree.iter()))
+
+    @contextmanager
+    def phase(self, name):
+        '''phase
+
+        High-level api: A context manager that measures the time of one phase
+        and calls the callback at the end.
+
+        Parameters
+        ----------
+
+        name : `str`
+            Phase name, e.g., 'trim', 'validate', 'sub' or 'add'.
+        '''
+
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.time(name, time.perf_counter() - start)
+            if self.callback is not None:
+                try:
+                    self.callback(name, self)
+                except Exception as e:
+                    logger.warning("stats callback failed at the end of "
+                                   "phase '{}': {}".format(name, e))
+
+    def as_dict(self):
+        '''as_dict
+
+        High-level api: Return a snapshot of all statistics in a dictionary,
+        which is convenient for a metrics exporter.
+
+        Returns
+        -------
+
+        dict
+            A dictionary with keys 'counters', 'timers', 'phases' and 'peaks'.
+        '''
+
+        return {
+            'counters': dict(self.counters),
+            'timers': dict(self.timers),
+            'phases': dict(self.phases),
+            'peaks': dict(self.peaks),
+        }
+
+
+def stats_phase(stats, name):
+    '''stats_phase
+
+    Return a context manager measuring one phase if stats is enabled,
+    otherwise a no-op context manager.
+    '''
+
+    if stats is None:
+        return nullcontext()
+    return stats.phase(name)
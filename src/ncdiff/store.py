@@ -0,0 +1,275 @@
+import os
+import shutil
+import hashlib
+import logging
+
+# create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class ModuleStore(object):
+    '''ModuleStore
+
+    A content-addressed store of YANG files and compiled models, which can be
+    shared by many devices and folders. YANG files are stored once per
+    content, and indexed by module name and revision, so a module downloaded
+    for one device is not downloaded again for another device. Compiled
+    models are stored once per dependency closure, so devices running
+    different images share the compiled output of modules whose dependencies
+    are identical. Files are hard-linked into device folders when possible,
+    otherwise copied.
+
+    Attributes
+    ----------
+    root : `str`
+        Path to the store.
+
+    dir_modules : `str`
+        Path to YANG files, which are named by SHA-256 of their content.
+
+    dir_revisions : `str`
+        Path to the index of YANG files. Each file is named as
+        module@revision, and contains the SHA-256 of the YANG file.
+
+    dir_compiled : `str`
+        Path to compiled models, which are named by SHA-256 of their
+        dependency closure.
+    '''
+
+    def __init__(self, root):
+        '''
+        __init__ instantiates a ModuleStore instance.
+        '''
+
+        self.root = os.path.abspath(root)
+        self.dir_modules = os.path.join(self.root, 'modules')
+        self.dir_revisions = os.path.join(self.root, 'revisions')
+        self.dir_compiled = os.path.join(self.root, 'compiled')
+        for folder in [self.dir_modules,
+                       self.dir_revisions,
+                       self.dir_compiled]:
+            os.makedirs(folder, exist_ok=True)
+
+    def __repr__(self):
+        return '<{}.{} {} at {}>'.format(self.__class__.__module__,
+                                         self.__class__.__name__,
+                                         self.root,
+                                         hex(id(self)))
+
+    @staticmethod
+    def digest(content):
+        '''digest
+
+        High-level api: Compute SHA-256 of content.
+
+        Parameters
+        ----------
+
+        content : `str` or `bytes`
+            Content of a file.
+
+        Returns
+        -------
+
+        str
+            A hex digest of SHA-256.
+        '''
+
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def _write_file(filename, content):
+        # write to a temporary file and rename, so readers in other processes
+        # never see a partial file
+        temp_file = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(temp_file, 'wb') as f:
+            f.write(content)
+        os.replace(temp_file, filename)
+
+    @staticmethod
+    def link(src, dst):
+        '''link
+
+        High-level api: Hard-link a file, or copy it if hard links are not
+        supported. An existing destination is replaced.
+
+        Parameters
+        ----------
+
+        src : `str`
+            Path to the source file.
+
+        dst : `str`
+            Path to the destination file.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def module_path(self, digest):
+        return os.path.join(self.dir_modules, digest + '.yang')
+
+    def compiled_path(self, key):
+        return os.path.join(self.dir_compiled, key + '.xml')
+
+    def put(self, text, module=None, revision=None):
+        '''put
+
+        High-level api: Add a YANG file to the store.
+
+        Parameters
+        ----------
+
+        text : `str`
+            Content of the YANG file.
+
+        module : `str`
+            Module name. When module and revision are given, the YANG file is
+            indexed so lookup() can find it.
+
+        revision : `str`
+            Module revision.
+
+        Returns
+        -------
+
+        str
+            SHA-256 of the YANG file.
+        '''
+
+        content = text.encode('utf-8')
+        digest = self.digest(content)
+        filename = self.module_path(digest)
+        if not os.path.isfile(filename):
+            self._write_file(filename, content)
+        if module and revision:
+            index = os.path.join(self.dir_revisions,
+                                 '{}@{}'.format(module, revision))
+            if not os.path.isfile(index):
+                self._write_file(index, digest.encode('utf-8'))
+        return digest
+
+    def lookup(self, module, revision):
+        '''lookup
+
+        High-level api: Find a YANG file by module name and revision.
+
+        Parameters
+        ----------
+
+        module : `str`
+            Module name.
+
+        revision : `str`
+            Module revision.
+
+        Returns
+        -------
+
+        str
+            SHA-256 of the YANG file, or None if it is not in the store.
+        '''
+
+        if not module or not revision:
+            return None
+        index = os.path.join(self.dir_revisions,
+                             '{}@{}'.format(module, revision))
+        if not os.path.isfile(index):
+            return None
+        with open(index, 'r') as f:
+            digest = f.read().strip()
+        if os.path.isfile(self.module_path(digest)):
+            return digest
+        return None
+
+    def checkout(self, digest, filename):
+        '''checkout
+
+        High-level api: Place a YANG file of the store in a folder.
+
+        Parameters
+        ----------
+
+        digest : `str`
+            SHA-256 of the YANG file.
+
+        filename : `str`
+            Path to the YANG file in a folder.
+
+        Returns
+        -------
+
+        str
+            Content of the YANG file.
+        '''
+
+        self.link(self.module_path(digest), filename)
+        with open(filename, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def get_compiled(self, key, filename):
+        '''get_compiled
+
+        High-level api: Place a compiled model of the store in a folder.
+
+        Parameters
+        ----------
+
+        key : `str`
+            SHA-256 of the dependency closure of the model.
+
+        filename : `str`
+            Path to the compiled model in a folder.
+
+        Returns
+        -------
+
+        bool
+            True if the compiled model is found in the store.
+        '''
+
+        compiled = self.compiled_path(key)
+        if not os.path.isfile(compiled):
+            return False
+        logger.debug('Reuse compiled model {}'.format(key))
+        self.link(compiled, filename)
+        return True
+
+    def put_compiled(self, key, filename):
+        '''put_compiled
+
+        High-level api: Add a compiled model to the store.
+
+        Parameters
+        ----------
+
+        key : `str`
+            SHA-256 of the dependency closure of the model.
+
+        filename : `str`
+            Path to the compiled model in a folder.
+
+        Returns
+        -------
+
+        None
+            There is no return of this method.
+        '''
+
+        compiled = self.compiled_path(key)
+        if not os.path.isfile(compiled):
+            with open(filename, 'rb') as f:
+                self._write_file(compiled, f.read())
+        self.link(compiled, filename)
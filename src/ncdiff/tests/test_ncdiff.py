@@ -1,13 +1,34 @@
 #!/bin/env python
 """ Unit tests for the ncdiff cisco-shared package. """
 
+import sys
+import json
+import time
 import unittest
-from os import path
+import asyncio
+import tempfile
+import threading
+import subprocess
+from io import BytesIO
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from os import path, makedirs
 from lxml import etree
 from ncdiff.manager import ModelDevice
 from ncdiff.config import Config, ConfigDelta
-from ncdiff.errors import ConfigDeltaError
-from ncdiff.composer import Tag
+from ncdiff.calculator import BaseCalculator
+from ncdiff.errors import ConfigDeltaError, ConfigError, ModelMissing
+from ncdiff.composer import Tag, Composer
+from ncdiff.registry import SchemaRegistry
+from ncdiff.compiler import ModelDownloader, ModelCompiler
+from ncdiff.store import ModuleStore
+from ncdiff.aio import AsyncFleet
+from ncdiff.cache import XPathCache, SchemaNodeCache
+from ncdiff.drift import DriftChecker
+from ncdiff.push import PushSubscriber
+from ncdiff.ref import InstanceIdentifier
+from ncdiff.history import ConfigHistory
+from ncdiff.model import Model, ModelDiff, read_xml, write_xml
 
 from ncclient import operations, xml_
 from ncclient.manager import Manager
@@ -348,6 +369,38 @@ nc_device.load_model('Cisco-IOS-XE-native')
 nc_device.load_model('jon')
 
 
+def yang_text(name, revision, imports=()):
+    text = 'module {0} {{ namespace "urn:{0}"; prefix {0}; '
+    for i in imports:
+        text += 'import {0} {{{{ prefix {0}; }}}} '.format(i)
+    text += 'revision {1}; leaf {0}-leaf {{ type string; }} }}'
+    return text.format(name, revision)
+
+
+class MyModelDevice(object):
+    def __init__(self, revisions):
+        self.models_revisions = revisions
+        self.models_loadable = sorted(revisions)
+        self.server_capabilities = [
+            'urn:{0}?module={0}&revision={1}'.format(m, r)
+            for m, r in revisions.items()]
+
+
+class MyModelDownloader(ModelDownloader):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.unavailable = set()
+        self.requests = []
+
+    def get_schema(self, module):
+        self.requests.append(module)
+        if module in self.unavailable:
+            return None
+        revisions = self.device.models_revisions
+        imports = {'a': ['b']}.get(module, [])
+        return yang_text(module, revisions[module], imports)
+
+
 class TestNcDiff(unittest.TestCase):
 
     def setUp(self):
@@ -4393,3 +4446,1534 @@ class TestNcDiff(unittest.TestCase):
       self.assertEqual(len(defaults), 4)
       for xpath in xpaths:
           self.assertIn(xpath, xpaths)
+
+    def test_delta_chunks_1(self):
+        xml1 = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <address xmlns="urn:jon">
+                  <last>Wang</last>
+                  <first>Tom</first>
+                  <street>Main</street>
+                </address>
+              </data>
+            </rpc-reply>
+            """
+        xml2 = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <address xmlns="urn:jon">
+                  <last>Wang</last>
+                  <first>Tom</first>
+                  <street>King</street>
+                  <city-v2>Ottawa</city-v2>
+                </address>
+                <address xmlns="urn:jon">
+                  <last>Li</last>
+                  <first>Mary</first>
+                  <street>Queen</street>
+                  <city-v2>Toronto</city-v2>
+                </address>
+                <address xmlns="urn:jon">
+                  <last>Zhang</last>
+                  <first>Jerry</first>
+                  <street>Bank</street>
+                  <city-v2>Calgary</city-v2>
+                </address>
+                <tracking xmlns="urn:jon">
+                  <enabled-v2>true</enabled-v2>
+                  <logging>
+                    <local>true</local>
+                  </logging>
+                </tracking>
+              </data>
+            </rpc-reply>
+            """
+        config1 = Config(self.d, xml1)
+        config2 = Config(self.d, xml2)
+        delta = config2 - config1
+        self.assertGreater(len(etree.tostring(delta.nc)), 300)
+        self.assertGreater(len(list(delta.nc.iter())), 5)
+        for max_bytes, max_nodes in [(300, None), (None, 5), (300, 5)]:
+            chunks = delta.chunks(max_bytes=max_bytes, max_nodes=max_nodes)
+            self.assertGreater(len(chunks), 1)
+            config = config1
+            for chunk, size in chunks:
+                self.assertEqual(size, len(etree.tostring(chunk)))
+                if max_bytes is not None:
+                    self.assertLessEqual(size, max_bytes)
+                if max_nodes is not None:
+                    self.assertLessEqual(len(list(chunk.iter())), max_nodes)
+                for entry in chunk.iterfind('{urn:jon}address'):
+                    self.assertIsNotNone(entry.find('{urn:jon}first'))
+                    self.assertIsNotNone(entry.find('{urn:jon}last'))
+                config = config + chunk
+            self.assertEqual(config, config2)
+
+        # anchors of yang:insert must be sent before they are referenced
+        sent = []
+        for chunk, size in chunks:
+            for entry in chunk.iterfind('{urn:jon}address'):
+                if entry.get(insert_tag) == 'after':
+                    self.assertIn(entry.get(key_tag), sent)
+                sent.append("[first='{}'][last='{}']".format(
+                    entry.find('{urn:jon}first').text,
+                    entry.find('{urn:jon}last').text))
+
+        # a chunk with no budget is the whole delta
+        chunks = delta.chunks()
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(etree.tostring(chunks[0][0]),
+                         etree.tostring(delta.nc))
+
+    def test_delta_chunks_2(self):
+        # deletes are sent before creates
+        xml1 = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <numbers xmlns="urn:jon">
+                  <first>one</first>
+                </numbers>
+                <foo xmlns="urn:jon">bar</foo>
+              </data>
+            </rpc-reply>
+            """
+        xml2 = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <numbers xmlns="urn:jon">
+                  <second>two</second>
+                  <third>three</third>
+                </numbers>
+              </data>
+            </rpc-reply>
+            """
+        config1 = Config(self.d, xml1)
+        config2 = Config(self.d, xml2)
+        delta = config2 - config1
+        chunks = delta.chunks(max_bytes=150)
+        self.assertGreater(len(chunks), 1)
+        operations = [n.get(operation_tag) for n in chunks[0][0].iter()]
+        self.assertIn('delete', operations)
+        for chunk, size in chunks[1:]:
+            for node in chunk.iter():
+                if node.get(operation_tag) in ('delete', 'remove'):
+                    self.assertEqual(chunks[0][0], chunk)
+        config = config1
+        for chunk, size in chunks:
+            config = config + chunk
+        self.assertEqual(config, config1 + delta)
+        self.assertRaises(ValueError, delta.chunks, max_bytes=0)
+
+    def test_write_1(self):
+        xml = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <address xmlns="urn:jon">
+                  <last>Wang</last>
+                  <first>Tom</first>
+                  <street>King &amp; Queen</street>
+                  <city-v2>Ottawa</city-v2>
+                </address>
+                <tracking xmlns="urn:jon">
+                  <enabled-v2>true</enabled-v2>
+                  <logging>
+                    <local>true</local>
+                  </logging>
+                </tracking>
+              </data>
+            </rpc-reply>
+            """
+        config = Config(self.d, xml)
+        for pretty in [False, True]:
+            chunks = list(config.iterxml(pretty=pretty, chunk_size=16))
+            self.assertGreater(len(chunks), 1)
+            data = b''.join(chunks)
+            self.assertEqual(
+                etree.tostring(etree.fromstring(data, self.parser)),
+                etree.tostring(config.ele),
+            )
+            buffer = BytesIO()
+            self.assertEqual(config.write(buffer, pretty=pretty), len(data))
+            self.assertEqual(buffer.getvalue(), data)
+        self.assertEqual(data.decode(), str(config))
+        self.assertRaises(ValueError, config.iterxml, chunk_size=0)
+
+    def test_write_2(self):
+        xml1 = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <numbers xmlns="urn:jon">
+                  <first>one</first>
+                </numbers>
+                <foo xmlns="urn:jon">bar</foo>
+              </data>
+            </rpc-reply>
+            """
+        xml2 = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <numbers xmlns="urn:jon">
+                  <second>two</second>
+                  <third>three</third>
+                </numbers>
+              </data>
+            </rpc-reply>
+            """
+        config1 = Config(self.d, xml1)
+        config2 = Config(self.d, xml2)
+        delta = config2 - config1
+        buffer = BytesIO()
+        delta.write(buffer, pretty=True, chunk_size=32)
+        ele = etree.fromstring(buffer.getvalue())
+        self.assertEqual(
+            ele.find('{urn:jon}foo').get(operation_tag),
+            'delete',
+        )
+        self.assertEqual(config1 + ele, config1 + delta)
+        self.assertEqual(b''.join(delta.iterxml()), buffer.getvalue()
+                         .replace(b'\n', b'').replace(b'  ', b''))
+
+    def test_stats_1(self):
+        xml1 = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <address xmlns="urn:jon">
+                  <last>Wang</last>
+                  <first>Tom</first>
+                  <street>Main</street>
+                </address>
+              </data>
+            </rpc-reply>
+            """
+        xml2 = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <address xmlns="urn:jon">
+                  <last>Wang</last>
+                  <first>Tom</first>
+                  <street>King</street>
+                </address>
+                <foo xmlns="urn:jon">bar</foo>
+              </data>
+            </rpc-reply>
+            """
+        phases = []
+        self.assertIsNone(self.d.stats)
+        stats = self.d.enable_stats(
+            callback=lambda phase, stats: phases.append(phase))
+        try:
+            config1 = Config(self.d, xml1)
+            config2 = Config(self.d, xml2)
+            delta = config2 - config1
+            config1 + delta.nc
+            self.assertNotEqual(config1, config2)
+        finally:
+            self.assertIs(self.d.disable_stats(), stats)
+        self.assertIsNone(self.d.stats)
+        self.assertEqual(phases,
+                         ['trim', 'validate', 'trim', 'validate',
+                          'sub', 'add', 'trim'])
+        data = stats.as_dict()
+        for name in ['get_schema_node', 'nodes_hit', '_pair_children',
+                     '_node_le']:
+            self.assertGreater(data['counters'][name], 0)
+        self.assertIn('parse_text_hit', data['counters'])
+        self.assertIn('parse_text_miss', data['counters'])
+        self.assertLessEqual(
+            data['counters']['get_schema_node'],
+            data['counters']['nodes_hit'] +
+            data['counters'].get('nodes_miss', 0),
+        )
+        for phase in ['trim', 'validate', 'sub', 'add']:
+            self.assertGreater(data['phases'][phase], 0)
+            self.assertGreaterEqual(data['timers'][phase], 0)
+        self.assertEqual(data['peaks']['tree_size'], 6)
+
+    def test_schema_node_1(self):
+        for model in self.d.models.values():
+            for element, record in model.schema_nodes.items():
+                self.assertIs(record.element, element)
+                self.assertIs(self.d.schema_nodes[element], record)
+                self.assertEqual(record.type, element.get('type'))
+                if record.type == 'list':
+                    self.assertEqual(list(record.keys),
+                                     Composer(self.d, element).keys)
+                if element.getparent() is not None:
+                    self.assertIs(record.parent.element, element.getparent())
+        jon = self.d.models['jon']
+        root = jon.schema_nodes[jon.tree]
+        address = root.children['{urn:jon}address']
+        self.assertEqual(address.keys, ('{urn:jon}first', '{urn:jon}last'))
+        self.assertTrue(address.user_ordered)
+        self.assertTrue(address.children['{urn:jon}first'].is_key)
+        self.assertEqual(address.children['{urn:jon}city'].default, 'Unknown')
+        location = root.children['{urn:jon}location']
+        self.assertIn('{urn:jon}alberta', location.children)
+        self.assertIn('{urn:jon}ontario', location.children)
+        cause = root.children['{urn:jon}errdisable'] \
+            .children['{urn:jon}detect'].children['{urn:jon}cause-config']
+        self.assertEqual(cause.children['{urn:jon}leaflist1'].default,
+                         ('abc', 'def', 'ghi'))
+        config = Config(self.d, """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <address xmlns="urn:jon">
+                  <last>Wang</last>
+                  <first>Tom</first>
+                </address>
+              </data>
+            </rpc-reply>
+            """)
+        node = config.ele.find('{urn:jon}address/{urn:jon}first')
+        self.assertIs(self.d.get_schema_record(node),
+                      address.children['{urn:jon}first'])
+
+    def test_auto_load_1(self):
+        device = ModelDevice(MySSHSession(), DefaultDeviceHandler(),
+                             auto_load=True)
+        device.scan_models(folder=path.join(curr_dir, 'yang'),
+                           download='ignore')
+        self.assertEqual(device.models_loaded, [])
+        xml = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <foo xmlns="urn:jon">bar</foo>
+              </data>
+            </rpc-reply>
+            """
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            configs = list(executor.map(lambda i: Config(device, xml),
+                                        range(8)))
+        self.assertEqual(device.models_loaded, ['jon'])
+        self.assertEqual(device.models_autoloaded, ['jon'])
+        self.assertEqual(configs[0].roots, {'{urn:jon}foo': 'jon'})
+        self.assertEqual(configs[0], configs[-1])
+
+        # explicit loading is not recorded as auto-loading
+        device.load_model('openconfig-interfaces')
+        self.assertEqual(device.models_autoloaded, ['jon'])
+
+        # the map from URLs to model names is built with namespaces
+        url_names = device.schema.url_names
+        self.assertEqual(url_names['urn:jon'], 'jon')
+        self.assertEqual(device.auto_load_model('urn:jon'), 'jon')
+        self.assertIsNone(device.auto_load_model('urn:unknown'))
+        self.assertIs(device.schema.url_names, url_names)
+        url_prefixes = device.schema.url_prefixes
+        self.assertEqual(url_prefixes['urn:jon'], 'jon')
+        self.assertEqual(configs[0].ns['jon'], 'urn:jon')
+        self.assertIs(device.schema.url_prefixes, url_prefixes)
+
+        # auto-loading is off by default
+        device = ModelDevice(MySSHSession(), DefaultDeviceHandler())
+        device.scan_models(folder=path.join(curr_dir, 'yang'),
+                           download='ignore')
+        self.assertRaises(ModelMissing, Config, device, xml)
+        self.assertEqual(device.models_autoloaded, [])
+
+    def test_import_1(self):
+        code = (
+            "import sys\n"
+            "from ncdiff import Config, ConfigDelta, RunningConfigDiff\n"
+            "from ncdiff.model import Model, read_xml\n"
+            "Model(read_xml(sys.argv[1]))\n"
+            "assert 'pyang' not in sys.modules\n"
+            "assert 'ncclient.manager' not in sys.modules\n"
+            "from ncdiff import ModelDevice, ModelCompiler\n"
+            "assert 'pyang' in sys.modules\n"
+        )
+        filename = path.join(curr_dir, 'yang', 'jon.xml')
+        src_dir = path.dirname(path.dirname(curr_dir))
+        subprocess.run([sys.executable, '-c', code, filename],
+                       cwd=src_dir, check=True)
+
+    def test_schema_registry_1(self):
+        registry = SchemaRegistry()
+        folder = path.join(curr_dir, 'yang')
+        devices = [ModelDevice(MySSHSession(), DefaultDeviceHandler(),
+                               schema_registry=registry)
+                   for i in range(3)]
+        for device in devices:
+            device.scan_models(folder=folder, download='ignore')
+            device.load_model('jon')
+        self.assertEqual(len(registry), 1)
+        self.assertIs(devices[0].schema, devices[1].schema)
+        self.assertIs(devices[0].compiler, devices[2].compiler)
+        self.assertIs(devices[0].models['jon'], devices[2].models['jon'])
+        self.assertIs(devices[0].namespaces, devices[1].namespaces)
+
+        xml = """
+            <rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101">
+              <data>
+                <foo xmlns="urn:jon">bar</foo>
+              </data>
+            </rpc-reply>
+            """
+        config = Config(devices[0], xml)
+        self.assertIn('{urn:jon}foo', devices[1].nodes)
+        self.assertEqual(config, Config(devices[1], xml))
+
+        # different capabilities, different schema
+        session = MySSHSession()
+        session._server_capabilities = server_capabilities[:-1]
+        device = ModelDevice(session, DefaultDeviceHandler(),
+                             schema_registry=registry)
+        self.assertIsNot(device.schema, devices[0].schema)
+        self.assertEqual(len(registry), 2)
+        self.assertEqual(device.models, {})
+
+        # private schema by default
+        device = ModelDevice(MySSHSession(), DefaultDeviceHandler())
+        self.assertFalse(device.schema.shared)
+        self.assertEqual(
+            SchemaRegistry.fingerprint(reversed(server_capabilities)),
+            devices[0].schema.fingerprint,
+        )
+
+    def test_downloader_1(self):
+        with tempfile.TemporaryDirectory() as folder:
+            revisions = {'a': '2024-01-01', 'b': '2024-01-01',
+                         'c': '2024-01-01'}
+            d = MyModelDownloader(MyModelDevice(revisions), folder,
+                                  num_threads=3)
+            d.download_all()
+            self.assertEqual(sorted(d.requests), ['a', 'b', 'c'])
+            self.assertFalse(d.need_download)
+            for m in 'abc':
+                with open(path.join(folder, m + '.xml'), 'w') as f:
+                    f.write('<{}/>'.format(m))
+
+            # b is changed, so a, which imports b, is affected as well
+            revisions = dict(revisions, b='2024-02-01')
+            d = MyModelDownloader(MyModelDevice(revisions), folder)
+            d.download_all()
+            self.assertEqual(d.requests, ['b'])
+            self.assertEqual(d.invalidated, {'a', 'b'})
+            self.assertFalse(path.isfile(path.join(folder, 'a.xml')))
+            self.assertTrue(path.isfile(path.join(folder, 'c.xml')))
+
+            # c is removed and d cannot be downloaded
+            revisions = {'a': '2024-01-01', 'b': '2024-02-01',
+                         'd': '2024-01-01'}
+            d = MyModelDownloader(MyModelDevice(revisions), folder)
+            d.unavailable = {'d'}
+            d.download_all()
+            self.assertEqual(d.removed, {'c'})
+            self.assertEqual(d.failed, {'d'})
+            self.assertFalse(path.isfile(path.join(folder, 'c.yang')))
+            self.assertTrue(d.need_download)
+
+            # resume
+            d = MyModelDownloader(MyModelDevice(revisions), folder)
+            d.download_all()
+            self.assertEqual(d.requests, ['d'])
+            self.assertFalse(d.need_download)
+            with open(path.join(folder, 'revisions.txt')) as f:
+                self.assertEqual(f.read().splitlines(), [
+                    'a@2024-01-01', 'b@2024-02-01', 'd@2024-01-01'])
+            ids = [m.get('id') for m in d.context.dependencies]
+            self.assertEqual(sorted(ids), ['a', 'b', 'd'])
+
+            # revisions of downloaded modules are appended, later lines win
+            d.append_revision('d', '2024-02-01')
+            self.assertEqual(d.read_revisions(), {
+                'a': '2024-01-01', 'b': '2024-02-01', 'd': '2024-02-01'})
+
+    def test_store_1(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = ModuleStore(path.join(root, 'store'))
+            folder1 = path.join(root, 'device1')
+            folder2 = path.join(root, 'device2')
+            revisions = {'a': '2024-01-01', 'b': '2024-01-01'}
+            d1 = MyModelDownloader(MyModelDevice(revisions), folder1,
+                                   store=store)
+            d1.download_all()
+            self.assertEqual(sorted(d1.requests), ['a', 'b'])
+
+            # modules in the store are not downloaded again
+            revisions = dict(revisions, c='2024-01-01')
+            d2 = MyModelDownloader(MyModelDevice(revisions), folder2,
+                                   store=store)
+            d2.download_all()
+            self.assertEqual(d2.requests, ['c'])
+            with open(path.join(folder2, 'manifest.txt')) as f:
+                manifest = dict(line.split() for line in f)
+            self.assertEqual(sorted(manifest), ['a', 'b', 'c'])
+            self.assertTrue(path.samefile(path.join(folder1, 'a.yang'),
+                                          store.module_path(manifest['a'])))
+            self.assertTrue(path.samefile(path.join(folder1, 'a.yang'),
+                                          path.join(folder2, 'a.yang')))
+
+            # compiled models are shared by folders with the same closure
+            c1 = ModelCompiler(folder1, store=store)
+            c2 = ModelCompiler(folder2, store=store)
+            self.assertEqual(c1.cache_key('a'), c2.cache_key('a'))
+            self.assertNotEqual(c1.cache_key('a'), c1.cache_key('b'))
+            m = c1.compile('a')
+            self.assertEqual(m.name, 'a')
+            self.assertTrue(path.isfile(store.compiled_path(
+                c1.cache_key('a'))))
+            self.assertFalse(path.isfile(path.join(folder2, 'a.xml')))
+            self.assertEqual(c2.compile('a').name, 'a')
+            self.assertTrue(path.samefile(path.join(folder1, 'a.xml'),
+                                          path.join(folder2, 'a.xml')))
+            # c2 did not run pyang
+            self.assertEqual(c2.module_prefixes, {})
+
+    def test_async_fleet_1(self):
+        expected = self.d.extract_config(
+            self.d.get_config(models='openconfig-network-instance'))
+
+        async def fetch(devices, limit):
+            async with AsyncFleet(devices, limit=limit) as fleet:
+                return await fleet.fetch_config(
+                    models='openconfig-network-instance')
+
+        configs = asyncio.run(fetch([self.d] * 5, 2))
+        self.assertEqual(len(configs), 5)
+        for config in configs:
+            self.assertEqual(config, expected)
+
+        # parallelism is bounded and errors are returned per device
+        class MyDevice(object):
+            lock = threading.Lock()
+            running = 0
+            peak = 0
+            threads = set()
+
+            def __init__(self, ok=True):
+                self.ok = ok
+
+            def execute(self, operation, *args, **kwargs):
+                with self.lock:
+                    MyDevice.running += 1
+                    MyDevice.peak = max(MyDevice.peak, MyDevice.running)
+                    MyDevice.threads.add(threading.current_thread().name)
+                time.sleep(0.01)
+                with self.lock:
+                    MyDevice.running -= 1
+                if not self.ok:
+                    raise ConnectionError('device is down')
+                return operation
+
+        fleet = AsyncFleet([MyDevice(ok=(i != 3)) for i in range(20)],
+                           limit=4)
+        replies = asyncio.run(fleet.get())
+        self.assertLessEqual(MyDevice.peak, 4)
+        self.assertLessEqual(len(MyDevice.threads), 4)
+        self.assertIsInstance(replies[3], ConnectionError)
+        self.assertEqual(replies[:3], ['get'] * 3)
+
+        # the semaphore is created in the running event loop, so the fleet
+        # can be used by another event loop
+        replies = asyncio.run(fleet.get_config())
+        fleet.close()
+        self.assertLessEqual(MyDevice.peak, 4)
+        self.assertEqual(replies[:3], ['get_config'] * 3)
+        self.assertEqual([i for i, r in enumerate(replies)
+                          if isinstance(r, Exception)], [3])
+
+    def test_subtree_filter_1(self):
+        expected = """
+            <nc:filter xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0" type="subtree">
+              <oc-if:interfaces xmlns:oc-if="http://openconfig.net/yang/interfaces">
+                <oc-if:interface>
+                  <oc-if:name>Gi0/0</oc-if:name>
+                  <oc-if:config/>
+                  <oc-if:state>
+                    <oc-if:counters/>
+                  </oc-if:state>
+                </oc-if:interface>
+                <oc-if:interface>
+                  <oc-if:name>Gi0/1</oc-if:name>
+                </oc-if:interface>
+              </oc-if:interfaces>
+              <jon:address xmlns:jon="urn:jon">
+                <jon:first>John</jon:first>
+                <jon:last>Doe</jon:last>
+                <jon:street/>
+              </jon:address>
+              <jon:store xmlns:jon="urn:jon">abc</jon:store>
+              <jon:location xmlns:jon="urn:jon">
+                <jon:alberta>
+                  <jon:name>x</jon:name>
+                </jon:alberta>
+              </jon:location>
+            </nc:filter>
+            """
+        xpaths = [
+            '/oc-if:interfaces/interface[name="Gi0/0"]/config',
+            '/oc-if:interfaces/oc-if:interface[oc-if:name="Gi0/0"]'
+            '/oc-if:state/oc-if:counters',
+            '/oc-if:interfaces/interface[name="Gi0/1"]/config/mtu',
+            '/oc-if:interfaces/interface[name="Gi0/1"]',
+            '/jon:address[last="Doe"][first=\'John\']/street',
+            '/jon:store[text()="abc"]',
+            '/jon:location/alberta[name="x"]',
+        ]
+        f = self.d.subtree_filter(xpaths)
+        self.assertEqual(
+            etree.tostring(f),
+            etree.tostring(etree.fromstring(expected, self.parser)))
+
+        # a path without list predicates covers others
+        f = self.d.subtree_filter([
+            '/oc-if:interfaces/interface[name="Gi0/1"]/config/mtu',
+            '/oc-if:interfaces/interface',
+        ])
+        self.assertEqual(len(f[0]), 1)
+        self.assertEqual(len(f[0][0]), 0)
+
+        # the path is validated against the schema
+        for xpath in [
+            'oc-if:interfaces',
+            '/oc-if:interfaces/foo',
+            '/oc-if:interfaces[name="Gi0/1"]',
+            '/oc-if:interfaces/interface[mtu="1500"]',
+        ]:
+            self.assertRaises(ValueError, self.d.subtree_filter, xpath)
+        self.assertRaises(ValueError, self.d.get_config,
+                          xpaths='/oc-if:interfaces/interface/state')
+        reply = self.d.get_config(
+            xpaths='/oc-if:interfaces/interface[name="Gi0/1"]/config')
+        self.assertTrue(reply.ok)
+
+    def test_filter_3(self):
+        config = self.d.extract_config(
+            self.d.get_config(models='openconfig-network-instance'))
+        xml = config.xml
+        prefix = '/nc:config/oc-netinst:network-instances' \
+                 '/oc-netinst:network-instance'
+        for path in [
+            prefix + '/oc-netinst:tables/oc-netinst:table/oc-netinst:config',
+            prefix + '/oc-netinst:protocols/oc-netinst:protocol'
+                     '[oc-netinst:name="DEFAULT"]',
+            prefix + '/oc-netinst:protocols/oc-netinst:protocol'
+                     '[oc-netinst:name="DEFAULT"]//oc-netinst:index | ' +
+            prefix + '/oc-netinst:protocols',
+            prefix + '/oc-netinst:config/oc-netinst:name',
+        ]:
+            filtered = config.filter(path)
+            self.assertEqual(len(filtered.xpath(path)),
+                             len(config.xpath(path)))
+        self.assertEqual(config.xml, xml)
+
+        # no match and non-node results
+        self.assertEqual(len(config.filter('/nc:config/jon:foo').ele), 0)
+        self.assertEqual(config.filter('count(//oc-netinst:name)'), config)
+
+    def test_xpath_cache_1(self):
+        cache = self.d.xpath_cache
+        cache.clear()
+        config = self.d.extract_config(
+            self.d.get_config(models='openconfig-network-instance'))
+        path = '/nc:config/oc-netinst:network-instances' \
+               '/oc-netinst:network-instance/oc-netinst:name/text()'
+        for i in range(3):
+            self.assertEqual(config.xpath(path), ['Mgmt-intf'])
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 2)
+        self.assertIs(self.d.prefixes, self.d.prefixes)
+
+        # replies share the cache of the device
+        reply = self.d.get_config(models='openconfig-network-instance')
+        path = '/nc:rpc-reply/nc:data/oc-netinst:network-instances' \
+               '/oc-netinst:network-instance/oc-netinst:name/text()'
+        self.assertIs(reply.xpath_cache, cache)
+        self.assertEqual(reply.xpath(path), ['Mgmt-intf'])
+        self.assertEqual(reply.xpath(path), ['Mgmt-intf'])
+        self.assertEqual(cache.misses, 2)
+
+        # variables and a bounded size
+        self.assertEqual(
+            config.xpath('count(//oc-netinst:name[text()=$n])', n='DEFAULT'),
+            4.0)
+        small = XPathCache(maxsize=2)
+        for path in ['/a', '/b', '/c', '/a']:
+            small.compile(path)
+        self.assertEqual(len(small), 2)
+        self.assertEqual(small.misses, 4)
+
+    def test_digest_1(self):
+        def config(*nodes):
+            xml = """
+                <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                  {}
+                </config>
+                """.format(''.join(nodes))
+            return Config(self.d, xml)
+
+        foo = '<foo xmlns="urn:jon">bar</foo>'
+        tracking = '<j:tracking xmlns:j="urn:jon"><j:enabled-v2>true' \
+                   '</j:enabled-v2></j:tracking>'
+        a1 = '<address xmlns="urn:jon"><first>A</first><last>B</last>' \
+             '</address>'
+        a2 = '<address xmlns="urn:jon"><last>D</last><first>C</first>' \
+             '</address>'
+        digest = config(foo, tracking, a1, a2).digest
+        self.assertEqual(len(digest), 64)
+        # order of siblings and namespace prefixes do not matter
+        self.assertEqual(config(a1, tracking, a2, foo).digest, digest)
+        # order of user-ordered list entries matters
+        self.assertNotEqual(config(foo, tracking, a2, a1).digest, digest)
+        self.assertNotEqual(config(foo, a1, a2).digest, digest)
+
+    def test_digest_2(self):
+        def config(*nodes):
+            xml = """
+                <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                  {}
+                </config>
+                """.format(''.join(nodes))
+            return Config(self.d, xml)
+
+        foo = '<foo xmlns="urn:jon">bar</foo>'
+        merge = '<foo xmlns="urn:jon" xmlns:nc="{}" nc:operation="merge">' \
+                'bar</foo>'.format(nc_url)
+        config1 = config(foo)
+        config2 = config(merge)
+        # == compares digests, which ignore attributes
+        self.assertEqual(config1, config2)
+        self.assertFalse(config1 != config2)
+        self.assertEqual(hash(config1), hash(config2))
+        self.assertEqual(len({config1, config2}), 1)
+        # <= still compares attributes
+        self.assertTrue(config1 <= config2)
+        self.assertFalse(config2 <= config1)
+        # a node without text equals a node with empty text
+        config1 = config('<foo xmlns="urn:jon"/>')
+        config2 = config('<foo xmlns="urn:jon"/>')
+        config2.ele[0].text = ''
+        self.assertEqual(config1, config2)
+        self.assertNotEqual(config1, config(foo))
+
+    def test_drift_1(self):
+        reply = self.d.get_config(models='openconfig-network-instance')
+        intended = self.d.extract_config(reply)
+        checker = DriftChecker()
+        checker.set_intended('r1', intended)
+
+        report = checker.check('r1', reply)
+        self.assertFalse(report)
+        self.assertFalse(report.compared)
+        self.assertIsNone(report.edit_config)
+
+        running = intended.filter(
+            '/nc:config/oc-netinst:network-instances'
+            '/oc-netinst:network-instance/oc-netinst:config')
+        report = checker.check('r1', running)
+        self.assertTrue(report)
+        self.assertTrue(report.compared)
+        self.assertEqual(running + report.delta, intended)
+        self.assertEqual(report.edit_config.tag, '{' + nc_url + '}config')
+        self.assertEqual(checker.counters,
+                         {'checks': 2, 'skipped': 1, 'drifted': 1})
+        self.assertRaises(KeyError, checker.check, 'r2', running)
+
+    def test_push_1(self):
+        def config(*nodes):
+            xml = """
+                <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                  {}
+                </config>
+                """.format(''.join(nodes))
+            return Config(self.d, xml)
+
+        def notification(id, *edits, kind='push-change-update'):
+            if kind == 'push-update':
+                body = '<datastore-contents>{}</datastore-contents>' \
+                       .format(''.join(edits))
+            else:
+                body = '<datastore-changes><yang-patch>' \
+                       '<patch-id>p</patch-id>{}</yang-patch>' \
+                       '</datastore-changes>'.format(''.join(edits))
+            return """
+                <notification
+                 xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">
+                  <eventTime>2026-10-19T08:00:00Z</eventTime>
+                  <{0} xmlns="urn:ietf:params:xml:ns:yang:ietf-yang-push">
+                    <id>{1}</id>{2}
+                  </{0}>
+                </notification>
+                """.format(kind, id, body)
+
+        def edit(id, operation, target, value='', **kwargs):
+            extra = ''.join('<{0}>{1}</{0}>'.format(k, v)
+                            for k, v in kwargs.items())
+            if value:
+                value = '<value>{}</value>'.format(value)
+            return '<edit><edit-id>{}</edit-id><operation>{}</operation>' \
+                   '{}{}{}</edit>'.format(id, operation, target, value, extra)
+
+        logging = '<tracking xmlns="urn:jon"><logging><local>true</local>' \
+                  '</logging></tracking>'
+        tom = '<address xmlns="urn:jon"><first>Tom</first><last>Smith' \
+              '</last><street>Main</street></address>'
+        ann = '<address xmlns="urn:jon"><first>Ann</first><last>Lee' \
+              '</last></address>'
+        store = '<store xmlns="urn:jon">{}</store>'
+        server = '<server xmlns="urn:jon"><host>h</host><port>514</port>' \
+                 '</server>'
+        events = []
+        subscriber = PushSubscriber(config(logging, tom, store.format('A'),
+                                           store.format('B')),
+                                    subscription_id=7,
+                                    callback=events.append)
+
+        # recorded notification with data resource identifiers
+        event = subscriber.process(notification(
+            7,
+            edit('e1', 'merge',
+                 '<target>/jon:tracking/logging/server</target>', server),
+            edit('e2', 'insert', '<target>/jon:address=Ann,Lee</target>',
+                 ann, where='before', point='/jon:address=Tom,Smith'),
+            edit('e3', 'delete', '<target>/jon:store=A</target>'),
+            edit('e4', 'move', '<target>/jon:store=B</target>',
+                 where='first'),
+            edit('e5', 'merge', '<target>/jon:foo</target>',
+                 '<foo xmlns="urn:jon">bar</foo>'),
+            ))
+        expected = config(
+            '<tracking xmlns="urn:jon"><logging><local>true</local>'
+            '{}</logging></tracking>'.format(server),
+            ann, tom, store.format('B'), '<foo xmlns="urn:jon">bar</foo>')
+        self.assertEqual(subscriber.config, expected)
+        self.assertEqual(subscriber.digest, expected.digest)
+        self.assertEqual(subscriber.config.xpath('//jon:first/text()'),
+                         ['Ann', 'Tom'])
+        self.assertEqual(subscriber.config.xpath('//jon:store/text()'),
+                         ['B'])
+        self.assertTrue(event)
+        self.assertEqual(events, [event])
+        self.assertEqual([e[0] for e in event.edits],
+                         ['e1', 'e2', 'e3', 'e4', 'e5'])
+        self.assertEqual(event.event_time, '2026-10-19T08:00:00Z')
+
+        # instance identifiers with prefixes declared on the target
+        target = '<target xmlns:j="urn:jon">{}</target>'
+        event = subscriber.process(notification(
+            7,
+            edit('e1', 'remove', target.format(
+                "/j:address[j:first='Tom'][j:last='Smith']")),
+            edit('e2', 'replace',
+                 target.format('/j:tracking/j:logging/j:server'),
+                 '<server xmlns="urn:jon"><host>x</host></server>'),
+            ))
+        expected = config(
+            '<tracking xmlns="urn:jon"><logging><local>true</local>'
+            '<server><host>x</host></server></logging></tracking>',
+            ann, store.format('B'), '<foo xmlns="urn:jon">bar</foo>')
+        self.assertEqual(subscriber.config, expected)
+        self.assertEqual(subscriber.digest, expected.digest)
+
+        # deleting a node that is not cached
+        missing = notification(
+            7, edit('e1', 'delete', '<target>/jon:address=Tom,Smith</target>'))
+        event = subscriber.process(missing)
+        self.assertFalse(event)
+        self.assertEqual(event.edits, [])
+        subscriber.strict = True
+        self.assertRaises(ConfigDeltaError, subscriber.process, missing)
+        self.assertEqual(subscriber.config, expected)
+
+        # edits applied before a failing edit are rolled back
+        failing = notification(
+            7,
+            edit('e1', 'merge', '<target>/jon:foo</target>',
+                 '<foo xmlns="urn:jon">baz</foo>'),
+            edit('e2', 'remove', target.format(
+                "/j:address[j:first='Ann'][j:last='Lee']")),
+            edit('e3', 'replace', '<target>/jon:tracking</target>',
+                 '<tracking xmlns="urn:jon"><enabled-v2>true</enabled-v2>'
+                 '</tracking>'),
+            edit('e4', 'delete', '<target>/jon:address=Tom,Smith</target>'))
+        self.assertRaises(ConfigDeltaError, subscriber.process, failing)
+        self.assertEqual(subscriber.config, expected)
+        self.assertEqual(subscriber.digest, expected.digest)
+
+        # digests of touched paths are computed again, and default values
+        # are trimmed
+        event = subscriber.process(notification(
+            7,
+            edit('e1', 'merge', '<target>/jon:foo</target>',
+                 '<foo xmlns="urn:jon">baz</foo>'),
+            edit('e2', 'merge',
+                 '<target>/jon:errdisable/detect/cause-config/small-frame'
+                 '</target>',
+                 '<small-frame xmlns="urn:jon">true</small-frame>'),
+            ))
+        expected = config(
+            '<tracking xmlns="urn:jon"><logging><local>true</local>'
+            '<server><host>x</host></server></logging></tracking>',
+            ann, store.format('B'), '<foo xmlns="urn:jon">baz</foo>')
+        self.assertEqual(subscriber.config, expected)
+        self.assertEqual(subscriber.digest, expected.digest)
+        self.assertEqual(subscriber.config.digest, expected.digest)
+
+        # other subscriptions are ignored, push-update resyncs
+        self.assertIsNone(subscriber.process(notification(8)))
+        events = list(subscriber.consume([
+            notification(8),
+            notification(7, tom, kind='push-update'),
+            ]))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].kind, 'push-update')
+        self.assertEqual(subscriber.config, config(tom))
+        self.assertEqual(subscriber.counters,
+                         {'notifications': 5, 'edits': 9, 'skipped': 1,
+                          'resyncs': 1, 'ignored': 2})
+
+    def test_instanceid_1(self):
+        def node(xml):
+            return etree.fromstring(xml)[0]
+
+        oc_url = 'http://openconfig.net/yang/interfaces'
+        n1 = node("""<r xmlns:oc="{}" xmlns:j="urn:jon"><foo xmlns="urn:jon">
+            /oc:interfaces/interface[name="Gi1"]/j:store[.='a''b']
+            </foo></r>""".format(oc_url))
+        n2 = node("""<r xmlns:i="{}"><foo xmlns="urn:jon">
+            /i:interfaces/i:interface[i:name='Gi1']/jon:store[.="a'b"]
+            </foo></r>""".format(oc_url))
+        to_node = node("""<r xmlns:x="{}" xmlns:y="urn:jon"><foo/>
+            </r>""".format(oc_url))
+        cache = self.d.instanceid_cache
+        cache.clear()
+        i1 = InstanceIdentifier(self.d, n1)
+        self.assertEqual(
+            i1.default.strip(),
+            "/openconfig-interfaces:interfaces"
+            "/openconfig-interfaces:interface"
+            "[openconfig-interfaces:name='Gi1']/jon:store[.='a''b']")
+        self.assertEqual(InstanceIdentifier(self.d, n2).default, i1.default)
+        self.assertEqual(
+            InstanceIdentifier(self.d, n1, to_node=to_node).converted.strip(),
+            "/x:interfaces/x:interface[x:name='Gi1']/y:store[.='a''b']")
+        self.assertEqual(i1.default_ns,
+                         {None: 'urn:jon', 'openconfig-interfaces': oc_url})
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertIs(InstanceIdentifier(self.d, n1).compiled, i1.compiled)
+
+        # whitespace around '=' is not part of the value
+        n3 = node("""<r xmlns:oc="{}" xmlns:j="urn:jon"><foo xmlns="urn:jon">
+            /oc:interfaces/interface[name = "Gi1"]/j:store[. = 'a''b']
+            </foo></r>""".format(oc_url))
+        self.assertEqual(InstanceIdentifier(self.d, n3).default, i1.default)
+
+        for text in ["/oc:interfaces[oc:name='Gi1'", "/oc:interfaces[a=b]",
+                     '/oc:interfaces[oc:name="Gi1]', '/interfaces',
+                     '/z:interfaces']:
+            n = node('<r xmlns:oc="{}"><foo xmlns="urn:jon">{}</foo></r>'
+                     .format(oc_url, text))
+            with self.assertRaises(ConfigError):
+                InstanceIdentifier(self.d, n).default
+        with self.assertRaises(ConfigError):
+            InstanceIdentifier(self.d, n1,
+                               to_node=node('<r><foo/></r>')).converted
+
+    def test_default_in_use_4(self):
+        def names(nodes):
+            return [(n.tag, n.get('type'), n.get('default')) for n in nodes]
+
+        tree = self.d.models['jon'].tree
+        for schema_node in [tree] + tree.xpath('//*[@type="container"]'):
+            # a copy is not in schema_nodes, so defaults are found by walking
+            # the schema tree
+            self.assertEqual(names(self.d.default_in_use(schema_node)),
+                             names(self.d.default_in_use(
+                                 deepcopy(schema_node))))
+        location = self.d.get_schema_record(tree.find('{urn:jon}location'))
+        self.assertEqual(
+            names(r.element for r in location.defaults_in_use),
+            [('{urn:jon}alberta', 'case', None),
+             ('{urn:jon}code', 'leaf', 'AB')])
+
+        config1 = Config(self.d, None)
+        config2 = Config(self.d, """
+            <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+              <location xmlns="urn:jon">
+                <other-info>
+                  <geo-facts>
+                    <area>5</area>
+                    <code>XY</code>
+                  </geo-facts>
+                </other-info>
+              </location>
+            </config>
+            """)
+        delta = ConfigDelta(config1, config2, preferred_create='create')
+        operations = {etree.QName(n).localname: n.get(operation_tag)
+                      for n in delta.nc.iter()}
+        self.assertEqual(operations['area'], 'create')
+        self.assertIsNone(operations['code'])
+        self.assertIsNone(operations['geo-facts'])
+        self.assertEqual(config1 + delta, config2)
+
+    def test_history_1(self):
+        def config(*nodes):
+            xml = """
+                <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                  {}
+                </config>
+                """.format(''.join(nodes))
+            return Config(self.d, xml)
+
+        def address(first, last, street):
+            return '<address xmlns="urn:jon"><first>{}</first><last>{}' \
+                   '</last><street>{}</street></address>' \
+                   .format(first, last, street)
+
+        tracking = '<tracking xmlns="urn:jon"><enabled-v2>true</enabled-v2>' \
+                   '<logging><local>true</local><server><host>h</host>' \
+                   '</server></logging></tracking>'
+        store = '<store xmlns="urn:jon">A</store><store xmlns="urn:jon">B' \
+                '</store>'
+        configs = [
+            config(tracking, address('A', 'B', 'x'), address('C', 'D', 'y'),
+                   store),
+            config(tracking.replace('<host>h', '<host>k'),
+                   address('A', 'B', 'x'), address('C', 'D', 'z'), store),
+            config(tracking, address('C', 'D', 'z'), address('A', 'B', 'x'),
+                   store.replace('A', 'E'),
+                   '<foo xmlns="urn:jon">bar</foo>'),
+            ]
+        running = self.d.extract_config(
+            self.d.get_config(models='openconfig-network-instance'))
+        modified = Config(self.d, deepcopy(running.ele))
+        modified.xpath('//oc-netinst:name[text()="DEFAULT"]')[-1].text = 'X'
+        configs += [running, modified]
+
+        history = ConfigHistory(self.d)
+        for index, c in enumerate(configs):
+            snapshot = history.add(c, label=index)
+            self.assertEqual(snapshot.digest, c.digest)
+        self.assertEqual(len(history), 5)
+        self.assertTrue(history.changed(0, 1))
+        for index, c in enumerate(configs):
+            self.assertEqual(history.config(index), c)
+        for i, j in [(0, 1), (1, 2), (2, 0), (0, 0), (3, 4), (4, 3)]:
+            delta = history.delta(i, j)
+            self.assertEqual(history.config(i) + delta, configs[j])
+            self.assertEqual(configs[i] + delta, configs[j])
+            full = ConfigDelta(configs[i], configs[j])
+            self.assertLessEqual(len(etree.tostring(delta.nc)),
+                                 len(etree.tostring(full.nc)))
+        self.assertEqual(len(history.delta(0, 0).nc), 0)
+        delta = history.delta(3, 4, preferred_replace='replace')
+        self.assertEqual(configs[3] + delta, configs[4])
+
+        # unchanged subtrees are shared
+        nodes = history.nodes
+        history.add(configs[4])
+        self.assertEqual(history.nodes, nodes)
+        self.assertFalse(history.changed(4, 5))
+        history = ConfigHistory(self.d, maxlen=2)
+        for c in configs[3:]:
+            history.add(c)
+        self.assertLess(history.nodes,
+                        2 * len(list(running.ele.iter())))
+        # subtrees of dropped snapshots are released
+        history.add(configs[0])
+        history.add(configs[1])
+        reachable = set()
+        stack = [history[0].root, history[1].root]
+        while stack:
+            node = stack.pop()
+            if node not in reachable:
+                reachable.add(node)
+                stack.extend(node.children)
+        self.assertEqual(history.nodes, len(reachable))
+
+    def test_history_2(self):
+        # a leaf and an ordered-by user leaf-list share a tag and a value
+        yang = '''module shared-tag {
+              namespace "urn:shared-tag";
+              prefix st;
+              container a {
+                leaf x { type string; }
+              }
+              container b {
+                leaf-list x { type string; ordered-by user; }
+              }
+            }
+            '''
+        with tempfile.TemporaryDirectory() as folder:
+            with open(path.join(folder, 'shared-tag.yang'), 'w') as f:
+                f.write(yang)
+            ModelCompiler(folder).compile('shared-tag')
+            tree = read_xml(path.join(folder, 'shared-tag.xml'))
+            model_file = path.join(folder, 'shared-tag-model.xml')
+            with open(model_file, 'wb') as f:
+                f.write(etree.tostring(tree))
+            device = ModelDevice(MySSHSession(), DefaultDeviceHandler())
+            device.load_model(model_file)
+
+        def config(a, b):
+            xml = '<config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">' \
+                  '<a xmlns="urn:shared-tag"><x>{}</x></a>' \
+                  '<b xmlns="urn:shared-tag">{}</b></config>' \
+                  .format(a, ''.join('<x>{}</x>'.format(v) for v in b))
+            return Config(device, xml)
+
+        config1 = config('v', ['v', 'w'])
+        config2 = config('v', ['w', 'v'])
+        history = ConfigHistory(device)
+        history.add(config1)
+        history.add(config2)
+        delta = history.delta(0, 1)
+        self.assertGreater(len(delta.nc), 0)
+        self.assertEqual(config1 + delta, config2)
+        self.assertEqual(history.config(1), config2)
+
+    def test_canonical_1(self):
+        def interface(name, prefix):
+            return """
+                <interface>
+                  <name>{0}</name>
+                  <config>
+                    <name>{0}</name>
+                    <type xmlns:{1}="urn:ietf:params:xml:ns:yang:iana-if-type">{1}:ethernetCsmacd</type>
+                  </config>
+                </interface>
+                """.format(name, prefix)
+
+        def config(*nodes):
+            xml = """
+                <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                  <interfaces xmlns="http://openconfig.net/yang/interfaces">
+                    {}
+                  </interfaces>
+                  <address xmlns="urn:jon"><first>A</first><last>B</last></address>
+                  <address xmlns="urn:jon"><first>C</first><last>D</last></address>
+                </config>
+                """.format(''.join(nodes))
+            return Config(self.d, xml)
+
+        config1 = config(interface('GigabitEthernet0/0', 'ianaift'),
+                         interface('GigabitEthernet1/0', 'ianaift'))
+        config2 = config(interface('GigabitEthernet1/0', 'x'),
+                         interface('GigabitEthernet0/0', 'y'))
+        self.assertNotEqual(config1.xml, config2.xml)
+        self.assertEqual(config1.c14n, config2.c14n)
+        self.assertEqual(config1.digest, config2.digest)
+        self.assertEqual(config1, config2)
+        self.assertEqual(hash(config1), hash(config2))
+        self.assertEqual(len({config1, config2}), 1)
+        types = config1.canonical.xpath('//*[local-name()="type"]')
+        self.assertEqual([t.text for t in types],
+                         ['iana-if-type:ethernetCsmacd'] * 2)
+        self.assertEqual(Config(self.d, config1.canonical), config1)
+
+        # user-ordered lists keep their order
+        config3 = Config(self.d, config1.xml.replace('<first>A', '<first>E'))
+        config4 = Config(self.d, deepcopy(config3.ele))
+        addresses = config4.xpath('/nc:config/jon:address')
+        config4.ele.insert(config4.ele.index(addresses[0]), addresses[1])
+        self.assertNotEqual(config1, config3)
+        self.assertNotEqual(config3, config4)
+        self.assertNotEqual(config3.c14n, config4.c14n)
+        self.assertEqual(len({config1, config2, config3, config4}), 3)
+
+        # defaults are stripped
+        config5 = Config(self.d, config1.xml)
+        location = etree.SubElement(config5.ele, '{urn:jon}location')
+        other = etree.SubElement(location, '{urn:jon}other-info')
+        facts = etree.SubElement(other, '{urn:jon}geo-facts')
+        etree.SubElement(facts, '{urn:jon}code').text = 'AB'
+        self.assertEqual(config5.c14n, config1.c14n)
+
+    def test_changes_1(self):
+        def config(*nodes):
+            xml = """
+                <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                  {}
+                </config>
+                """.format(''.join(nodes))
+            return Config(self.d, xml)
+
+        def address(first, last, street='x'):
+            return '<address xmlns="urn:jon"><first>{}</first><last>{}' \
+                   '</last><street>{}</street></address>' \
+                   .format(first, last, street)
+
+        def store(value):
+            return '<store xmlns="urn:jon">{}</store>'.format(value)
+
+        config1 = config('<foo xmlns="urn:jon">1</foo>',
+                         address('A', 'B'), address('C', 'D'),
+                         address('E', 'F'), store('P'), store('Q'))
+        config2 = config('<foo xmlns="urn:jon">2</foo>',
+                         address('E', 'F'), address('A', 'B', 'y'),
+                         address('C', 'D'), address('G', 'H'),
+                         store('Q'), store('P'),
+                         '<tracking xmlns="urn:jon"><enabled-v2>true'
+                         '</enabled-v2></tracking>')
+        delta = ConfigDelta(config1, config2)
+        expected = [
+            ('/jon:address[first="G"][last="H"]', 'create', None, None,
+             'list'),
+            ('/jon:tracking', 'create', None, None, 'container'),
+            ('/jon:foo', 'modify', '1', '2', 'leaf'),
+            ('/jon:address[first="A"][last="B"]/street', 'modify', 'x', 'y',
+             'leaf'),
+            ('/jon:address[first="E"][last="F"]', 'move', 2, 0, 'list'),
+            ('/jon:store[text()="Q"]', 'move', 1, 0, 'leaf-list'),
+            ]
+        self.assertEqual(list(delta.changes()), expected)
+        records = list((-delta).changes(type=Tag.LXML_XPATH))
+        self.assertIn(('/jon:address[jon:first="G"][jon:last="H"]', 'delete',
+                       None, None, 'list'), records)
+        self.assertIn(('/jon:foo', 'modify', '2', '1', 'leaf'), records)
+        self.assertEqual(len(records), 6)
+        self.assertEqual(list(ConfigDelta(config1, config1).changes()), [])
+
+        # identityref values are compared regardless of prefixes
+        xml = self.d.extract_config(self.d.get_config(
+            models='openconfig-interfaces')).xml
+        config3 = Config(self.d, xml)
+        self.assertIn('oc-ni-types:', xml)
+        config4 = Config(self.d, xml.replace('oc-ni-types', 'x'))
+        self.assertEqual(list(ConfigDelta(config3, config4).changes()), [])
+
+        f = BytesIO()
+        size = delta.write_jsonl(f)
+        self.assertEqual(size, len(f.getvalue()))
+        lines = f.getvalue().decode('utf-8').splitlines()
+        self.assertEqual([tuple(json.loads(line).values()) for line in lines],
+                         expected)
+        self.assertEqual(list(json.loads(lines[0])),
+                         ['xpath', 'kind', 'old_value', 'new_value',
+                          'schema_type'])
+
+    def test_pair_children_1(self):
+        def config(entries, stores):
+            root = etree.Element('{' + nc_url + '}config',
+                                 nsmap={'nc': nc_url})
+            for first, last in entries:
+                address = etree.SubElement(root, '{urn:jon}address',
+                                           nsmap={None: 'urn:jon'})
+                if first is not None:
+                    etree.SubElement(address, '{urn:jon}first').text = first
+                if last is not None:
+                    etree.SubElement(address, '{urn:jon}last').text = last
+                etree.SubElement(address, '{urn:jon}street').text = 's'
+            for store in stores:
+                etree.SubElement(root, '{urn:jon}store',
+                                 nsmap={None: 'urn:jon'}).text = store
+            etree.SubElement(root, '{urn:jon}foo',
+                             nsmap={None: 'urn:jon'}).text = 'bar'
+            return root
+
+        def pairs(root1, root2):
+            calculator = BaseCalculator(self.d, root1, root2)
+            return [(None if one is None else root1.index(one),
+                     None if two is None else root2.index(two))
+                    for one, two in calculator._pair_children(root1, root2)]
+
+        entries = [('f{}'.format(i), 'l{}'.format(i % 3)) for i in range(50)]
+        root1 = config(entries[:30], ['A', 'B'])
+        root2 = config(entries[20:][::-1], ['B', 'C'])
+        expected = []
+        for index, entry in enumerate(entries[:30]):
+            if entry in entries[20:]:
+                expected.append((index, 49 - entries.index(entry)))
+            else:
+                expected.append((index, None))
+        expected += [(30, None), (31, 30), (32, 32)]
+        expected += [(None, 49 - entries.index(e)) for e in entries[30:]]
+        expected.append((None, 31))
+        self.assertEqual(sorted(pairs(root1, root2), key=str),
+                         sorted(expected, key=str))
+        self.assertEqual([p[0] for p in pairs(root1, root2)][:33],
+                         list(range(33)))
+
+        # an empty key value is still a key value
+        root1 = config([('f1', ''), ('f2', 'l2')], [])
+        root2 = config([('f2', 'l2'), ('f1', '')], [])
+        self.assertEqual(pairs(root1, root2), [(0, 1), (1, 0), (2, 2)])
+
+        # missing, repeated and duplicate keys are reported
+        root1 = config([('f1', 'l1'), ('f2', None)], [])
+        self.assertRaises(ConfigError, pairs, root1, root2)
+        root1 = config([('f1', 'l1'), ('f2', 'l2')], [])
+        etree.SubElement(root1[1], '{urn:jon}last').text = 'l3'
+        self.assertRaises(ConfigError, pairs, root1, root2)
+        root1 = config([('f1', None), ('f2', 'l2')], [])
+        etree.SubElement(root1[1], '{urn:jon}last').text = 'l3'
+        self.assertRaises(ConfigError, pairs, root1, root2)
+        root1 = config([('f1', 'l1'), ('f1', 'l1')], [])
+        self.assertRaises(ConfigError, pairs, root1, root2)
+
+    def test_verify_1(self):
+        def config(*nodes):
+            xml = """
+                <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                  {}
+                </config>
+                """.format(''.join(nodes))
+            return Config(self.d, xml)
+
+        def address(first, last, street='x'):
+            return '<address xmlns="urn:jon"><first>{}</first><last>{}' \
+                   '</last><street>{}</street></address>' \
+                   .format(first, last, street)
+
+        def store(value):
+            return '<store xmlns="urn:jon">{}</store>'.format(value)
+
+        tracking = '<tracking xmlns="urn:jon"><enabled-v2>true</enabled-v2>' \
+                   '<logging><local>true</local><server><host>h</host>' \
+                   '</server></logging></tracking>'
+        configs = [
+            config('<foo xmlns="urn:jon">1</foo>',
+                   address('A', 'B'), address('C', 'D'), address('E', 'F'),
+                   store('P'), store('Q'), tracking),
+            config('<foo xmlns="urn:jon">2</foo>',
+                   address('E', 'F'), address('A', 'B', 'y'),
+                   address('C', 'D'), address('G', 'H'),
+                   store('Q'), store('P'),
+                   '<tracking xmlns="urn:jon"><enabled-v2>true</enabled-v2>'
+                   '</tracking>'),
+            config(address('A', 'B')),
+            config(),
+            config(tracking.replace('<host>h', '<host>k'),
+                   '<location xmlns="urn:jon"><other-info><geo-facts>'
+                   '<code>XY</code></geo-facts></other-info></location>'),
+            ]
+        options = [{},
+                   {'preferred_create': 'create'},
+                   {'preferred_create': 'replace'},
+                   {'preferred_delete': 'remove'},
+                   {'preferred_replace': 'replace'},
+                   {'diff_type': 'replace'}]
+        results = set()
+        for config1 in configs:
+            for config2 in configs:
+                for kwargs in options:
+                    delta = ConfigDelta(config1, config2, **kwargs)
+                    expected = (config1 + delta) == config2
+                    self.assertEqual(delta.verify(), expected)
+                    results.add(expected)
+        self.assertEqual(results, {True, False})
+
+        running = self.d.extract_config(self.d.get_config(
+            models='openconfig-network-instance'))
+        modified = Config(self.d, running.xml)
+        modified.xpath('//oc-netinst:name[text()="DEFAULT"]')[-1].text = 'X'
+        self.assertTrue(ConfigDelta(running, modified).verify())
+        self.assertTrue(ConfigDelta(modified, running).verify())
+
+        # digests known already are used for untouched subtrees
+        digests = {}
+        running._node_digest(running.ele, None,
+                             lambda n, r, d: digests.__setitem__(n, d))
+        delta = ConfigDelta(running, modified)
+        self.assertTrue(delta.verify(dst_digest=modified.digest,
+                                     src_digests=digests))
+        self.assertFalse(delta.verify(dst_digest=running.digest,
+                                      src_digests=digests))
+        config1 = configs[0]
+        config2 = config(*[etree.tostring(c).decode() for c in config1.ele
+                           if c.tag != '{urn:jon}foo'])
+        delta = ConfigDelta(config1, config2)
+        digests = {config1.ele.find('{urn:jon}tracking'): b'\0' * 32}
+        self.assertTrue(delta.verify())
+        self.assertFalse(delta.verify(src_digests=digests))
+
+    def test_concurrent_diff_1(self):
+        device = ModelDevice(MySSHSession(), DefaultDeviceHandler())
+        device.scan_models(folder=path.join(curr_dir, 'yang'),
+                           download='ignore')
+        device.load_model('jon')
+        device.load_model('openconfig-interfaces')
+
+        def config(count, *nodes):
+            addresses = ''.join(
+                '<address xmlns="urn:jon"><first>f{}</first><last>l</last>'
+                '<street>s{}</street></address>'.format(i, i % 3)
+                for i in range(count))
+            return """
+                <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                  {}{}
+                </config>
+                """.format(addresses, ''.join(nodes))
+
+        xml1 = config(30, '<foo xmlns="urn:jon">1</foo>')
+        xml2 = config(25, '<tracking xmlns="urn:jon"><enabled-v2>true'
+                          '</enabled-v2></tracking>')
+
+        def diff(i):
+            delta = ConfigDelta(Config(device, xml1), Config(device, xml2))
+            return etree.tostring(delta.nc)
+
+        expected = diff(0)
+        model = device.models['jon']
+        element = model.tree.find('.//{urn:jon}first')
+        width = model.get_width(element)
+        model.width.clear()
+
+        # diffs with a cold lookup cache, while another model is reloaded
+        device.nodes.clear()
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                futures = [executor.submit(diff, i) for i in range(32)]
+                for i in range(3):
+                    device.load_model('openconfig-interfaces')
+                results = [f.result() for f in futures]
+                widths = list(executor.map(
+                    lambda i: model.get_width(element), range(8)))
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(results, [expected] * 32)
+        self.assertEqual(widths, [width] * 8)
+        self.assertIn('{urn:jon}address {urn:jon}first', device.nodes)
+        self.assertTrue(all(k.startswith('{urn:jon}') for k in device.nodes))
+
+    def test_model_diff_1(self):
+        filename = path.join(curr_dir, 'yang', 'jon.xml')
+        tree = read_xml(filename)
+        foo = tree.find('{urn:jon}foo')
+        foo.set('datatype', 'uint8')
+        tracking = tree.find('{urn:jon}tracking')
+        tracking.remove(tracking.find('{urn:jon}enabled'))
+        etree.SubElement(tracking, '{urn:jon}mode', type='leaf',
+                         access='read-write', datatype='string')
+        model1 = Model(read_xml(filename))
+        model2 = Model(deepcopy(tree))
+        diff = ModelDiff(model1, model2)
+        self.assertTrue(diff)
+        self.assertEqual(diff.tree.find('{urn:jon}foo').get('diff'),
+                         'modified')
+        changes = diff.tree.find('{urn:jon}tracking')
+        self.assertEqual(changes.find('{urn:jon}enabled').get('diff'),
+                         'deleted')
+        self.assertEqual(changes.find('{urn:jon}mode').get('diff'), 'added')
+        self.assertEqual(len(diff.tree), 2)
+
+        # digests give the same result as node_equal()
+        expected = etree.Element(model1.tree.tag)
+        ModelDiff.compare_nodes(model1.tree, model2.tree, expected)
+        self.assertEqual(etree.tostring(diff.tree), etree.tostring(expected))
+        self.assertFalse(ModelDiff(model1, Model(read_xml(filename))))
+        self.assertNotEqual(model1.digests[model1.tree.find('{urn:jon}foo')],
+                            model2.digests[model2.tree.find('{urn:jon}foo')])
+
+        with tempfile.TemporaryDirectory() as folder:
+            for revision, module in [('r1', read_xml(filename)),
+                                     ('r2', tree), ('r3', tree)]:
+                makedirs(path.join(folder, revision))
+                write_xml(path.join(folder, revision, 'jon.xml'), module)
+            write_xml(path.join(folder, 'r1', 'dependencies.xml'),
+                      etree.Element('modules'))
+            results = ModelDiff.diff_revisions(folder, max_workers=2)
+            self.assertEqual(list(results), ['jon'])
+            self.assertEqual([r[:2] for r in results['jon']],
+                             [('r1', 'r2'), ('r2', 'r3')])
+            diff12 = results['jon'][0][2]
+            self.assertEqual(str(diff12), str(diff))
+            self.assertEqual(diff12.added, diff.added)
+            self.assertFalse(results['jon'][1][2])
+            self.assertEqual(diff12.model2.roots, model2.roots)
+
+            results = ModelDiff.diff_revisions(folder, revisions=['r3', 'r1'],
+                                               modules=['jon'])
+            self.assertEqual(str(results['jon'][0][2]),
+                             str(ModelDiff(model2, model1)))
+
+    def test_schema_node_cache_1(self):
+        cache = SchemaNodeCache(maxsize=3)
+        jon = cache.partition('{urn:jon}address')
+        self.assertIs(cache.partition('{urn:jon}address'), jon)
+        cache.set('{urn:jon}address', 'a', jon)
+        cache.set('{urn:jon}address {urn:jon}first', 'f', jon)
+        cache.set('{urn:jon}address {urn:jon}last', 'l', jon)
+        self.assertEqual(cache.get('{urn:jon}address'), 'a')
+        self.assertIsNone(cache.get('{urn:jon}foo'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # the entry just used gets a second chance
+        oc = cache.partition('{http://openconfig.net/yang/interfaces}'
+                             'interfaces')
+        cache.set('{http://openconfig.net/yang/interfaces}interfaces', 'i',
+                  oc)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIn('{urn:jon}address', cache)
+        self.assertNotIn('{urn:jon}address {urn:jon}first', cache)
+        self.assertEqual(cache.partitions,
+                         {'{urn:jon}address': 2,
+                          '{http://openconfig.net/yang/interfaces}'
+                          'interfaces': 1})
+
+        # invalidation is per root, and a stale partition caches nothing
+        self.assertEqual(cache.invalidate(['{urn:jon}address',
+                                           '{urn:jon}foo']), 2)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(cache.get('{urn:jon}address'))
+        self.assertEqual(list(cache),
+                         ['{http://openconfig.net/yang/interfaces}'
+                          'interfaces'])
+        cache.set('{urn:jon}address', 'a', jon)
+        self.assertNotIn('{urn:jon}address', cache)
+        cache.set('{urn:jon}address', 'a',
+                  cache.partition('{urn:jon}address'))
+        self.assertIn('{urn:jon}address', cache)
+        self.assertEqual(cache.invalidations, 2)
+
+        # stale entries are dropped when they are found, and the cache is
+        # compacted once more than half of its entries are stale
+        self.assertEqual(cache.stale, 0)
+        ni = cache.partition('{http://openconfig.net/yang/'
+                             'network-instance}network-instances')
+        cache.set('{http://openconfig.net/yang/network-instance}'
+                  'network-instances', 'n', ni)
+        self.assertEqual(cache.invalidate(['{urn:jon}address']), 1)
+        self.assertEqual(cache.stale, 1)
+        self.assertIsNone(cache.get('{urn:jon}address'))
+        self.assertEqual(cache.stale, 0)
+        self.assertEqual(len(cache._nodes), 2)
+        self.assertEqual(cache.invalidate(['{http://openconfig.net/yang/'
+                                           'interfaces}interfaces']), 1)
+        self.assertEqual(cache.stale, 1)
+        self.assertEqual(len(cache._nodes), 2)
+        self.assertEqual(cache.invalidate(['{http://openconfig.net/yang/'
+                                           'network-instance}'
+                                           'network-instances']), 1)
+        self.assertEqual((cache.stale, len(cache._nodes)), (0, 0))
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.evictions), (0, 0, 0))
+        self.assertRaises(ValueError, SchemaNodeCache, maxsize=0)
+
+        # reloading a model invalidates only its own entries
+        device = ModelDevice(MySSHSession(), DefaultDeviceHandler())
+        device.scan_models(folder=path.join(curr_dir, 'yang'),
+                           download='ignore')
+        device.load_model('jon')
+        device.load_model('openconfig-interfaces')
+        device.load_model('openconfig-network-instance')
+        xml = """
+            <config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+              <address xmlns="urn:jon">
+                <first>Tom</first>
+                <last>Wang</last>
+                <street>x</street>
+              </address>
+              <foo xmlns="urn:jon">bar</foo>
+            </config>
+            """
+        Config(device, xml)
+        Config(device, self.d.get_config(models='openconfig-interfaces'))
+        jon = [k for k in device.nodes if k.startswith('{urn:jon}')]
+        self.assertTrue(jon)
+        size = len(device.nodes)
+        device.load_model('jon')
+        self.assertEqual(device.nodes.invalidations, len(jon))
+        self.assertEqual(len(device.nodes), size - len(jon))
+        self.assertFalse(any(k in device.nodes for k in jon))
+        node = Config(device, xml).ele.find('{urn:jon}address')
+        self.assertIs(device.get_schema_node(node),
+                      device.models['jon'].tree.find('{urn:jon}address'))
+        with self.assertRaises(TypeError):
+            device.nodes = {}